@@ -0,0 +1,119 @@
+"""Per-update cost of the C51 categorical projection: per-row loop versus the batched
+`cleanrl_utils.projection` / `cleanrl_utils.projection_jax` implementations.
+
+Usage:
+    python benchmark/c51_projection.py --batch-sizes 32 64 128 256 512
+"""
+
+import argparse
+import time
+from distutils.util import strtobool
+
+import numpy as np
+import torch
+
+from cleanrl_utils.projection import categorical_projection
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[32, 64, 128, 256, 512],
+        help="the batch sizes to benchmark")
+    parser.add_argument("--n-atoms", type=int, default=101,
+        help="the number of atoms")
+    parser.add_argument("--num-iterations", type=int, default=200,
+        help="the number of projections to time")
+    parser.add_argument("--cuda", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
+        help="if toggled, cuda will be enabled by default")
+    parser.add_argument("--jax", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
+        help="if toggled, the JAX implementations are benchmarked as well")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+def loop_projection(next_atoms, next_pmfs, atoms):
+    n_atoms = atoms.shape[0]
+    delta_z = atoms[1] - atoms[0]
+    tz = next_atoms.clamp(atoms[0], atoms[-1])
+    b = (tz - atoms[0]) / delta_z
+    l = b.floor().clamp(0, n_atoms - 1)
+    u = b.ceil().clamp(0, n_atoms - 1)
+    d_m_l = (u + (l == u).float() - b) * next_pmfs
+    d_m_u = (b - l) * next_pmfs
+    target_pmfs = torch.zeros_like(next_pmfs)
+    for i in range(target_pmfs.size(0)):
+        target_pmfs[i].index_add_(0, l[i].long(), d_m_l[i])
+        target_pmfs[i].index_add_(0, u[i].long(), d_m_u[i])
+    return target_pmfs
+
+
+def timeit(fn, num_iterations, synchronize):
+    synchronize(fn())
+    start_time = time.perf_counter()
+    for _ in range(num_iterations):
+        result = fn()
+    synchronize(result)
+    return 1000 * (time.perf_counter() - start_time) / num_iterations
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
+    torch_synchronize = (lambda *_: torch.cuda.synchronize()) if device.type == "cuda" else (lambda *_: None)
+    atoms = torch.linspace(-10, 10, steps=args.n_atoms, device=device)
+    if args.jax:
+        import jax
+        import jax.numpy as jnp
+
+        from cleanrl_utils.projection_jax import (
+            categorical_projection as jax_categorical_projection,
+        )
+
+        jax_atoms = jnp.asarray(np.linspace(-10, 10, num=args.n_atoms))
+
+        @jax.jit
+        def jax_loop_projection(next_atoms, next_pmfs):
+            delta_z = jax_atoms[1] - jax_atoms[0]
+            b = (jnp.clip(next_atoms, -10, 10) + 10) / delta_z
+            l = jnp.clip(jnp.floor(b), 0, args.n_atoms - 1)
+            u = jnp.clip(jnp.ceil(b), 0, args.n_atoms - 1)
+            d_m_l = (u + (l == u).astype(jnp.float32) - b) * next_pmfs
+            d_m_u = (b - l) * next_pmfs
+
+            def project_to_bins(i, val):
+                val = val.at[i, l[i].astype(jnp.int32)].add(d_m_l[i])
+                val = val.at[i, u[i].astype(jnp.int32)].add(d_m_u[i])
+                return val
+
+            return jax.lax.fori_loop(0, next_pmfs.shape[0], project_to_bins, jnp.zeros_like(next_pmfs))
+
+        jax_batched_projection = jax.jit(jax_categorical_projection)
+
+    print(
+        "| batch size | torch loop (ms) | torch batched (ms) | speedup |"
+        + (" jax loop (ms) | jax batched (ms) | speedup |" if args.jax else "")
+    )
+    for batch_size in args.batch_sizes:
+        rewards = torch.randn(batch_size, 1, device=device)
+        dones = (torch.rand(batch_size, 1, device=device) < 0.1).float()
+        next_pmfs = torch.softmax(torch.randn(batch_size, args.n_atoms, device=device), dim=1)
+        next_atoms = rewards + 0.99 * atoms * (1 - dones)
+        loop_ms = timeit(lambda: loop_projection(next_atoms, next_pmfs, atoms), args.num_iterations, torch_synchronize)
+        batched_ms = timeit(
+            lambda: categorical_projection(next_atoms, next_pmfs, atoms), args.num_iterations, torch_synchronize
+        )
+        row = f"| {batch_size} | {loop_ms:.3f} | {batched_ms:.3f} | {loop_ms / batched_ms:.1f}x |"
+        if args.jax:
+            jax_next_atoms, jax_next_pmfs = jnp.asarray(next_atoms.cpu().numpy()), jnp.asarray(next_pmfs.cpu().numpy())
+            jax_loop_ms = timeit(
+                lambda: jax_loop_projection(jax_next_atoms, jax_next_pmfs), args.num_iterations, jax.block_until_ready
+            )
+            jax_batched_ms = timeit(
+                lambda: jax_batched_projection(jax_next_atoms, jax_next_pmfs, jax_atoms),
+                args.num_iterations,
+                jax.block_until_ready,
+            )
+            row += f" {jax_loop_ms:.3f} | {jax_batched_ms:.3f} | {jax_loop_ms / jax_batched_ms:.1f}x |"
+        print(row)
@@ -0,0 +1,69 @@
+"""Memory and sampling throughput of `FrameStackReplayBuffer` against `ReplayBuffer` on Atari-shaped data.
+
+Usage:
+    python benchmark/frame_stack_replay_buffer.py --buffer-size 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from gym import spaces
+
+from cleanrl_utils.buffers import FrameStackReplayBuffer, ReplayBuffer
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buffer-size", type=int, default=100_000,
+        help="the replay memory buffer size")
+    parser.add_argument("--batch-size", type=int, default=32,
+        help="the batch size of sample from the replay memory")
+    parser.add_argument("--num-iterations", type=int, default=2000,
+        help="the number of sampled batches to time")
+    parser.add_argument("--episode-length", type=int, default=200,
+        help="the length of the synthetic episodes")
+    parser.add_argument("--seed", type=int, default=1,
+        help="seed of the experiment")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+def buffer_nbytes(rb):
+    return sum(v.nbytes for v in vars(rb).values() if isinstance(v, np.ndarray))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    np.random.seed(args.seed)
+    observation_space = spaces.Box(0, 255, (4, 84, 84), np.uint8)
+    action_space = spaces.Discrete(4)
+    buffers = {
+        "ReplayBuffer(optimize_memory_usage=True)": ReplayBuffer(
+            args.buffer_size, observation_space, action_space, "cpu", optimize_memory_usage=True
+        ),
+        "FrameStackReplayBuffer": FrameStackReplayBuffer(args.buffer_size, observation_space, action_space, "cpu"),
+    }
+
+    frames = np.random.randint(0, 256, size=(1024, 84, 84), dtype=np.uint8)
+    for name, rb in buffers.items():
+        start_time = time.time()
+        obs = np.stack([frames[0]] * 4)
+        for step in range(args.buffer_size):
+            next_obs = np.concatenate([obs[1:], frames[step % len(frames)][None]])
+            done = (step + 1) % args.episode_length == 0
+            rb.add(obs[None], next_obs[None], np.array([[0]]), np.array([0.0]), np.array([done]))
+            obs = np.stack([next_obs[-1]] * 4) if done else next_obs
+        fill_time = time.time() - start_time
+
+        start_time = time.time()
+        for _ in range(args.num_iterations):
+            rb.sample(args.batch_size)
+        elapsed = time.time() - start_time
+        nbytes = buffer_nbytes(rb)
+        print(f"{name}:")
+        print(f"  memory: {nbytes / 1e9:.3f}GB ({nbytes / args.buffer_size:.0f} bytes per transition)")
+        print(f"  add: {args.buffer_size / fill_time:.0f} transitions/s")
+        print(f"  sample: {args.num_iterations * args.batch_size / elapsed:.0f} transitions/s")
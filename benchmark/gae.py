@@ -0,0 +1,81 @@
+"""Per-update cost of GAE: the Python loop of the PPO scripts versus the TorchScript and NumPy
+backends of `cleanrl_utils.gae.compute_gae`.
+
+Usage:
+    python benchmark/gae.py --num-steps 128 256 1024 --num-envs 8
+"""
+
+import argparse
+import time
+from distutils.util import strtobool
+
+import torch
+
+from cleanrl_utils.gae import compute_gae
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-steps", nargs="+", type=int, default=[128, 256, 1024],
+        help="the rollout lengths to benchmark")
+    parser.add_argument("--num-envs", type=int, default=8,
+        help="the number of parallel game environments")
+    parser.add_argument("--num-iterations", type=int, default=50,
+        help="the number of GAE computations to time")
+    parser.add_argument("--cuda", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
+        help="if toggled, cuda will be enabled by default")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+def loop_gae(rewards, values, dones, next_value, next_done, gamma=0.99, gae_lambda=0.95):
+    num_steps = rewards.shape[0]
+    advantages = torch.zeros_like(rewards)
+    lastgaelam = 0
+    for t in reversed(range(num_steps)):
+        if t == num_steps - 1:
+            nextnonterminal = 1.0 - next_done
+            nextvalues = next_value
+        else:
+            nextnonterminal = 1.0 - dones[t + 1]
+            nextvalues = values[t + 1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        advantages[t] = lastgaelam = delta + gamma * gae_lambda * nextnonterminal * lastgaelam
+    return advantages, advantages + values
+
+
+def timeit(fn, num_iterations, synchronize):
+    fn()
+    synchronize()
+    start_time = time.perf_counter()
+    for _ in range(num_iterations):
+        fn()
+    synchronize()
+    return 1000 * (time.perf_counter() - start_time) / num_iterations
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
+    synchronize = torch.cuda.synchronize if device.type == "cuda" else (lambda: None)
+
+    print(f"device: {device}, num_envs: {args.num_envs}")
+    print("| num steps | python loop (ms) | torchscript (ms) | speedup | numpy (ms) | speedup |")
+    for num_steps in args.num_steps:
+        rollout = (
+            torch.rand((num_steps, args.num_envs), device=device),
+            torch.rand((num_steps, args.num_envs), device=device),
+            (torch.rand((num_steps, args.num_envs), device=device) < 0.05).float(),
+            torch.rand((1, args.num_envs), device=device),
+            torch.zeros(args.num_envs, device=device),
+        )
+        numpy_rollout = [x.cpu().numpy() for x in rollout]
+        loop_ms = timeit(lambda: loop_gae(*rollout), args.num_iterations, synchronize)
+        torch_ms = timeit(lambda: compute_gae(*rollout, 0.99, 0.95), args.num_iterations, synchronize)
+        numpy_ms = timeit(lambda: compute_gae(*numpy_rollout, 0.99, 0.95), args.num_iterations, lambda: None)
+        print(
+            f"| {num_steps} | {loop_ms:.3f} | {torch_ms:.3f} | {loop_ms / torch_ms:.1f}x "
+            f"| {numpy_ms:.3f} | {loop_ms / numpy_ms:.1f}x |"
+        )
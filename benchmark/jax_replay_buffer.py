@@ -0,0 +1,115 @@
+"""Insert-sample-update throughput of a DQN-style learner with a host replay buffer
+versus the on-device `cleanrl_utils.buffers_jax.ReplayBufferState`.
+
+Usage:
+    python benchmark/jax_replay_buffer.py --num-iterations 2000
+"""
+
+import argparse
+import time
+from functools import partial
+
+import flax.linen as nn
+import gymnasium as gym
+import jax
+import jax.numpy as jnp
+import numpy as np
+import optax
+from flax.training.train_state import TrainState
+
+from cleanrl_utils.buffers_jax import ReplayBufferState
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buffer-size", type=int, default=10000,
+        help="the replay memory buffer size")
+    parser.add_argument("--batch-size", type=int, default=128,
+        help="the batch size of sample from the replay memory")
+    parser.add_argument("--num-iterations", type=int, default=2000,
+        help="the number of insert-sample-update iterations to time")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+class QNetwork(nn.Module):
+    action_dim: int
+
+    @nn.compact
+    def __call__(self, x: jnp.ndarray):
+        x = nn.relu(nn.Dense(120)(x))
+        x = nn.relu(nn.Dense(84)(x))
+        return nn.Dense(self.action_dim)(x)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    observation_space = gym.spaces.Box(-np.inf, np.inf, (4,), np.float32)
+    action_space = gym.spaces.Discrete(2)
+    q_network = QNetwork(action_dim=2)
+    q_state = TrainState.create(
+        apply_fn=q_network.apply,
+        params=q_network.init(jax.random.PRNGKey(0), np.zeros((1, 4), np.float32)),
+        tx=optax.adam(learning_rate=2.5e-4),
+    )
+
+    def update(q_state, observations, actions, next_observations, rewards, dones):
+        q_next_target = jnp.max(q_network.apply(q_state.params, next_observations), axis=-1)
+        next_q_value = rewards + (1 - dones) * 0.99 * q_next_target
+
+        def mse_loss(params):
+            q_pred = q_network.apply(params, observations)
+            q_pred = q_pred[jnp.arange(q_pred.shape[0]), actions.squeeze()]
+            return ((q_pred - next_q_value) ** 2).mean()
+
+        loss_value, grads = jax.value_and_grad(mse_loss)(q_state.params)
+        return q_state.apply_gradients(grads=grads), loss_value
+
+    transitions = [np.random.randn(args.num_iterations, 1, 4).astype(np.float32) for _ in range(2)]
+    actions = np.random.randint(0, 2, size=(args.num_iterations, 1))
+    rewards = np.random.randn(args.num_iterations, 1).astype(np.float32)
+    dones = np.zeros((args.num_iterations, 1), np.float32)
+
+    # host buffer: numpy sampling and a host-to-device transfer before every jitted update
+    jit_update = jax.jit(update)
+    host_obs = np.zeros((args.buffer_size, 4), np.float32)
+    host_next_obs, host_actions = np.zeros_like(host_obs), np.zeros((args.buffer_size, 1), np.int64)
+    host_rewards, host_dones = np.zeros(args.buffer_size, np.float32), np.zeros(args.buffer_size, np.float32)
+    jax.block_until_ready(
+        jit_update(q_state, *(x[: args.batch_size] for x in (host_obs, host_actions, host_next_obs, host_rewards, host_dones)))
+    )
+    start_time = time.time()
+    for i in range(args.num_iterations):
+        pos = i % args.buffer_size
+        host_obs[pos], host_next_obs[pos], host_actions[pos] = transitions[0][i], transitions[1][i], actions[i]
+        host_rewards[pos], host_dones[pos] = rewards[i, 0], dones[i, 0]
+        inds = np.random.randint(0, min(i + 1, args.buffer_size), size=args.batch_size)
+        q_state, loss = jit_update(
+            q_state, host_obs[inds], host_actions[inds], host_next_obs[inds], host_rewards[inds], host_dones[inds]
+        )
+    jax.block_until_ready(loss)
+    print(f"host buffer: {args.num_iterations / (time.time() - start_time):.0f} updates/s")
+
+    # device buffer: the whole insert-sample-update cycle compiled with `lax.scan`
+    def step(carry, transition):
+        rb, q_state, key = carry
+        key, sample_key = jax.random.split(key)
+        rb = rb.add(*transition)
+        data = rb.sample(sample_key, args.batch_size)
+        q_state, loss = update(q_state, data.observations, data.actions, data.next_observations, data.rewards, data.dones)
+        return (rb, q_state, key), loss
+
+    def make_carry():
+        # the carry is donated, so every call gets fresh buffers
+        rb = ReplayBufferState.create(args.buffer_size, observation_space, action_space)
+        return rb, jax.tree_util.tree_map(jnp.copy, q_state), jax.random.PRNGKey(1)
+
+    run = jax.jit(partial(jax.lax.scan, step), donate_argnums=(0,))
+    xs = tuple(jnp.asarray(x) for x in (transitions[0], transitions[1], actions, rewards, dones))
+    jax.block_until_ready(run(make_carry(), xs))  # compile
+    carry = make_carry()
+    start_time = time.time()
+    jax.block_until_ready(run(carry, xs))
+    print(f"device buffer: {args.num_iterations / (time.time() - start_time):.0f} updates/s")
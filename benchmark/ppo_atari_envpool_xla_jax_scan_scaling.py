@@ -0,0 +1,66 @@
+"""SPS of `ppo_atari_envpool_xla_jax_scan.py` as the environments and the update are sharded across
+1, 2, 4, ... N devices (`--num-devices`), with a fixed number of environments per device.
+
+On a CPU-only machine the devices are emulated with `XLA_FLAGS=--xla_force_host_platform_device_count=N`.
+
+Usage:
+    python benchmark/ppo_atari_envpool_xla_jax_scan_scaling.py --max-devices 8 --envs-per-device 8
+"""
+
+import argparse
+import os
+import re
+import subprocess
+from distutils.util import strtobool
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env-id", type=str, default="Pong-v5",
+        help="the id of the environment")
+    parser.add_argument("--max-devices", type=int, default=8,
+        help="the largest number of devices to benchmark")
+    parser.add_argument("--envs-per-device", type=int, default=8,
+        help="the number of parallel game environments per device")
+    parser.add_argument("--num-steps", type=int, default=128,
+        help="the number of steps to run in each environment per policy rollout")
+    parser.add_argument("--num-updates", type=int, default=10,
+        help="the number of updates to run for each device count")
+    parser.add_argument("--cpu", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
+        help="if toggled, the devices are emulated on the host CPU")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    num_devices = 1
+    print("| devices | num envs | SPS | scaling |")
+    base_sps = None
+    while num_devices <= args.max_devices:
+        num_envs = num_devices * args.envs_per_device
+        env = dict(os.environ)
+        if args.cpu:
+            env["XLA_FLAGS"] = f"{env.get('XLA_FLAGS', '')} --xla_force_host_platform_device_count={num_devices}"
+            env["JAX_PLATFORMS"] = "cpu"
+        output = subprocess.run(
+            [
+                "python",
+                "cleanrl/ppo_atari_envpool_xla_jax_scan.py",
+                f"--env-id={args.env_id}",
+                f"--num-devices={num_devices}",
+                f"--num-envs={num_envs}",
+                f"--num-steps={args.num_steps}",
+                f"--total-timesteps={num_envs * args.num_steps * args.num_updates}",
+            ],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        sps = int(re.findall(r"SPS: (\d+)", output)[-1])
+        base_sps = base_sps or sps
+        print(f"| {num_devices} | {num_envs} | {sps} | {sps / base_sps:.2f}x |")
+        num_devices *= 2
@@ -0,0 +1,90 @@
+"""Update-phase cost of `ppo_atari_lstm.py`: the per-timestep LSTM loop versus the packed-sequence
+`Agent.get_states` on one minibatch (forward and backward).
+
+Usage:
+    python benchmark/ppo_atari_lstm.py --num-steps 128 --envs-per-batch 2 --done-prob 0.01
+"""
+
+import argparse
+import time
+from distutils.util import strtobool
+
+import gym
+import torch
+
+from cleanrl.ppo_atari_lstm import Agent
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-steps", type=int, default=128,
+        help="the number of steps to run in each environment per policy rollout")
+    parser.add_argument("--envs-per-batch", type=int, default=2,
+        help="the number of environments per minibatch (`num_envs // num_minibatches`)")
+    parser.add_argument("--done-prob", type=float, default=0.01,
+        help="the probability of an episode boundary at each step")
+    parser.add_argument("--num-iterations", type=int, default=20,
+        help="the number of minibatch updates to time")
+    parser.add_argument("--cuda", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
+        help="if toggled, cuda will be enabled by default")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+class Envs:
+    single_action_space = gym.spaces.Discrete(4)
+
+
+def get_states_loop(agent, x, lstm_state, done):
+    hidden = agent.network(x / 255.0)
+    batch_size = lstm_state[0].shape[1]
+    hidden = hidden.reshape((-1, batch_size, agent.lstm.input_size))
+    done = done.reshape((-1, batch_size))
+    new_hidden = []
+    for h, d in zip(hidden, done):
+        h, lstm_state = agent.lstm(
+            h.unsqueeze(0),
+            (
+                (1.0 - d).view(1, -1, 1) * lstm_state[0],
+                (1.0 - d).view(1, -1, 1) * lstm_state[1],
+            ),
+        )
+        new_hidden += [h]
+    new_hidden = torch.flatten(torch.cat(new_hidden), 0, 1)
+    return new_hidden, lstm_state
+
+
+def timeit(get_states, agent, x, lstm_state, done, num_iterations, synchronize):
+    def update():
+        hidden, _ = get_states(agent, x, lstm_state, done)
+        agent.zero_grad()
+        agent.critic(hidden).mean().backward()
+
+    update()
+    synchronize()
+    start_time = time.perf_counter()
+    for _ in range(num_iterations):
+        update()
+    synchronize()
+    return 1000 * (time.perf_counter() - start_time) / num_iterations
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
+    synchronize = torch.cuda.synchronize if device.type == "cuda" else (lambda: None)
+    agent = Agent(Envs()).to(device)
+    x = torch.randint(0, 256, (args.num_steps * args.envs_per_batch, 1, 84, 84), dtype=torch.uint8, device=device)
+    lstm_state = (
+        torch.zeros(1, args.envs_per_batch, 128, device=device),
+        torch.zeros(1, args.envs_per_batch, 128, device=device),
+    )
+    done = (torch.rand(args.num_steps * args.envs_per_batch, device=device) < args.done_prob).float()
+
+    loop_ms = timeit(get_states_loop, agent, x, lstm_state, done, args.num_iterations, synchronize)
+    packed_ms = timeit(Agent.get_states, agent, x, lstm_state, done, args.num_iterations, synchronize)
+    print(f"device: {device}, num_steps: {args.num_steps}, envs per batch: {args.envs_per_batch}")
+    print("| per-timestep loop (ms) | packed sequences (ms) | speedup |")
+    print(f"| {loop_ms:.3f} | {packed_ms:.3f} | {loop_ms / packed_ms:.1f}x |")
@@ -0,0 +1,90 @@
+"""Peak device memory and time per update of the `update_ppo` of `ppo_atari_envpool_xla_jax_scan.py`
+on synthetic storage, when every epoch shuffles a full copy of the storage (`--gather-minibatches False`)
+versus when it shuffles an index vector and gathers each minibatch inside the minibatch scan
+(`--gather-minibatches True`).
+
+The memory is the temporary buffer size XLA reports for the compiled update. Every argument but
+`--num-iterations` is passed to the `parse_args` of the script, e.g. `--num-envs` or `--num-minibatches`.
+
+Usage:
+    python benchmark/ppo_update_gather.py --num-envs 8 --num-steps 128 --num-minibatches 4
+"""
+
+import argparse
+import sys
+import time
+
+import flax
+import jax
+import jax.numpy as jnp
+import numpy as np
+import optax
+from flax.training.train_state import TrainState
+
+from cleanrl.ppo_atari_envpool_xla_jax_scan import (
+    Actor,
+    AgentParams,
+    Critic,
+    Network,
+    Storage,
+    make_update_ppo,
+    parse_args,
+)
+
+NUM_ACTIONS = 6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-iterations", type=int, default=10, help="the number of updates to time")
+    args, script_argv = parser.parse_known_args()
+    sys.argv = sys.argv[:1] + script_argv
+    script_args = parse_args()
+
+    devices = jax.local_devices()[:1]
+    key = jax.random.PRNGKey(script_args.seed)
+    key, network_key, actor_key, critic_key, storage_key = jax.random.split(key, 5)
+    network, actor, critic = Network(), Actor(action_dim=NUM_ACTIONS), Critic()
+    obs = jax.random.randint(storage_key, (script_args.num_steps, script_args.num_envs, 4, 84, 84), 0, 256).astype(jnp.uint8)
+    network_params = network.init(network_key, obs[0])
+    agent_state = TrainState.create(
+        apply_fn=None,
+        params=AgentParams(
+            network_params,
+            actor.init(actor_key, network.apply(network_params, obs[0])),
+            critic.init(critic_key, network.apply(network_params, obs[0])),
+        ),
+        tx=optax.chain(
+            optax.clip_by_global_norm(script_args.max_grad_norm),
+            optax.inject_hyperparams(optax.adam)(learning_rate=script_args.learning_rate, eps=1e-5),
+        ),
+    )
+    shape = (script_args.num_steps, script_args.num_envs)
+    storage = Storage(
+        obs=obs,
+        actions=jax.random.randint(storage_key, shape, 0, NUM_ACTIONS),
+        logprobs=jnp.full(shape, -np.log(NUM_ACTIONS)),
+        dones=jnp.zeros(shape, dtype=jnp.bool_),
+        values=jnp.zeros(shape),
+        advantages=jax.random.normal(storage_key, shape),
+        returns=jax.random.normal(storage_key, shape),
+        rewards=jnp.zeros(shape),
+    )
+    agent_state, storage, key = flax.jax_utils.replicate((agent_state, storage, key), devices)
+
+    print(f"device: {devices[0]}, storage: {shape[0]}x{shape[1]}, minibatches: {script_args.num_minibatches}")
+    print("| gather minibatches | temp memory (MB) | time per update (ms) |")
+    for gather_minibatches in [False, True]:
+        script_args.gather_minibatches = gather_minibatches
+        update = jax.pmap(make_update_ppo(script_args, network, actor, critic), axis_name="devices", devices=devices)
+        compiled = update.lower(agent_state, storage, key).compile()
+        memory_analysis = compiled.memory_analysis()
+        temp_mb = memory_analysis.temp_size_in_bytes / 2**20 if memory_analysis is not None else float("nan")
+        state, loss, _, _, _, _, k = update(agent_state, storage, key)
+        jax.block_until_ready(loss)
+        start_time = time.perf_counter()
+        for _ in range(args.num_iterations):
+            state, loss, _, _, _, _, k = update(state, storage, k)
+        jax.block_until_ready(loss)
+        update_ms = 1000 * (time.perf_counter() - start_time) / args.num_iterations
+        print(f"| {gather_minibatches} | {temp_mb:.1f} | {update_ms:.1f} |")
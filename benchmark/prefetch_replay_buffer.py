@@ -0,0 +1,81 @@
+"""Learner-loop throughput with and without `PrefetchReplayBuffer` on Atari-shaped data.
+
+Usage:
+    python benchmark/prefetch_replay_buffer.py --cuda True
+"""
+
+import argparse
+import time
+from distutils.util import strtobool
+
+import numpy as np
+import torch
+import torch.nn as nn
+from gym import spaces
+
+from cleanrl_utils.buffers import PrefetchReplayBuffer, ReplayBuffer
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buffer-size", type=int, default=50_000,
+        help="the replay memory buffer size")
+    parser.add_argument("--batch-size", type=int, default=32,
+        help="the batch size of sample from the replay memory")
+    parser.add_argument("--num-iterations", type=int, default=500,
+        help="the number of learner steps to time")
+    parser.add_argument("--prefetch", type=int, default=2,
+        help="the number of batches prefetched by the worker thread")
+    parser.add_argument("--cuda", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
+        help="if toggled, cuda will be enabled by default")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
+    observation_space = spaces.Box(0, 255, (4, 84, 84), np.uint8)
+    rb = ReplayBuffer(args.buffer_size, observation_space, spaces.Discrete(4), device, optimize_memory_usage=True)
+    rb.observations[:] = np.random.randint(0, 256, size=rb.observations.shape, dtype=np.uint8)
+    rb.full = True
+
+    network = nn.Sequential(
+        nn.Conv2d(4, 32, 8, stride=4),
+        nn.ReLU(),
+        nn.Conv2d(32, 64, 4, stride=2),
+        nn.ReLU(),
+        nn.Conv2d(64, 64, 3, stride=1),
+        nn.ReLU(),
+        nn.Flatten(),
+        nn.Linear(3136, 512),
+        nn.ReLU(),
+        nn.Linear(512, 4),
+    ).to(device)
+    optimizer = torch.optim.Adam(network.parameters(), lr=1e-4)
+
+    def learner_step(data):
+        loss = network(data.observations / 255.0).mean() - network(data.next_observations / 255.0).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    for name, sampler in [
+        ("ReplayBuffer", rb),
+        ("PrefetchReplayBuffer", PrefetchReplayBuffer(rb, args.batch_size, args.prefetch)),
+    ]:
+        learner_step(sampler.sample(args.batch_size))
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start_time = time.time()
+        for _ in range(args.num_iterations):
+            learner_step(sampler.sample(args.batch_size))
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        elapsed = time.time() - start_time
+        print(f"{name}: {args.num_iterations / elapsed:.1f} learner steps/s")
+        if isinstance(sampler, PrefetchReplayBuffer):
+            print(f"  stats: {sampler.stats()}")
+            sampler.close()
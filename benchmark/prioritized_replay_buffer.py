@@ -0,0 +1,55 @@
+"""Microbenchmark for `cleanrl_utils.buffers.PrioritizedReplayBuffer` sampling throughput.
+
+Usage:
+    python benchmark/prioritized_replay_buffer.py --buffer-size 1000000 --batch-size 32
+"""
+
+import argparse
+import time
+
+import numpy as np
+from gym import spaces
+
+from cleanrl_utils.buffers import PrioritizedReplayBuffer
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buffer-size", type=int, default=1_000_000,
+        help="the replay memory buffer size")
+    parser.add_argument("--batch-size", type=int, default=32,
+        help="the batch size of sample from the replay memory")
+    parser.add_argument("--num-iterations", type=int, default=1000,
+        help="the number of sample/update_weights iterations to time")
+    parser.add_argument("--alpha", type=float, default=0.6,
+        help="the prioritization exponent")
+    parser.add_argument("--beta", type=float, default=0.4,
+        help="the importance sampling exponent")
+    parser.add_argument("--seed", type=int, default=1,
+        help="seed of the experiment")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    np.random.seed(args.seed)
+    observation_space = spaces.Box(-1.0, 1.0, (4,), np.float32)
+    action_space = spaces.Discrete(2)
+    rb = PrioritizedReplayBuffer(args.buffer_size, args.alpha, observation_space, action_space, "cpu")
+
+    # fill the buffer in bulk: only the priorities matter for sampling cost
+    start_time = time.time()
+    rb.pos, rb.full = 0, True
+    rb.update_weights(np.arange(args.buffer_size), np.random.uniform(0.1, 2.0, size=args.buffer_size))
+    print(f"filled {args.buffer_size} priorities in {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    for _ in range(args.num_iterations):
+        data = rb.sample(args.batch_size, beta=args.beta)
+        rb.update_weights(data.indices, np.random.uniform(0.1, 2.0, size=args.batch_size))
+    elapsed = time.time() - start_time
+    print(f"sample+update_weights: {args.num_iterations / elapsed:.1f} batches/s")
+    print(f"sampled transitions per second: {args.num_iterations * args.batch_size / elapsed:.1f}")
@@ -0,0 +1,50 @@
+"""Environment-stepping SPS of the `--env-backend` options of `ppo.py`, `ppo_atari.py` and
+`ppo_continuous_action.py` as the number of environments (i.e. workers) scales.
+
+Usage:
+    python benchmark/vector_env.py --env-id BreakoutNoFrameskip-v4 --num-envs 1 2 4 8 16
+    python benchmark/vector_env.py --env-id CartPole-v1 --num-envs 1 2 4 8 16
+"""
+
+import argparse
+import time
+
+from cleanrl_utils.vector_env import ENV_BACKENDS, make_vector_env
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env-id", type=str, default="BreakoutNoFrameskip-v4",
+        help="the id of the environment; ids containing `NoFrameskip` use the wrappers of `ppo_atari.py`")
+    parser.add_argument("--num-envs", nargs="+", type=int, default=[1, 2, 4, 8, 16],
+        help="the numbers of parallel game environments to benchmark")
+    parser.add_argument("--env-backends", nargs="+", type=str, default=ENV_BACKENDS, choices=ENV_BACKENDS,
+        help="the env backends to benchmark")
+    parser.add_argument("--num-steps", type=int, default=1000,
+        help="the number of vectorized steps to time")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if "NoFrameskip" in args.env_id:
+        from cleanrl.ppo_atari import make_env
+    else:
+        from cleanrl.ppo import make_env
+
+    print("| num envs | " + " | ".join(f"{backend} SPS" for backend in args.env_backends) + " |")
+    for num_envs in args.num_envs:
+        row = f"| {num_envs} |"
+        for backend in args.env_backends:
+            envs = make_vector_env([make_env(args.env_id, i, i, False, "") for i in range(num_envs)], backend)
+            envs.reset()
+            envs.step(envs.action_space.sample())
+            start_time = time.perf_counter()
+            for _ in range(args.num_steps):
+                envs.step(envs.action_space.sample())
+            row += f" {int(args.num_steps * num_envs / (time.perf_counter() - start_time))} |"
+            envs.close()
+        print(row)
@@ -20,6 +20,9 @@ from stable_baselines3.common.atari_wrappers import (
 from stable_baselines3.common.buffers import ReplayBuffer
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.buffers import FrameStackReplayBuffer, PrefetchReplayBuffer
+from cleanrl_utils.projection import categorical_projection
+
 
 def parse_args():
     # fmt: off
@@ -80,6 +83,8 @@ def parse_args():
         help="timestep to start learning")
     parser.add_argument("--train-frequency", type=int, default=4,
         help="the frequency of training")
+    parser.add_argument("--prefetch-batches", type=int, default=0,
+        help="if positive, the number of batches sampled ahead by a background thread (`cleanrl_utils.buffers.PrefetchReplayBuffer`)")
     args = parser.parse_args()
     # fmt: on
     assert args.num_envs == 1, "vectorized envs are not supported at the moment"
@@ -196,14 +201,23 @@ poetry run pip install "stable_baselines3==2.0.0a1" "gymnasium[atari,accept-rom-
     target_network = QNetwork(envs, n_atoms=args.n_atoms, v_min=args.v_min, v_max=args.v_max).to(device)
     target_network.load_state_dict(q_network.state_dict())
 
-    rb = ReplayBuffer(
-        args.buffer_size,
-        envs.single_observation_space,
-        envs.single_action_space,
-        device,
-        optimize_memory_usage=True,
-        handle_timeout_termination=False,
-    )
+    if args.prefetch_batches > 0:
+        rb = PrefetchReplayBuffer(
+            FrameStackReplayBuffer(args.buffer_size, envs.single_observation_space, envs.single_action_space, device),
+            args.batch_size,
+            prefetch=args.prefetch_batches,
+            seed=args.seed,
+            handle_timeout_termination=False,
+        )
+    else:
+        rb = ReplayBuffer(
+            args.buffer_size,
+            envs.single_observation_space,
+            envs.single_action_space,
+            device,
+            optimize_memory_usage=True,
+            handle_timeout_termination=False,
+        )
     start_time = time.time()
 
     # TRY NOT TO MODIFY: start the game
@@ -248,21 +262,7 @@ poetry run pip install "stable_baselines3==2.0.0a1" "gymnasium[atari,accept-rom-
                 with torch.no_grad():
                     _, next_pmfs = target_network.get_action(data.next_observations)
                     next_atoms = data.rewards + args.gamma * target_network.atoms * (1 - data.dones)
-                    # projection
-                    delta_z = target_network.atoms[1] - target_network.atoms[0]
-                    tz = next_atoms.clamp(args.v_min, args.v_max)
-
-                    b = (tz - args.v_min) / delta_z
-                    l = b.floor().clamp(0, args.n_atoms - 1)
-                    u = b.ceil().clamp(0, args.n_atoms - 1)
-                    # (l == u).float() handles the case where bj is exactly an integer
-                    # example bj = 1, then the upper ceiling should be uj= 2, and lj= 1
-                    d_m_l = (u + (l == u).float() - b) * next_pmfs
-                    d_m_u = (b - l) * next_pmfs
-                    target_pmfs = torch.zeros_like(next_pmfs)
-                    for i in range(target_pmfs.size(0)):
-                        target_pmfs[i].index_add_(0, l[i].long(), d_m_l[i])
-                        target_pmfs[i].index_add_(0, u[i].long(), d_m_u[i])
+                    target_pmfs = categorical_projection(next_atoms, next_pmfs, target_network.atoms)
 
                 _, old_pmfs = q_network.get_action(data.observations, data.actions.flatten())
                 loss = (-(target_pmfs * old_pmfs.clamp(min=1e-5, max=1 - 1e-5).log()).sum(-1)).mean()
@@ -313,5 +313,7 @@ poetry run pip install "stable_baselines3==2.0.0a1" "gymnasium[atari,accept-rom-
             repo_id = f"{args.hf_entity}/{repo_name}" if args.hf_entity else repo_name
             push_to_hub(args, episodic_returns, repo_id, "C51", f"runs/{run_name}", f"videos/{run_name}-eval")
 
+    if args.prefetch_batches > 0:
+        rb.close()
     envs.close()
     writer.close()
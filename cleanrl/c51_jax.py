@@ -16,6 +16,9 @@ from flax.training.train_state import TrainState
 from stable_baselines3.common.buffers import ReplayBuffer
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.buffers_jax import DeviceReplayBuffer
+from cleanrl_utils.projection_jax import categorical_projection
+
 
 def parse_args():
     # fmt: off
@@ -72,6 +75,10 @@ def parse_args():
         help="timestep to start learning")
     parser.add_argument("--train-frequency", type=int, default=10,
         help="the frequency of training")
+    parser.add_argument("--updates-per-dispatch", type=int, default=1,
+        help="the number of gradient updates run by a single call of the jitted learner; if larger than 1, the batches of `updates-per-dispatch` training steps are sampled at once and the updates (and target network updates) run in a `lax.scan`")
+    parser.add_argument("--device-buffer", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the replay buffer lives on the device (`cleanrl_utils.buffers_jax`) and the batches are sampled inside the jitted learner, which then always runs the `lax.scan` of `updates-per-dispatch` updates")
     args = parser.parse_args()
     # fmt: on
     assert args.num_envs == 1, "vectorized envs are not supported at the moment"
@@ -177,13 +184,16 @@ poetry run pip install "stable_baselines3==2.0.0a1"
     # This step is not necessary as init called on same observation and key will always lead to same initializations
     q_state = q_state.replace(target_params=optax.incremental_update(q_state.params, q_state.target_params, 1))
 
-    rb = ReplayBuffer(
-        args.buffer_size,
-        envs.single_observation_space,
-        envs.single_action_space,
-        "cpu",
-        handle_timeout_termination=False,
-    )
+    if args.device_buffer:
+        rb = DeviceReplayBuffer(args.buffer_size, envs.single_observation_space, envs.single_action_space)
+    else:
+        rb = ReplayBuffer(
+            args.buffer_size,
+            envs.single_observation_space,
+            envs.single_action_space,
+            "cpu",
+            handle_timeout_termination=False,
+        )
 
     @jax.jit
     def update(q_state, observations, actions, next_observations, rewards, dones):
@@ -192,25 +202,7 @@ poetry run pip install "stable_baselines3==2.0.0a1"
         next_action = jnp.argmax(next_vals, axis=-1)  # (batch_size,)
         next_pmfs = next_pmfs[np.arange(next_pmfs.shape[0]), next_action]
         next_atoms = rewards + args.gamma * q_state.atoms * (1 - dones)
-        # projection
-        delta_z = q_state.atoms[1] - q_state.atoms[0]
-        tz = jnp.clip(next_atoms, a_min=(args.v_min), a_max=(args.v_max))
-
-        b = (tz - args.v_min) / delta_z
-        l = jnp.clip(jnp.floor(b), a_min=0, a_max=args.n_atoms - 1)
-        u = jnp.clip(jnp.ceil(b), a_min=0, a_max=args.n_atoms - 1)
-        # (l == u).astype(jnp.float) handles the case where bj is exactly an integer
-        # example bj = 1, then the upper ceiling should be uj= 2, and lj= 1
-        d_m_l = (u + (l == u).astype(jnp.float32) - b) * next_pmfs
-        d_m_u = (b - l) * next_pmfs
-        target_pmfs = jnp.zeros_like(next_pmfs)
-
-        def project_to_bins(i, val):
-            val = val.at[i, l[i].astype(jnp.int32)].add(d_m_l[i])
-            val = val.at[i, u[i].astype(jnp.int32)].add(d_m_u[i])
-            return val
-
-        target_pmfs = jax.lax.fori_loop(0, target_pmfs.shape[0], project_to_bins, target_pmfs)
+        target_pmfs = categorical_projection(next_atoms, next_pmfs, q_state.atoms)
 
         def loss(q_params, observations, actions, target_pmfs):
             pmfs = q_network.apply(q_params, observations)
@@ -226,6 +218,40 @@ poetry run pip install "stable_baselines3==2.0.0a1"
         q_state = q_state.apply_gradients(grads=grads)
         return loss_value, old_values, q_state
 
+    @jax.jit
+    def update_many(q_state, observations, actions, next_observations, rewards, dones, global_steps):
+        def update_once(q_state, batch):
+            global_step, *batch = batch
+            loss_value, old_val, q_state = update(q_state, *batch)
+            # update the target network if a multiple of `target_network_frequency` was crossed since the last update
+            q_state = jax.lax.cond(
+                global_step % args.target_network_frequency < args.train_frequency,
+                lambda q_state: q_state.replace(
+                    target_params=optax.incremental_update(q_state.params, q_state.target_params, 1)
+                ),
+                lambda q_state: q_state,
+                q_state,
+            )
+            return q_state, (loss_value, old_val)
+
+        q_state, (loss_value, old_val) = jax.lax.scan(
+            update_once, q_state, (global_steps, observations, actions, next_observations, rewards, dones)
+        )
+        return loss_value[-1], old_val[-1], q_state
+
+    def stack_batches(x):
+        return x.numpy().reshape((args.updates_per_dispatch, args.batch_size) + x.shape[1:])
+
+    @jax.jit
+    def sample_and_update_many(q_state, rb_state, key, global_steps):
+        data = rb_state.sample(key, args.batch_size * args.updates_per_dispatch)
+        data = jax.tree_util.tree_map(lambda x: x.reshape((args.updates_per_dispatch, args.batch_size) + x.shape[1:]), data)
+        # the update expects `(batch_size, 1)` rewards and dones, like the ones of the stable-baselines3 buffer
+        data = data.replace(rewards=data.rewards[..., None], dones=data.dones[..., None])
+        return update_many(
+            q_state, data.observations, data.actions, data.next_observations, data.rewards, data.dones, global_steps
+        )
+
     start_time = time.time()
 
     # TRY NOT TO MODIFY: start the game
@@ -266,7 +292,12 @@ poetry run pip install "stable_baselines3==2.0.0a1"
         obs = next_obs
 
         # ALGO LOGIC: training.
-        if global_step > args.learning_starts and global_step % args.train_frequency == 0:
+        if (
+            global_step > args.learning_starts
+            and global_step % args.train_frequency == 0
+            and args.updates_per_dispatch == 1
+            and not args.device_buffer
+        ):
             data = rb.sample(args.batch_size)
             loss, old_val, q_state = update(
                 q_state,
@@ -286,6 +317,29 @@ poetry run pip install "stable_baselines3==2.0.0a1"
             # update the target network
             if global_step % args.target_network_frequency == 0:
                 q_state = q_state.replace(target_params=optax.incremental_update(q_state.params, q_state.target_params, 1))
+        elif global_step > args.learning_starts and global_step % (args.train_frequency * args.updates_per_dispatch) == 0:
+            # perform `updates_per_dispatch` gradient-descent steps, one per `train_frequency` steps up to `global_step`
+            global_steps = global_step - args.train_frequency * np.arange(args.updates_per_dispatch - 1, -1, -1)
+            if args.device_buffer:
+                key, sample_key = jax.random.split(key)
+                loss, old_val, q_state = sample_and_update_many(q_state, rb.state, sample_key, global_steps)
+            else:
+                data = rb.sample(args.batch_size * args.updates_per_dispatch)
+                loss, old_val, q_state = update_many(
+                    q_state,
+                    stack_batches(data.observations),
+                    stack_batches(data.actions),
+                    stack_batches(data.next_observations),
+                    stack_batches(data.rewards),
+                    stack_batches(data.dones),
+                    global_steps,
+                )
+
+            if global_step % 100 < args.train_frequency * args.updates_per_dispatch:
+                writer.add_scalar("losses/loss", jax.device_get(loss), global_step)
+                writer.add_scalar("losses/q_values", jax.device_get(old_val.mean()), global_step)
+                print("SPS:", int(global_step / (time.time() - start_time)))
+                writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
 
     if args.save_model:
         model_path = f"runs/{run_name}/{args.exp_name}.cleanrl_model"
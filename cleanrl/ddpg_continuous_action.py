@@ -14,6 +14,9 @@ import torch.optim as optim
 from stable_baselines3.common.buffers import ReplayBuffer
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.buffers import PrefetchReplayBuffer
+from cleanrl_utils.buffers import ReplayBuffer as CleanRLReplayBuffer
+
 
 def parse_args():
     # fmt: off
@@ -58,6 +61,8 @@ def parse_args():
         help="the frequency of training policy (delayed)")
     parser.add_argument("--noise-clip", type=float, default=0.5,
         help="noise clip parameter of the Target Policy Smoothing Regularization")
+    parser.add_argument("--prefetch-batches", type=int, default=0,
+        help="if positive, the number of batches sampled ahead by a background thread (`cleanrl_utils.buffers.PrefetchReplayBuffer`)")
     args = parser.parse_args()
     # fmt: on
     return args
@@ -169,13 +174,22 @@ poetry run pip install "stable_baselines3==2.0.0a1"
     actor_optimizer = optim.Adam(list(actor.parameters()), lr=args.learning_rate)
 
     envs.single_observation_space.dtype = np.float32
-    rb = ReplayBuffer(
-        args.buffer_size,
-        envs.single_observation_space,
-        envs.single_action_space,
-        device,
-        handle_timeout_termination=False,
-    )
+    if args.prefetch_batches > 0:
+        rb = PrefetchReplayBuffer(
+            CleanRLReplayBuffer(args.buffer_size, envs.single_observation_space, envs.single_action_space, device),
+            args.batch_size,
+            prefetch=args.prefetch_batches,
+            seed=args.seed,
+            handle_timeout_termination=False,
+        )
+    else:
+        rb = ReplayBuffer(
+            args.buffer_size,
+            envs.single_observation_space,
+            envs.single_action_space,
+            device,
+            handle_timeout_termination=False,
+        )
     start_time = time.time()
 
     # TRY NOT TO MODIFY: start the game
@@ -247,5 +261,7 @@ poetry run pip install "stable_baselines3==2.0.0a1"
                 print("SPS:", int(global_step / (time.time() - start_time)))
                 writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
 
+    if args.prefetch_batches > 0:
+        rb.close()
     envs.close()
     writer.close()
@@ -14,6 +14,10 @@ import torch.optim as optim
 from stable_baselines3.common.buffers import ReplayBuffer
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.buffers import PrefetchReplayBuffer
+from cleanrl_utils.buffers import ReplayBuffer as CleanRLReplayBuffer
+from cleanrl_utils.timer import PhaseTimer, Profiler
+
 
 def parse_args():
     # fmt: off
@@ -34,6 +38,14 @@ def parse_args():
         help="the entity (team) of wandb's project")
     parser.add_argument("--capture-video", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
         help="whether to capture videos of the agent performances (check out `videos` folder)")
+    parser.add_argument("--perf-metrics", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the time spent in each phase of the training loop is logged as `perf/*` scalars")
+    parser.add_argument("--profile", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, a torch.profiler trace of `--profile-num-updates` training updates is saved to `runs/{run_name}/profile`")
+    parser.add_argument("--profile-start-update", type=int, default=10,
+        help="the training update at which the profiler trace starts")
+    parser.add_argument("--profile-num-updates", type=int, default=2,
+        help="the number of training updates the profiler traces")
     parser.add_argument("--save-model", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
         help="whether to save model into the `runs/{run_name}` folder")
     parser.add_argument("--upload-model", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
@@ -70,6 +82,8 @@ def parse_args():
         help="timestep to start learning")
     parser.add_argument("--train-frequency", type=int, default=10,
         help="the frequency of training")
+    parser.add_argument("--prefetch-batches", type=int, default=0,
+        help="if positive, the number of batches sampled ahead by a background thread (`cleanrl_utils.buffers.PrefetchReplayBuffer`)")
     args = parser.parse_args()
     # fmt: on
     assert args.num_envs == 1, "vectorized envs are not supported at the moment"
@@ -162,15 +176,29 @@ poetry run pip install "stable_baselines3==2.0.0a1"
     target_network = QNetwork(envs).to(device)
     target_network.load_state_dict(q_network.state_dict())
 
-    rb = ReplayBuffer(
-        args.buffer_size,
-        envs.single_observation_space,
-        envs.single_action_space,
-        device,
-        handle_timeout_termination=False,
-    )
+    if args.prefetch_batches > 0:
+        rb = PrefetchReplayBuffer(
+            CleanRLReplayBuffer(args.buffer_size, envs.single_observation_space, envs.single_action_space, device),
+            args.batch_size,
+            prefetch=args.prefetch_batches,
+            seed=args.seed,
+            handle_timeout_termination=False,
+        )
+    else:
+        rb = ReplayBuffer(
+            args.buffer_size,
+            envs.single_observation_space,
+            envs.single_action_space,
+            device,
+            handle_timeout_termination=False,
+        )
     start_time = time.time()
 
+    timer = PhaseTimer(args.perf_metrics, torch.cuda.synchronize if device.type == "cuda" else None)
+    profiler = Profiler(
+        "torch", f"runs/{run_name}/profile", args.profile_start_update, args.profile_num_updates, enabled=args.profile
+    )
+
     # TRY NOT TO MODIFY: start the game
     obs, _ = envs.reset(seed=args.seed)
     for global_step in range(args.total_timesteps):
@@ -179,11 +207,15 @@ poetry run pip install "stable_baselines3==2.0.0a1"
         if random.random() < epsilon:
             actions = np.array([envs.single_action_space.sample() for _ in range(envs.num_envs)])
         else:
+            timer.start("inference")
             q_values = q_network(torch.Tensor(obs).to(device))
             actions = torch.argmax(q_values, dim=1).cpu().numpy()
+            timer.stop("inference")
 
         # TRY NOT TO MODIFY: execute the game and log data.
+        timer.start("env_step")
         next_obs, rewards, terminated, truncated, infos = envs.step(actions)
+        timer.stop("env_step")
 
         # TRY NOT TO MODIFY: record rewards for plotting purposes
         if "final_info" in infos:
@@ -197,11 +229,13 @@ poetry run pip install "stable_baselines3==2.0.0a1"
                 writer.add_scalar("charts/epsilon", epsilon, global_step)
 
         # TRY NOT TO MODIFY: save data to reply buffer; handle `final_observation`
+        timer.start("buffer")
         real_next_obs = next_obs.copy()
         for idx, d in enumerate(truncated):
             if d:
                 real_next_obs[idx] = infos["final_observation"][idx]
         rb.add(obs, real_next_obs, actions, rewards, terminated, infos)
+        timer.stop("buffer")
 
         # TRY NOT TO MODIFY: CRUCIAL step easy to overlook
         obs = next_obs
@@ -209,6 +243,8 @@ poetry run pip install "stable_baselines3==2.0.0a1"
         # ALGO LOGIC: training.
         if global_step > args.learning_starts:
             if global_step % args.train_frequency == 0:
+                profiler.step()
+                timer.start("update")
                 data = rb.sample(args.batch_size)
                 with torch.no_grad():
                     target_max, _ = target_network(data.next_observations).max(dim=1)
@@ -226,6 +262,9 @@ poetry run pip install "stable_baselines3==2.0.0a1"
                 optimizer.zero_grad()
                 loss.backward()
                 optimizer.step()
+                timer.stop("update")
+                if global_step % 100 == 0:
+                    timer.write(writer, global_step)
 
             # update target network
             if global_step % args.target_network_frequency == 0:
@@ -234,6 +273,8 @@ poetry run pip install "stable_baselines3==2.0.0a1"
                         args.tau * q_network_param.data + (1.0 - args.tau) * target_network_param.data
                     )
 
+    profiler.close()
+
     if args.save_model:
         model_path = f"runs/{run_name}/{args.exp_name}.cleanrl_model"
         torch.save(q_network.state_dict(), model_path)
@@ -260,5 +301,7 @@ poetry run pip install "stable_baselines3==2.0.0a1"
             repo_id = f"{args.hf_entity}/{repo_name}" if args.hf_entity else repo_name
             push_to_hub(args, episodic_returns, repo_id, "DQN", f"runs/{run_name}", f"videos/{run_name}-eval")
 
+    if args.prefetch_batches > 0:
+        rb.close()
     envs.close()
     writer.close()
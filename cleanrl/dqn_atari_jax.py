@@ -79,6 +79,8 @@ def parse_args():
         help="timestep to start learning")
     parser.add_argument("--train-frequency", type=int, default=4,
         help="the frequency of training")
+    parser.add_argument("--updates-per-dispatch", type=int, default=1,
+        help="the number of gradient updates run by a single call of the jitted learner; if larger than 1, the batches of `updates-per-dispatch` training steps are sampled at once and the updates (and target network updates) run in a `lax.scan`")
     args = parser.parse_args()
     # fmt: on
     assert args.num_envs == 1, "vectorized envs are not supported at the moment"
@@ -221,6 +223,30 @@ poetry run pip install "stable_baselines3==2.0.0a1" "gymnasium[atari,accept-rom-
         q_state = q_state.apply_gradients(grads=grads)
         return loss_value, q_pred, q_state
 
+    @jax.jit
+    def update_many(q_state, observations, actions, next_observations, rewards, dones, global_steps):
+        def update_once(q_state, batch):
+            global_step, *batch = batch
+            loss_value, old_val, q_state = update(q_state, *batch)
+            # update the target network if a multiple of `target_network_frequency` was crossed since the last update
+            q_state = jax.lax.cond(
+                global_step % args.target_network_frequency < args.train_frequency,
+                lambda q_state: q_state.replace(
+                    target_params=optax.incremental_update(q_state.params, q_state.target_params, args.tau)
+                ),
+                lambda q_state: q_state,
+                q_state,
+            )
+            return q_state, (loss_value, old_val)
+
+        q_state, (loss_value, old_val) = jax.lax.scan(
+            update_once, q_state, (global_steps, observations, actions, next_observations, rewards, dones)
+        )
+        return loss_value[-1], old_val[-1], q_state
+
+    def stack_batches(x):
+        return x.numpy().reshape((args.updates_per_dispatch, args.batch_size) + x.shape[1:])
+
     start_time = time.time()
 
     # TRY NOT TO MODIFY: start the game
@@ -260,7 +286,7 @@ poetry run pip install "stable_baselines3==2.0.0a1" "gymnasium[atari,accept-rom-
         obs = next_obs
 
         # ALGO LOGIC: training.
-        if global_step > args.learning_starts:
+        if global_step > args.learning_starts and args.updates_per_dispatch == 1:
             if global_step % args.train_frequency == 0:
                 data = rb.sample(args.batch_size)
                 # perform a gradient-descent step
@@ -284,6 +310,24 @@ poetry run pip install "stable_baselines3==2.0.0a1" "gymnasium[atari,accept-rom-
                 q_state = q_state.replace(
                     target_params=optax.incremental_update(q_state.params, q_state.target_params, args.tau)
                 )
+        elif global_step > args.learning_starts and global_step % (args.train_frequency * args.updates_per_dispatch) == 0:
+            data = rb.sample(args.batch_size * args.updates_per_dispatch)
+            # perform `updates_per_dispatch` gradient-descent steps, one per `train_frequency` steps up to `global_step`
+            loss, old_val, q_state = update_many(
+                q_state,
+                stack_batches(data.observations),
+                stack_batches(data.actions),
+                stack_batches(data.next_observations),
+                stack_batches(data.rewards.flatten()),
+                stack_batches(data.dones.flatten()),
+                global_step - args.train_frequency * np.arange(args.updates_per_dispatch - 1, -1, -1),
+            )
+
+            if global_step % 100 < args.train_frequency * args.updates_per_dispatch:
+                writer.add_scalar("losses/td_loss", jax.device_get(loss), global_step)
+                writer.add_scalar("losses/q_values", jax.device_get(old_val).mean(), global_step)
+                print("SPS:", int(global_step / (time.time() - start_time)))
+                writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
 
     if args.save_model:
         model_path = f"runs/{run_name}/{args.exp_name}.cleanrl_model"
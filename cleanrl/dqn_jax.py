@@ -16,6 +16,9 @@ from flax.training.train_state import TrainState
 from stable_baselines3.common.buffers import ReplayBuffer
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.buffers_jax import DeviceReplayBuffer
+from cleanrl_utils.timer import PhaseTimer, Profiler
+
 
 def parse_args():
     # fmt: off
@@ -32,6 +35,14 @@ def parse_args():
         help="the entity (team) of wandb's project")
     parser.add_argument("--capture-video", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
         help="whether to capture videos of the agent performances (check out `videos` folder)")
+    parser.add_argument("--perf-metrics", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the time spent in each phase of the training loop is logged as `perf/*` scalars")
+    parser.add_argument("--profile", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, a jax.profiler trace of `--profile-num-updates` training dispatches is saved to `runs/{run_name}/profile`")
+    parser.add_argument("--profile-start-update", type=int, default=10,
+        help="the training dispatch at which the profiler trace starts")
+    parser.add_argument("--profile-num-updates", type=int, default=2,
+        help="the number of training dispatches the profiler traces")
     parser.add_argument("--save-model", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
         help="whether to save model into the `runs/{run_name}` folder")
     parser.add_argument("--upload-model", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
@@ -68,6 +79,10 @@ def parse_args():
         help="timestep to start learning")
     parser.add_argument("--train-frequency", type=int, default=10,
         help="the frequency of training")
+    parser.add_argument("--updates-per-dispatch", type=int, default=1,
+        help="the number of gradient updates run by a single call of the jitted learner; if larger than 1, the batches of `updates-per-dispatch` training steps are sampled at once and the updates (and target network updates) run in a `lax.scan`")
+    parser.add_argument("--device-buffer", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the replay buffer lives on the device (`cleanrl_utils.buffers_jax`) and the batches are sampled inside the jitted learner, which then always runs the `lax.scan` of `updates-per-dispatch` updates")
     args = parser.parse_args()
     # fmt: on
     assert args.num_envs == 1, "vectorized envs are not supported at the moment"
@@ -170,13 +185,16 @@ poetry run pip install "stable_baselines3==2.0.0a1"
     # This step is not necessary as init called on same observation and key will always lead to same initializations
     q_state = q_state.replace(target_params=optax.incremental_update(q_state.params, q_state.target_params, 1))
 
-    rb = ReplayBuffer(
-        args.buffer_size,
-        envs.single_observation_space,
-        envs.single_action_space,
-        "cpu",
-        handle_timeout_termination=False,
-    )
+    if args.device_buffer:
+        rb = DeviceReplayBuffer(args.buffer_size, envs.single_observation_space, envs.single_action_space)
+    else:
+        rb = ReplayBuffer(
+            args.buffer_size,
+            envs.single_observation_space,
+            envs.single_action_space,
+            "cpu",
+            handle_timeout_termination=False,
+        )
 
     @jax.jit
     def update(q_state, observations, actions, next_observations, rewards, dones):
@@ -193,8 +211,45 @@ poetry run pip install "stable_baselines3==2.0.0a1"
         q_state = q_state.apply_gradients(grads=grads)
         return loss_value, q_pred, q_state
 
+    @jax.jit
+    def update_many(q_state, observations, actions, next_observations, rewards, dones, global_steps):
+        def update_once(q_state, batch):
+            global_step, *batch = batch
+            loss_value, old_val, q_state = update(q_state, *batch)
+            # update the target network if a multiple of `target_network_frequency` was crossed since the last update
+            q_state = jax.lax.cond(
+                global_step % args.target_network_frequency < args.train_frequency,
+                lambda q_state: q_state.replace(
+                    target_params=optax.incremental_update(q_state.params, q_state.target_params, args.tau)
+                ),
+                lambda q_state: q_state,
+                q_state,
+            )
+            return q_state, (loss_value, old_val)
+
+        q_state, (loss_value, old_val) = jax.lax.scan(
+            update_once, q_state, (global_steps, observations, actions, next_observations, rewards, dones)
+        )
+        return loss_value[-1], old_val[-1], q_state
+
+    def stack_batches(x):
+        return x.numpy().reshape((args.updates_per_dispatch, args.batch_size) + x.shape[1:])
+
+    @jax.jit
+    def sample_and_update_many(q_state, rb_state, key, global_steps):
+        data = rb_state.sample(key, args.batch_size * args.updates_per_dispatch)
+        data = jax.tree_util.tree_map(lambda x: x.reshape((args.updates_per_dispatch, args.batch_size) + x.shape[1:]), data)
+        return update_many(
+            q_state, data.observations, data.actions, data.next_observations, data.rewards, data.dones, global_steps
+        )
+
     start_time = time.time()
 
+    timer = PhaseTimer(args.perf_metrics)
+    profiler = Profiler(
+        "jax", f"runs/{run_name}/profile", args.profile_start_update, args.profile_num_updates, enabled=args.profile
+    )
+
     # TRY NOT TO MODIFY: start the game
     obs, _ = envs.reset(seed=args.seed)
     for global_step in range(args.total_timesteps):
@@ -203,12 +258,16 @@ poetry run pip install "stable_baselines3==2.0.0a1"
         if random.random() < epsilon:
             actions = np.array([envs.single_action_space.sample() for _ in range(envs.num_envs)])
         else:
+            timer.start("inference")
             q_values = q_network.apply(q_state.params, obs)
             actions = q_values.argmax(axis=-1)
             actions = jax.device_get(actions)
+            timer.stop("inference")
 
         # TRY NOT TO MODIFY: execute the game and log data.
+        timer.start("env_step")
         next_obs, rewards, terminated, truncated, infos = envs.step(actions)
+        timer.stop("env_step")
 
         # TRY NOT TO MODIFY: record rewards for plotting purposes
         if "final_info" in infos:
@@ -222,18 +281,22 @@ poetry run pip install "stable_baselines3==2.0.0a1"
                 writer.add_scalar("charts/epsilon", epsilon, global_step)
 
         # TRY NOT TO MODIFY: save data to reply buffer; handle `final_observation`
+        timer.start("buffer")
         real_next_obs = next_obs.copy()
         for idx, d in enumerate(truncated):
             if d:
                 real_next_obs[idx] = infos["final_observation"][idx]
         rb.add(obs, real_next_obs, actions, rewards, terminated, infos)
+        timer.stop("buffer")
 
         # TRY NOT TO MODIFY: CRUCIAL step easy to overlook
         obs = next_obs
 
         # ALGO LOGIC: training.
-        if global_step > args.learning_starts:
+        if global_step > args.learning_starts and args.updates_per_dispatch == 1 and not args.device_buffer:
             if global_step % args.train_frequency == 0:
+                profiler.step()
+                timer.start("update")
                 data = rb.sample(args.batch_size)
                 # perform a gradient-descent step
                 loss, old_val, q_state = update(
@@ -244,18 +307,54 @@ poetry run pip install "stable_baselines3==2.0.0a1"
                     data.rewards.flatten().numpy(),
                     data.dones.flatten().numpy(),
                 )
+                if timer.enabled:
+                    # wait for the dispatched update, or its time is charged to the next phase that reads `q_state`
+                    jax.block_until_ready(loss)
+                timer.stop("update")
 
                 if global_step % 100 == 0:
                     writer.add_scalar("losses/td_loss", jax.device_get(loss), global_step)
                     writer.add_scalar("losses/q_values", jax.device_get(old_val).mean(), global_step)
                     print("SPS:", int(global_step / (time.time() - start_time)))
                     writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
+                    timer.write(writer, global_step)
 
             # update target network
             if global_step % args.target_network_frequency == 0:
                 q_state = q_state.replace(
                     target_params=optax.incremental_update(q_state.params, q_state.target_params, args.tau)
                 )
+        elif global_step > args.learning_starts and global_step % (args.train_frequency * args.updates_per_dispatch) == 0:
+            profiler.step()
+            timer.start("update")
+            # perform `updates_per_dispatch` gradient-descent steps, one per `train_frequency` steps up to `global_step`
+            global_steps = global_step - args.train_frequency * np.arange(args.updates_per_dispatch - 1, -1, -1)
+            if args.device_buffer:
+                key, sample_key = jax.random.split(key)
+                loss, old_val, q_state = sample_and_update_many(q_state, rb.state, sample_key, global_steps)
+            else:
+                data = rb.sample(args.batch_size * args.updates_per_dispatch)
+                loss, old_val, q_state = update_many(
+                    q_state,
+                    stack_batches(data.observations),
+                    stack_batches(data.actions),
+                    stack_batches(data.next_observations),
+                    stack_batches(data.rewards.flatten()),
+                    stack_batches(data.dones.flatten()),
+                    global_steps,
+                )
+            if timer.enabled:
+                jax.block_until_ready(loss)
+            timer.stop("update")
+
+            if global_step % 100 < args.train_frequency * args.updates_per_dispatch:
+                writer.add_scalar("losses/td_loss", jax.device_get(loss), global_step)
+                writer.add_scalar("losses/q_values", jax.device_get(old_val).mean(), global_step)
+                print("SPS:", int(global_step / (time.time() - start_time)))
+                writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
+                timer.write(writer, global_step)
+
+    profiler.close()
 
     if args.save_model:
         model_path = f"runs/{run_name}/{args.exp_name}.cleanrl_model"
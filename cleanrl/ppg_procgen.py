@@ -15,6 +15,8 @@ from torch import distributions as td
 from torch.distributions.categorical import Categorical
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.gae import compute_gae
+
 
 def parse_args():
     # fmt: off
@@ -314,18 +316,9 @@ if __name__ == "__main__":
             with torch.no_grad():
                 next_value = agent.get_value(next_obs).reshape(1, -1)
                 if args.gae:
-                    advantages = torch.zeros_like(rewards).to(device)
-                    lastgaelam = 0
-                    for t in reversed(range(args.num_steps)):
-                        if t == args.num_steps - 1:
-                            nextnonterminal = 1.0 - next_done
-                            nextvalues = next_value
-                        else:
-                            nextnonterminal = 1.0 - dones[t + 1]
-                            nextvalues = values[t + 1]
-                        delta = rewards[t] + args.gamma * nextvalues * nextnonterminal - values[t]
-                        advantages[t] = lastgaelam = delta + args.gamma * args.gae_lambda * nextnonterminal * lastgaelam
-                    returns = advantages + values
+                    advantages, returns = compute_gae(
+                        rewards, values, dones, next_value, next_done, args.gamma, args.gae_lambda
+                    )
                 else:
                     returns = torch.zeros_like(rewards).to(device)
                     for t in reversed(range(args.num_steps)):
@@ -83,11 +83,19 @@ def parse_args():
         help="the maximum norm for the gradient clipping")
     parser.add_argument("--target-kl", type=float, default=None,
         help="the target KL divergence threshold")
+    parser.add_argument("--gather-minibatches", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
+        help="if toggled, each epoch shuffles an index vector and every minibatch is gathered from the storage inside the minibatch scan, instead of shuffling a full copy of the storage")
+    parser.add_argument("--log-frequency", type=int, default=10,
+        help="the number of updates between two reads of the training metrics by the host")
+    parser.add_argument("--num-devices", type=int, default=1,
+        help="the number of local devices the environments and the update are sharded across (on CPU, emulate N devices with `XLA_FLAGS=--xla_force_host_platform_device_count=N`)")
     args = parser.parse_args()
     args.batch_size = int(args.num_envs * args.num_steps)
     args.minibatch_size = int(args.batch_size // args.num_minibatches)
     args.num_updates = args.total_timesteps // args.batch_size
+    args.local_num_envs = int(args.num_envs // args.num_devices)
     # fmt: on
+    assert args.num_envs % args.num_devices == 0, "`num_envs` must be divisible by `num_devices`"
     return args
 
 
@@ -189,6 +197,106 @@ class EpisodeStatistics:
     returned_episode_lengths: jnp.array
 
 
+def make_update_ppo(args, network, actor, critic):
+    """
+    :return: `update_ppo(agent_state, storage, key)`, the `args.update_epochs` epochs of minibatch updates
+        of one iteration; it averages the gradients over the `"devices"` axis of the enclosing `jax.pmap`
+    """
+
+    @jax.jit
+    def get_action_and_value2(
+        params: flax.core.FrozenDict,
+        x: np.ndarray,
+        action: np.ndarray,
+    ):
+        """calculate value, logprob of supplied `action`, and entropy"""
+        hidden = network.apply(params.network_params, x)
+        logits = actor.apply(params.actor_params, hidden)
+        logprob = jax.nn.log_softmax(logits)[jnp.arange(action.shape[0]), action]
+        # normalize the logits https://gregorygundersen.com/blog/2020/02/09/log-sum-exp/
+        logits = logits - jax.scipy.special.logsumexp(logits, axis=-1, keepdims=True)
+        logits = logits.clip(min=jnp.finfo(logits.dtype).min)
+        p_log_p = logits * jax.nn.softmax(logits)
+        entropy = -p_log_p.sum(-1)
+        value = critic.apply(params.critic_params, hidden).squeeze()
+        return logprob, entropy, value
+
+    def ppo_loss(params, x, a, logp, mb_advantages, mb_returns):
+        newlogprob, entropy, newvalue = get_action_and_value2(params, x, a)
+        logratio = newlogprob - logp
+        ratio = jnp.exp(logratio)
+        approx_kl = ((ratio - 1) - logratio).mean()
+
+        if args.norm_adv:
+            mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
+
+        # Policy loss
+        pg_loss1 = -mb_advantages * ratio
+        pg_loss2 = -mb_advantages * jnp.clip(ratio, 1 - args.clip_coef, 1 + args.clip_coef)
+        pg_loss = jnp.maximum(pg_loss1, pg_loss2).mean()
+
+        # Value loss
+        v_loss = 0.5 * ((newvalue - mb_returns) ** 2).mean()
+
+        entropy_loss = entropy.mean()
+        loss = pg_loss - args.ent_coef * entropy_loss + v_loss * args.vf_coef
+        return loss, (pg_loss, v_loss, entropy_loss, jax.lax.stop_gradient(approx_kl))
+
+    ppo_loss_grad_fn = jax.value_and_grad(ppo_loss, has_aux=True)
+
+    def update_ppo(
+        agent_state: TrainState,
+        storage: Storage,
+        key: jax.random.PRNGKey,
+    ):
+        def update_epoch(carry, unused_inp):
+            agent_state, key = carry
+            key, subkey = jax.random.split(key)
+
+            def flatten(x):
+                return x.reshape((-1,) + x.shape[2:])
+
+            # taken from: https://github.com/google/brax/blob/main/brax/training/agents/ppo/train.py
+            def convert_data(x: jnp.ndarray):
+                x = jax.random.permutation(subkey, x)
+                x = jnp.reshape(x, (args.num_minibatches, -1) + x.shape[1:])
+                return x
+
+            flatten_storage = jax.tree_map(flatten, storage)
+            if args.gather_minibatches:
+                # same permutation as `convert_data`, but only the indices are shuffled
+                shuffled_storage = convert_data(jnp.arange(flatten_storage.actions.shape[0]))
+            else:
+                shuffled_storage = jax.tree_map(convert_data, flatten_storage)
+
+            def update_minibatch(agent_state, minibatch):
+                if args.gather_minibatches:
+                    minibatch = jax.tree_map(lambda x: x[minibatch], flatten_storage)
+                (loss, (pg_loss, v_loss, entropy_loss, approx_kl)), grads = ppo_loss_grad_fn(
+                    agent_state.params,
+                    minibatch.obs,
+                    minibatch.actions,
+                    minibatch.logprobs,
+                    minibatch.advantages,
+                    minibatch.returns,
+                )
+                grads = jax.lax.pmean(grads, axis_name="devices")
+                agent_state = agent_state.apply_gradients(grads=grads)
+                return agent_state, (loss, pg_loss, v_loss, entropy_loss, approx_kl)
+
+            agent_state, (loss, pg_loss, v_loss, entropy_loss, approx_kl) = jax.lax.scan(
+                update_minibatch, agent_state, shuffled_storage
+            )
+            return (agent_state, key), (loss, pg_loss, v_loss, entropy_loss, approx_kl)
+
+        (agent_state, key), (loss, pg_loss, v_loss, entropy_loss, approx_kl) = jax.lax.scan(
+            update_epoch, (agent_state, key), (), length=args.update_epochs
+        )
+        return agent_state, loss, pg_loss, v_loss, entropy_loss, approx_kl, key
+
+    return update_ppo
+
+
 if __name__ == "__main__":
     args = parse_args()
     run_name = f"{args.env_id}__{args.exp_name}__{args.seed}__{int(time.time())}"
@@ -216,15 +324,21 @@ if __name__ == "__main__":
     key = jax.random.PRNGKey(args.seed)
     key, network_key, actor_key, critic_key = jax.random.split(key, 4)
 
-    # env setup
-    envs = make_env(args.env_id, args.seed, args.num_envs)()
+    # env setup: one envpool of `local_num_envs` environments per device
+    devices = jax.local_devices()[: args.num_devices]
+    assert len(devices) == args.num_devices, f"requested {args.num_devices} devices but only {len(devices)} are available"
+    device_envs = [
+        make_env(args.env_id, args.seed + i * args.local_num_envs, args.local_num_envs)() for i in range(args.num_devices)
+    ]
+    envs = device_envs[0]
     episode_stats = EpisodeStatistics(
-        episode_returns=jnp.zeros(args.num_envs, dtype=jnp.float32),
-        episode_lengths=jnp.zeros(args.num_envs, dtype=jnp.int32),
-        returned_episode_returns=jnp.zeros(args.num_envs, dtype=jnp.float32),
-        returned_episode_lengths=jnp.zeros(args.num_envs, dtype=jnp.int32),
+        episode_returns=jnp.zeros(args.local_num_envs, dtype=jnp.float32),
+        episode_lengths=jnp.zeros(args.local_num_envs, dtype=jnp.int32),
+        returned_episode_returns=jnp.zeros(args.local_num_envs, dtype=jnp.float32),
+        returned_episode_lengths=jnp.zeros(args.local_num_envs, dtype=jnp.int32),
     )
     handle, recv, send, step_env = envs.xla()
+    handles = [handle] + [device_env.xla()[0] for device_env in device_envs[1:]]
 
     def step_env_wrappeed(episode_stats, handle, action):
         handle, (next_obs, reward, next_done, info) = step_env(handle, action)
@@ -291,24 +405,6 @@ if __name__ == "__main__":
         value = critic.apply(agent_state.params.critic_params, hidden)
         return action, logprob, value.squeeze(1), key
 
-    @jax.jit
-    def get_action_and_value2(
-        params: flax.core.FrozenDict,
-        x: np.ndarray,
-        action: np.ndarray,
-    ):
-        """calculate value, logprob of supplied `action`, and entropy"""
-        hidden = network.apply(params.network_params, x)
-        logits = actor.apply(params.actor_params, hidden)
-        logprob = jax.nn.log_softmax(logits)[jnp.arange(action.shape[0]), action]
-        # normalize the logits https://gregorygundersen.com/blog/2020/02/09/log-sum-exp/
-        logits = logits - jax.scipy.special.logsumexp(logits, axis=-1, keepdims=True)
-        logits = logits.clip(min=jnp.finfo(logits.dtype).min)
-        p_log_p = logits * jax.nn.softmax(logits)
-        entropy = -p_log_p.sum(-1)
-        value = critic.apply(params.critic_params, hidden).squeeze()
-        return logprob, entropy, value
-
     def compute_gae_once(carry, inp, gamma, gae_lambda):
         advantages = carry
         nextdone, nextvalues, curvalues, reward = inp
@@ -320,7 +416,6 @@ if __name__ == "__main__":
 
     compute_gae_once = partial(compute_gae_once, gamma=args.gamma, gae_lambda=args.gae_lambda)
 
-    @jax.jit
     def compute_gae(
         agent_state: TrainState,
         next_obs: np.ndarray,
@@ -331,7 +426,7 @@ if __name__ == "__main__":
             agent_state.params.critic_params, network.apply(agent_state.params.network_params, next_obs)
         ).squeeze()
 
-        advantages = jnp.zeros((args.num_envs,))
+        advantages = jnp.zeros_like(next_value)
         dones = jnp.concatenate([storage.dones, next_done[None, :]], axis=0)
         values = jnp.concatenate([storage.values, next_value[None, :]], axis=0)
         _, advantages = jax.lax.scan(
@@ -343,78 +438,18 @@ if __name__ == "__main__":
         )
         return storage
 
-    def ppo_loss(params, x, a, logp, mb_advantages, mb_returns):
-        newlogprob, entropy, newvalue = get_action_and_value2(params, x, a)
-        logratio = newlogprob - logp
-        ratio = jnp.exp(logratio)
-        approx_kl = ((ratio - 1) - logratio).mean()
-
-        if args.norm_adv:
-            mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
-
-        # Policy loss
-        pg_loss1 = -mb_advantages * ratio
-        pg_loss2 = -mb_advantages * jnp.clip(ratio, 1 - args.clip_coef, 1 + args.clip_coef)
-        pg_loss = jnp.maximum(pg_loss1, pg_loss2).mean()
-
-        # Value loss
-        v_loss = 0.5 * ((newvalue - mb_returns) ** 2).mean()
-
-        entropy_loss = entropy.mean()
-        loss = pg_loss - args.ent_coef * entropy_loss + v_loss * args.vf_coef
-        return loss, (pg_loss, v_loss, entropy_loss, jax.lax.stop_gradient(approx_kl))
-
-    ppo_loss_grad_fn = jax.value_and_grad(ppo_loss, has_aux=True)
-
-    @jax.jit
-    def update_ppo(
-        agent_state: TrainState,
-        storage: Storage,
-        key: jax.random.PRNGKey,
-    ):
-        def update_epoch(carry, unused_inp):
-            agent_state, key = carry
-            key, subkey = jax.random.split(key)
-
-            def flatten(x):
-                return x.reshape((-1,) + x.shape[2:])
-
-            # taken from: https://github.com/google/brax/blob/main/brax/training/agents/ppo/train.py
-            def convert_data(x: jnp.ndarray):
-                x = jax.random.permutation(subkey, x)
-                x = jnp.reshape(x, (args.num_minibatches, -1) + x.shape[1:])
-                return x
-
-            flatten_storage = jax.tree_map(flatten, storage)
-            shuffled_storage = jax.tree_map(convert_data, flatten_storage)
-
-            def update_minibatch(agent_state, minibatch):
-                (loss, (pg_loss, v_loss, entropy_loss, approx_kl)), grads = ppo_loss_grad_fn(
-                    agent_state.params,
-                    minibatch.obs,
-                    minibatch.actions,
-                    minibatch.logprobs,
-                    minibatch.advantages,
-                    minibatch.returns,
-                )
-                agent_state = agent_state.apply_gradients(grads=grads)
-                return agent_state, (loss, pg_loss, v_loss, entropy_loss, approx_kl, grads)
-
-            agent_state, (loss, pg_loss, v_loss, entropy_loss, approx_kl, grads) = jax.lax.scan(
-                update_minibatch, agent_state, shuffled_storage
-            )
-            return (agent_state, key), (loss, pg_loss, v_loss, entropy_loss, approx_kl, grads)
-
-        (agent_state, key), (loss, pg_loss, v_loss, entropy_loss, approx_kl, grads) = jax.lax.scan(
-            update_epoch, (agent_state, key), (), length=args.update_epochs
-        )
-        return agent_state, loss, pg_loss, v_loss, entropy_loss, approx_kl, key
+    update_ppo = make_update_ppo(args, network, actor, critic)
 
     # TRY NOT TO MODIFY: start the game
     global_step = 0
     start_time = time.time()
-    next_obs = envs.reset()
-    next_done = jnp.zeros(args.num_envs, dtype=jax.numpy.bool_)
+    next_obs = jax.device_put_sharded([device_env.reset() for device_env in device_envs], devices)
+    next_done = flax.jax_utils.replicate(jnp.zeros(args.local_num_envs, dtype=jax.numpy.bool_), devices)
+    # each device holds a replica of the agent, its own shard of the environments and its own PRNG key
+    agent_state = flax.jax_utils.replicate(agent_state, devices)
+    episode_stats = flax.jax_utils.replicate(episode_stats, devices)
+    handle = jax.device_put_sharded(handles, devices)
+    key = jax.device_put_sharded(list(jax.random.split(key, args.num_devices)), devices)
 
     # based on https://github.dev/google/evojax/blob/0625d875262011d8e1b6aa32566b236f44b4da66/evojax/sim_mgr.py
     def step_once(carry, step, env_step_fn):
@@ -442,39 +477,57 @@ if __name__ == "__main__":
 
     rollout = partial(rollout, step_once_fn=partial(step_once, env_step_fn=step_env_wrappeed), max_steps=args.num_steps)
 
-    for update in range(1, args.num_updates + 1):
-        update_time_start = time.time()
+    def train_iteration(agent_state, episode_stats, next_obs, next_done, key, handle):
+        """rollout, GAE and PPO update fused into one dispatch; the metrics stay on the device"""
         agent_state, episode_stats, next_obs, next_done, storage, key, handle = rollout(
             agent_state, episode_stats, next_obs, next_done, key, handle
         )
-        global_step += args.num_steps * args.num_envs
         storage = compute_gae(agent_state, next_obs, next_done, storage)
-        agent_state, loss, pg_loss, v_loss, entropy_loss, approx_kl, key = update_ppo(
-            agent_state,
-            storage,
-            key,
+        agent_state, loss, pg_loss, v_loss, entropy_loss, approx_kl, key = update_ppo(agent_state, storage, key)
+        metrics = {
+            "charts/avg_episodic_return": episode_stats.returned_episode_returns.mean(),
+            "charts/avg_episodic_length": episode_stats.returned_episode_lengths.mean(),
+            "charts/learning_rate": agent_state.opt_state[1].hyperparams["learning_rate"],
+            "losses/value_loss": v_loss[-1, -1],
+            "losses/policy_loss": pg_loss[-1, -1],
+            "losses/entropy": entropy_loss[-1, -1],
+            "losses/approx_kl": approx_kl[-1, -1],
+            "losses/loss": loss[-1, -1],
+        }
+        metrics = jax.lax.pmean(metrics, axis_name="devices")
+        return agent_state, episode_stats, next_obs, next_done, key, handle, metrics
+
+    # the storage lives and dies inside `train_iteration`; the carried state is donated so XLA updates it in place
+    train_iteration = jax.pmap(train_iteration, axis_name="devices", devices=devices, donate_argnums=(0, 1, 2, 3, 4))
+
+    log_time_start = time.time()
+    for update in range(1, args.num_updates + 1):
+        agent_state, episode_stats, next_obs, next_done, key, handle, metrics = train_iteration(
+            agent_state, episode_stats, next_obs, next_done, key, handle
         )
-        avg_episodic_return = np.mean(jax.device_get(episode_stats.returned_episode_returns))
-        print(f"global_step={global_step}, avg_episodic_return={avg_episodic_return}")
+        global_step += args.num_steps * args.num_envs
+        if update % args.log_frequency != 0 and update != args.num_updates:
+            continue
+
+        # reading the metrics is the only point where the host waits for the device
+        metrics = jax.tree_map(lambda x: x[0].item(), metrics)
+        print(f"global_step={global_step}, avg_episodic_return={metrics['charts/avg_episodic_return']}")
 
         # TRY NOT TO MODIFY: record rewards for plotting purposes
-        writer.add_scalar("charts/avg_episodic_return", avg_episodic_return, global_step)
-        writer.add_scalar(
-            "charts/avg_episodic_length", np.mean(jax.device_get(episode_stats.returned_episode_lengths)), global_step
-        )
-        writer.add_scalar("charts/learning_rate", agent_state.opt_state[1].hyperparams["learning_rate"].item(), global_step)
-        writer.add_scalar("losses/value_loss", v_loss[-1, -1].item(), global_step)
-        writer.add_scalar("losses/policy_loss", pg_loss[-1, -1].item(), global_step)
-        writer.add_scalar("losses/entropy", entropy_loss[-1, -1].item(), global_step)
-        writer.add_scalar("losses/approx_kl", approx_kl[-1, -1].item(), global_step)
-        writer.add_scalar("losses/loss", loss[-1, -1].item(), global_step)
+        for name, value in metrics.items():
+            writer.add_scalar(name, value, global_step)
         print("SPS:", int(global_step / (time.time() - start_time)))
         writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
+        num_logged_updates = (update - 1) % args.log_frequency + 1
         writer.add_scalar(
-            "charts/SPS_update", int(args.num_envs * args.num_steps / (time.time() - update_time_start)), global_step
+            "charts/SPS_update",
+            int(num_logged_updates * args.num_envs * args.num_steps / (time.time() - log_time_start)),
+            global_step,
         )
+        log_time_start = time.time()
 
     if args.save_model:
+        agent_state = flax.jax_utils.unreplicate(agent_state)
         model_path = f"runs/{run_name}/{args.exp_name}.cleanrl_model"
         with open(model_path, "wb") as f:
             f.write(
@@ -499,6 +552,7 @@ if __name__ == "__main__":
             eval_episodes=10,
             run_name=f"{run_name}-eval",
             Model=(Network, Actor, Critic),
+            num_envs=10,
         )
         for idx, episodic_return in enumerate(episodic_returns):
             writer.add_scalar("eval/episodic_return", episodic_return, idx)
@@ -510,5 +564,6 @@ if __name__ == "__main__":
             repo_id = f"{args.hf_entity}/{repo_name}" if args.hf_entity else repo_name
             push_to_hub(args, episodic_returns, repo_id, "PPO", f"runs/{run_name}", f"videos/{run_name}-eval")
 
-    envs.close()
+    for device_env in device_envs:
+        device_env.close()
     writer.close()
@@ -21,6 +21,8 @@ from stable_baselines3.common.atari_wrappers import (  # isort:skip
     NoopResetEnv,
 )
 
+from cleanrl_utils.gae import compute_gae
+
 
 def parse_args():
     # fmt: off
@@ -144,18 +146,41 @@ class Agent(nn.Module):
         batch_size = lstm_state[0].shape[1]
         hidden = hidden.reshape((-1, batch_size, self.lstm.input_size))
         done = done.reshape((-1, batch_size))
-        new_hidden = []
-        for h, d in zip(hidden, done):
-            h, lstm_state = self.lstm(
-                h.unsqueeze(0),
+        if len(hidden) == 1:
+            new_hidden, lstm_state = self.lstm(
+                hidden,
                 (
-                    (1.0 - d).view(1, -1, 1) * lstm_state[0],
-                    (1.0 - d).view(1, -1, 1) * lstm_state[1],
+                    (1.0 - done).view(1, -1, 1) * lstm_state[0],
+                    (1.0 - done).view(1, -1, 1) * lstm_state[1],
                 ),
             )
-            new_hidden += [h]
-        new_hidden = torch.flatten(torch.cat(new_hidden), 0, 1)
-        return new_hidden, lstm_state
+            return torch.flatten(new_hidden, 0, 1), lstm_state
+        return self.get_states_packed(hidden, lstm_state, done)
+
+    def get_states_packed(self, hidden, lstm_state, done):
+        # split each env's trajectory at the `done` boundaries and run all segments through the LSTM in one call;
+        # a segment starting at `t = 0` continues from `lstm_state`, any other one starts from zeros
+        num_steps, batch_size = done.shape
+        starts = done.T.bool().clone()  # env-major (batch_size, num_steps)
+        starts[:, 0] = True
+        starts = starts.flatten()
+        start_inds = starts.nonzero().flatten()
+        segment_ids = torch.cumsum(starts, 0) - 1
+        offsets = torch.arange(len(starts), device=done.device) - start_inds[segment_ids]
+        lengths = torch.bincount(segment_ids)
+
+        padded = hidden.new_zeros((num_steps, len(start_inds), self.lstm.input_size))
+        padded[offsets, segment_ids] = hidden.transpose(0, 1).flatten(0, 1)
+        segment_envs = start_inds // num_steps
+        mask = ((start_inds % num_steps == 0) * (1.0 - done[0, segment_envs])).view(1, -1, 1)
+        new_hidden, (h, c) = self.lstm(
+            nn.utils.rnn.pack_padded_sequence(padded, lengths.cpu(), enforce_sorted=False),
+            (mask * lstm_state[0][:, segment_envs], mask * lstm_state[1][:, segment_envs]),
+        )
+        new_hidden, _ = nn.utils.rnn.pad_packed_sequence(new_hidden, total_length=num_steps)
+        new_hidden = new_hidden[offsets, segment_ids].view(batch_size, num_steps, -1).transpose(0, 1)
+        last_segments = segment_ids.view(batch_size, num_steps)[:, -1]
+        return torch.flatten(new_hidden, 0, 1), (h[:, last_segments], c[:, last_segments])
 
     def get_value(self, x, lstm_state, done):
         hidden, _ = self.get_states(x, lstm_state, done)
@@ -209,7 +234,7 @@ if __name__ == "__main__":
     optimizer = optim.Adam(agent.parameters(), lr=args.learning_rate, eps=1e-5)
 
     # ALGO Logic: Storage setup
-    obs = torch.zeros((args.num_steps, args.num_envs) + envs.single_observation_space.shape).to(device)
+    obs = torch.zeros((args.num_steps, args.num_envs) + envs.single_observation_space.shape, dtype=torch.uint8).to(device)
     actions = torch.zeros((args.num_steps, args.num_envs) + envs.single_action_space.shape).to(device)
     logprobs = torch.zeros((args.num_steps, args.num_envs)).to(device)
     rewards = torch.zeros((args.num_steps, args.num_envs)).to(device)
@@ -219,7 +244,7 @@ if __name__ == "__main__":
     # TRY NOT TO MODIFY: start the game
     global_step = 0
     start_time = time.time()
-    next_obs = torch.Tensor(envs.reset()).to(device)
+    next_obs = torch.tensor(envs.reset(), device=device)
     next_done = torch.zeros(args.num_envs).to(device)
     next_lstm_state = (
         torch.zeros(agent.lstm.num_layers, args.num_envs, agent.lstm.hidden_size).to(device),
@@ -250,7 +275,7 @@ if __name__ == "__main__":
             # TRY NOT TO MODIFY: execute the game and log data.
             next_obs, reward, done, info = envs.step(action.cpu().numpy())
             rewards[step] = torch.tensor(reward).to(device).view(-1)
-            next_obs, next_done = torch.Tensor(next_obs).to(device), torch.Tensor(done).to(device)
+            next_obs, next_done = torch.tensor(next_obs, device=device), torch.Tensor(done).to(device)
 
             for item in info:
                 if "episode" in item.keys():
@@ -266,18 +291,7 @@ if __name__ == "__main__":
                 next_lstm_state,
                 next_done,
             ).reshape(1, -1)
-            advantages = torch.zeros_like(rewards).to(device)
-            lastgaelam = 0
-            for t in reversed(range(args.num_steps)):
-                if t == args.num_steps - 1:
-                    nextnonterminal = 1.0 - next_done
-                    nextvalues = next_value
-                else:
-                    nextnonterminal = 1.0 - dones[t + 1]
-                    nextvalues = values[t + 1]
-                delta = rewards[t] + args.gamma * nextvalues * nextnonterminal - values[t]
-                advantages[t] = lastgaelam = delta + args.gamma * args.gae_lambda * nextnonterminal * lastgaelam
-            returns = advantages + values
+            advantages, returns = compute_gae(rewards, values, dones, next_value, next_done, args.gamma, args.gae_lambda)
 
         # flatten the batch
         b_obs = obs.reshape((-1,) + envs.single_observation_space.shape)
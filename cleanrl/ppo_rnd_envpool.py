@@ -4,6 +4,7 @@ import os
 import random
 import time
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from distutils.util import strtobool
 
 import envpool
@@ -17,6 +18,9 @@ from gym.wrappers.normalize import RunningMeanStd
 from torch.distributions.categorical import Categorical
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.gae import compute_gae
+from cleanrl_utils.timer import PhaseTimer
+
 
 def parse_args():
     # fmt: off
@@ -36,6 +40,8 @@ def parse_args():
     parser.add_argument("--wandb-entity", type=str, default=None,
         help="the entity (team) of wandb's project")
 
+    parser.add_argument("--perf-metrics", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the time spent in each phase of the training loop is logged as `perf/*` scalars")
     # Algorithm specific arguments
     parser.add_argument("--env-id", type=str, default="MontezumaRevenge-v5",
         help="the id of the environment")
@@ -85,6 +91,14 @@ def parse_args():
         help="Intrinsic reward discount rate")
     parser.add_argument("--num-iterations-obs-norm-init", type=int, default=50,
         help="number of iterations to initialize the observations normalization parameters")
+    parser.add_argument("--obs-norm-init-async", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the observation normalization statistics are accumulated in a worker thread while the next batch of envs steps")
+    parser.add_argument("--obs-norm-cache-dir", type=str, default=None,
+        help="if set, the initial observation normalization statistics are cached in this directory (keyed by env id, seed and warmup size) and later runs load them instead of running the warmup")
+    parser.add_argument("--obs-norm-cache-replay", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, a run that loads cached observation normalization statistics still steps the envs through the warmup, so that its trajectories match a run without the cache")
+    parser.add_argument("--rnd-async", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the RND networks score each next-obs batch in a worker thread (on a side CUDA stream) while the rollout continues")
 
     args = parser.parse_args()
     args.batch_size = int(args.num_envs * args.num_steps)
@@ -241,6 +255,30 @@ class RewardForwardFilter:
         return self.rewems
 
 
+class FrameMoments:
+    """
+    Exact integer sums of uint8 frames, merged into a `RunningMeanStd` with its parallel (Chan et al.) update.
+
+    The merged mean and var match those of `RunningMeanStd.update` on the same frames up to floating-point rounding.
+    """
+
+    def __init__(self, shape):
+        self.sum = np.zeros(shape, dtype=np.int64)
+        self.sum_sq = np.zeros(shape, dtype=np.int64)
+        self.count = 0
+
+    def add(self, frames):
+        frames = frames.astype(np.int64)
+        self.sum += frames.sum(0)
+        self.sum_sq += np.einsum("i...,i...->...", frames, frames)
+        self.count += len(frames)
+
+    def merge_into(self, rms):
+        mean = self.sum / self.count
+        rms.update_from_moments(mean, self.sum_sq / self.count - np.square(mean), self.count)
+        self.sum[:], self.sum_sq[:], self.count = 0, 0, 0
+
+
 if __name__ == "__main__":
     args = parse_args()
     run_name = f"{args.env_id}__{args.exp_name}__{args.seed}__{int(time.time())}"
@@ -300,7 +338,7 @@ if __name__ == "__main__":
     discounted_reward = RewardForwardFilter(args.int_gamma)
 
     # ALGO Logic: Storage setup
-    obs = torch.zeros((args.num_steps, args.num_envs) + envs.single_observation_space.shape).to(device)
+    obs = torch.zeros((args.num_steps, args.num_envs) + envs.single_observation_space.shape, dtype=torch.uint8).to(device)
     actions = torch.zeros((args.num_steps, args.num_envs) + envs.single_action_space.shape).to(device)
     logprobs = torch.zeros((args.num_steps, args.num_envs)).to(device)
     rewards = torch.zeros((args.num_steps, args.num_envs)).to(device)
@@ -313,24 +351,72 @@ if __name__ == "__main__":
     # TRY NOT TO MODIFY: start the game
     global_step = 0
     start_time = time.time()
-    next_obs = torch.Tensor(envs.reset()).to(device)
+    next_obs = torch.tensor(envs.reset(), device=device)
     next_done = torch.zeros(args.num_envs).to(device)
     num_updates = args.total_timesteps // args.batch_size
 
     print("Start to initialize observation normalization parameter.....")
-    next_ob = []
-    for step in range(args.num_steps * args.num_iterations_obs_norm_init):
+    obs_rms_cache = None
+    if args.obs_norm_cache_dir is not None:
+        obs_rms_cache = os.path.join(
+            args.obs_norm_cache_dir,
+            f"{args.env_id}__{args.seed}__{args.num_envs}x{args.num_steps}x{args.num_iterations_obs_norm_init}.npz",
+        )
+    obs_rms_cached = obs_rms_cache is not None and os.path.exists(obs_rms_cache)
+    if obs_rms_cached:
+        cached = np.load(obs_rms_cache)
+        obs_rms.mean, obs_rms.var, obs_rms.count = cached["mean"], cached["var"], float(cached["count"])
+        print(f"Loaded observation normalization parameters from {obs_rms_cache}")
+    frame_moments = FrameMoments((1, 84, 84))
+    obs_norm_executor = ThreadPoolExecutor(max_workers=1) if args.obs_norm_init_async and not obs_rms_cached else None
+    futures = []
+    num_warmup_steps = (
+        0 if obs_rms_cached and not args.obs_norm_cache_replay else args.num_steps * args.num_iterations_obs_norm_init
+    )
+    for step in range(num_warmup_steps):
         acs = np.random.randint(0, envs.single_action_space.n, size=(args.num_envs,))
         s, r, d, _ = envs.step(acs)
-        next_ob += s[:, 3, :, :].reshape([-1, 1, 84, 84]).tolist()
-
-        if len(next_ob) % (args.num_steps * args.num_envs) == 0:
-            next_ob = np.stack(next_ob)
-            obs_rms.update(next_ob)
-            next_ob = []
+        if obs_rms_cached:
+            # replay the warmup so that the envs and the RNG end up where they would without the cache
+            continue
+        if obs_norm_executor is not None:
+            futures.append(obs_norm_executor.submit(frame_moments.add, s[:, 3:4]))
+        else:
+            frame_moments.add(s[:, 3:4])
+
+        if (step + 1) % args.num_steps == 0:
+            for future in futures:
+                future.result()
+            futures.clear()
+            frame_moments.merge_into(obs_rms)
+    if obs_norm_executor is not None:
+        obs_norm_executor.shutdown()
+    if obs_rms_cache is not None and not obs_rms_cached:
+        os.makedirs(args.obs_norm_cache_dir, exist_ok=True)
+        np.savez(obs_rms_cache, mean=obs_rms.mean, var=obs_rms.var, count=obs_rms.count)
     print("End to initialize...")
 
+    rnd_executor = ThreadPoolExecutor(max_workers=1) if args.rnd_async else None
+    rnd_stream = torch.cuda.Stream() if args.rnd_async and device.type == "cuda" else None
+    rnd_futures = []
+
+    def compute_curiosity_rewards(step, next_obs, obs_rms_mean, obs_rms_std):
+        with torch.no_grad(), torch.cuda.stream(rnd_stream):
+            rnd_next_obs = ((next_obs[:, 3:4] - obs_rms_mean) / obs_rms_std).clip(-5, 5).float()
+            predict_next_feature, target_next_feature = rnd_model(rnd_next_obs)
+            curiosity_rewards[step] = (target_next_feature - predict_next_feature).pow(2).sum(1) / 2
+
+    def wait_curiosity_rewards():
+        for future in rnd_futures:
+            future.result()
+        rnd_futures.clear()
+        if rnd_stream is not None:
+            torch.cuda.current_stream().wait_stream(rnd_stream)
+
+    timer = PhaseTimer(args.perf_metrics, torch.cuda.synchronize if device.type == "cuda" else None)
     for update in range(1, num_updates + 1):
+        obs_rms_mean = torch.from_numpy(obs_rms.mean).to(device)
+        obs_rms_std = torch.sqrt(torch.from_numpy(obs_rms.var).to(device))
         # Annealing the rate if instructed to do so.
         if args.anneal_lr:
             frac = 1.0 - (update - 1.0) / num_updates
@@ -343,32 +429,39 @@ if __name__ == "__main__":
             dones[step] = next_done
 
             # ALGO LOGIC: action logic
+            timer.start("inference")
             with torch.no_grad():
-                value_ext, value_int = agent.get_value(obs[step])
+                # a single pass through the trunk gives the action and both critics
+                action, logprob, _, value_ext, value_int = agent.get_action_and_value(obs[step])
                 ext_values[step], int_values[step] = (
                     value_ext.flatten(),
                     value_int.flatten(),
                 )
-                action, logprob, _, _, _ = agent.get_action_and_value(obs[step])
 
             actions[step] = action
             logprobs[step] = logprob
+            action = action.cpu().numpy()
+            timer.stop("inference")
 
             # TRY NOT TO MODIFY: execute the game and log data.
-            next_obs, reward, done, info = envs.step(action.cpu().numpy())
+            timer.start("env_step")
+            next_obs, reward, done, info = envs.step(action)
+            timer.stop("env_step")
             rewards[step] = torch.tensor(reward).to(device).view(-1)
-            next_obs, next_done = torch.Tensor(next_obs).to(device), torch.Tensor(done).to(device)
-            rnd_next_obs = (
-                (
-                    (next_obs[:, 3, :, :].reshape(args.num_envs, 1, 84, 84) - torch.from_numpy(obs_rms.mean).to(device))
-                    / torch.sqrt(torch.from_numpy(obs_rms.var).to(device))
-                ).clip(-5, 5)
-            ).float()
-            target_next_feature = rnd_model.target(rnd_next_obs)
-            predict_next_feature = rnd_model.predictor(rnd_next_obs)
-            curiosity_rewards[step] = ((target_next_feature - predict_next_feature).pow(2).sum(1) / 2).data
+            next_obs, next_done = torch.tensor(next_obs, device=device), torch.Tensor(done).to(device)
+
+            timer.start("curiosity")
+            if args.rnd_async:
+                if rnd_stream is not None:
+                    rnd_stream.wait_stream(torch.cuda.current_stream())
+                    next_obs.record_stream(rnd_stream)
+                rnd_futures.append(rnd_executor.submit(compute_curiosity_rewards, step, next_obs, obs_rms_mean, obs_rms_std))
+            else:
+                compute_curiosity_rewards(step, next_obs, obs_rms_mean, obs_rms_std)
+            timer.stop("curiosity")
             for idx, d in enumerate(done):
                 if d and info["lives"][idx] == 0:
+                    wait_curiosity_rewards()
                     avg_returns.append(info["r"][idx])
                     epi_ret = np.average(avg_returns)
                     print(
@@ -383,6 +476,8 @@ if __name__ == "__main__":
                     )
                     writer.add_scalar("charts/episodic_length", info["l"][idx], global_step)
 
+        with timer("curiosity_wait"):
+            wait_curiosity_rewards()
         curiosity_reward_per_env = np.array(
             [discounted_reward.update(reward_per_step) for reward_per_step in curiosity_rewards.cpu().data.numpy().T]
         )
@@ -399,31 +494,19 @@ if __name__ == "__main__":
         with torch.no_grad():
             next_value_ext, next_value_int = agent.get_value(next_obs)
             next_value_ext, next_value_int = next_value_ext.reshape(1, -1), next_value_int.reshape(1, -1)
-            ext_advantages = torch.zeros_like(rewards, device=device)
-            int_advantages = torch.zeros_like(curiosity_rewards, device=device)
-            ext_lastgaelam = 0
-            int_lastgaelam = 0
-            for t in reversed(range(args.num_steps)):
-                if t == args.num_steps - 1:
-                    ext_nextnonterminal = 1.0 - next_done
-                    int_nextnonterminal = 1.0
-                    ext_nextvalues = next_value_ext
-                    int_nextvalues = next_value_int
-                else:
-                    ext_nextnonterminal = 1.0 - dones[t + 1]
-                    int_nextnonterminal = 1.0
-                    ext_nextvalues = ext_values[t + 1]
-                    int_nextvalues = int_values[t + 1]
-                ext_delta = rewards[t] + args.gamma * ext_nextvalues * ext_nextnonterminal - ext_values[t]
-                int_delta = curiosity_rewards[t] + args.int_gamma * int_nextvalues * int_nextnonterminal - int_values[t]
-                ext_advantages[t] = ext_lastgaelam = (
-                    ext_delta + args.gamma * args.gae_lambda * ext_nextnonterminal * ext_lastgaelam
-                )
-                int_advantages[t] = int_lastgaelam = (
-                    int_delta + args.int_gamma * args.gae_lambda * int_nextnonterminal * int_lastgaelam
-                )
-            ext_returns = ext_advantages + ext_values
-            int_returns = int_advantages + int_values
+            ext_advantages, ext_returns = compute_gae(
+                rewards, ext_values, dones, next_value_ext, next_done, args.gamma, args.gae_lambda
+            )
+            # the intrinsic reward stream is non-episodic
+            int_advantages, int_returns = compute_gae(
+                curiosity_rewards,
+                int_values,
+                torch.zeros_like(dones),
+                next_value_int,
+                torch.zeros_like(next_done),
+                args.int_gamma,
+                args.gae_lambda,
+            )
 
         # flatten the batch
         b_obs = obs.reshape((-1,) + envs.single_observation_space.shape)
@@ -440,6 +523,7 @@ if __name__ == "__main__":
         obs_rms.update(b_obs[:, 3, :, :].reshape(-1, 1, 84, 84).cpu().numpy())
 
         # Optimizing the policy and value network
+        timer.start("update")
         b_inds = np.arange(args.batch_size)
 
         rnd_next_obs = (
@@ -520,6 +604,8 @@ if __name__ == "__main__":
                 if approx_kl > args.target_kl:
                     break
 
+        timer.stop("update")
+
         # TRY NOT TO MODIFY: record rewards for plotting purposes
         writer.add_scalar("charts/learning_rate", optimizer.param_groups[0]["lr"], global_step)
         writer.add_scalar("losses/value_loss", v_loss.item(), global_step)
@@ -530,6 +616,9 @@ if __name__ == "__main__":
         writer.add_scalar("losses/approx_kl", approx_kl.item(), global_step)
         print("SPS:", int(global_step / (time.time() - start_time)))
         writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
+        timer.write(writer, global_step)
 
     envs.close()
+    if rnd_executor is not None:
+        rnd_executor.shutdown()
     writer.close()
@@ -22,6 +22,8 @@ from stable_baselines3.common.buffers import ReplayBuffer
 from torch.distributions.categorical import Categorical
 from torch.utils.tensorboard import SummaryWriter
 
+from cleanrl_utils.buffers import FrameStackReplayBuffer, PrefetchReplayBuffer
+
 
 def parse_args():
     # fmt: off
@@ -72,6 +74,8 @@ def parse_args():
         help="automatic tuning of the entropy coefficient")
     parser.add_argument("--target-entropy-scale", type=float, default=0.89,
         help="coefficient for scaling the autotune entropy target")
+    parser.add_argument("--prefetch-batches", type=int, default=0,
+        help="if positive, the number of batches sampled ahead by a background thread (`cleanrl_utils.buffers.PrefetchReplayBuffer`)")
     args = parser.parse_args()
     # fmt: on
     return args
@@ -226,13 +230,22 @@ if __name__ == "__main__":
     else:
         alpha = args.alpha
 
-    rb = ReplayBuffer(
-        args.buffer_size,
-        envs.single_observation_space,
-        envs.single_action_space,
-        device,
-        handle_timeout_termination=True,
-    )
+    if args.prefetch_batches > 0:
+        rb = PrefetchReplayBuffer(
+            FrameStackReplayBuffer(args.buffer_size, envs.single_observation_space, envs.single_action_space, device),
+            args.batch_size,
+            prefetch=args.prefetch_batches,
+            seed=args.seed,
+            handle_timeout_termination=True,
+        )
+    else:
+        rb = ReplayBuffer(
+            args.buffer_size,
+            envs.single_observation_space,
+            envs.single_action_space,
+            device,
+            handle_timeout_termination=True,
+        )
     start_time = time.time()
 
     # TRY NOT TO MODIFY: start the game
@@ -338,5 +351,7 @@ if __name__ == "__main__":
                 if args.autotune:
                     writer.add_scalar("losses/alpha_loss", alpha_loss.item(), global_step)
 
+    if args.prefetch_batches > 0:
+        rb.close()
     envs.close()
     writer.close()
@@ -0,0 +1,95 @@
+"""
+Atari-shaped stub environments for throughput benchmarks on machines without the Atari ROMs.
+
+They have the observation and action spaces of an ALE game and the `ale.lives()` and
+`get_action_meanings()` the Atari wrappers use, but only return a fixed frame, so the measured time
+is spent in the wrappers and the agent instead of the emulator. Importing this module registers
+`AtariStub-v0` in `gym` and `gymnasium`, so the Atari scripts can use them with `--env-id AtariStub-v0`
+once it is imported (`cleanrl_utils.perf` does so before running the script).
+"""
+import numpy as np
+
+try:
+    import gym
+except ImportError:
+    gym = None
+try:
+    import gymnasium
+except ImportError:
+    gymnasium = None
+
+EPISODE_LENGTH = 1000
+NUM_LIVES = 5
+
+
+class ALEStub:
+    def __init__(self):
+        self.num_lives = NUM_LIVES
+
+    def lives(self):
+        return self.num_lives
+
+
+class AtariStubMixin:
+    def _init_stub(self, spaces):
+        self.observation_space = spaces.Box(0, 255, (210, 160, 3), np.uint8)
+        self.action_space = spaces.Discrete(4)
+        self.frame = np.random.default_rng(0).integers(0, 256, (210, 160, 3), dtype=np.uint8)
+        self.ale = ALEStub()
+        self.t = 0
+
+    def get_action_meanings(self):
+        return ["NOOP", "FIRE", "RIGHT", "LEFT"]
+
+    def _reset_stub(self):
+        self.t = 0
+        self.ale.num_lives = NUM_LIVES
+        return self.frame.copy()
+
+    def _step_stub(self):
+        self.t += 1
+        if self.t % (EPISODE_LENGTH // NUM_LIVES) == 0:
+            self.ale.num_lives -= 1
+        return self.frame.copy(), float(self.t % 7 == 0), self.t >= EPISODE_LENGTH
+
+
+if gym is not None:
+
+    class AtariStubEnv(AtariStubMixin, gym.Env):
+        metadata = {"render.modes": []}
+
+        def __init__(self):
+            self._init_stub(gym.spaces)
+            self.np_random = np.random.RandomState(0)
+
+        def seed(self, seed=None):
+            self.np_random = np.random.RandomState(seed)
+            return [seed]
+
+        def reset(self, **kwargs):
+            return self._reset_stub()
+
+        def step(self, action):
+            obs, reward, done = self._step_stub()
+            return obs, reward, done, {}
+
+    gym.register("AtariStub-v0", entry_point=AtariStubEnv)
+
+
+if gymnasium is not None:
+
+    class GymnasiumAtariStubEnv(AtariStubMixin, gymnasium.Env):
+        metadata = {"render_modes": []}
+
+        def __init__(self):
+            self._init_stub(gymnasium.spaces)
+
+        def reset(self, seed=None, options=None):
+            super().reset(seed=seed)
+            return self._reset_stub(), {}
+
+        def step(self, action):
+            obs, reward, terminated = self._step_stub()
+            return obs, reward, terminated, False, {}
+
+    gymnasium.register("AtariStub-v0", entry_point=GymnasiumAtariStubEnv)
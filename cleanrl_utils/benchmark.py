@@ -1,11 +1,20 @@
 import argparse
+import json
 import os
+import queue
+import re
 import shlex
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 from distutils.util import strtobool
 
 import requests
 
+from cleanrl_utils.fork_server import ForkServer, tail_log
+
 
 def parse_args():
     # fmt: off
@@ -19,7 +28,21 @@ def parse_args():
     parser.add_argument("--start-seed", type=int, default=1,
         help="the number of the starting seed")
     parser.add_argument("--workers", type=int, default=0,
-        help="the number of workers to run benchmark experimenets")
+        help="the number of workers to run benchmark experiments")
+    parser.add_argument("--threads-per-job", type=int, default=0,
+        help="the number of cores each experiment is pinned to (and its `OMP_NUM_THREADS`); 0 splits the cores evenly across the workers")
+    parser.add_argument("--memory-per-job", type=float, default=0,
+        help="the memory footprint of each experiment in GB; if positive, no more experiments run at once than fit in the memory of the machine")
+    parser.add_argument("--gpus", nargs="*", type=str, default=[],
+        help="the ids of the GPUs to assign to the experiments through `CUDA_VISIBLE_DEVICES`")
+    parser.add_argument("--jobs-per-gpu", type=int, default=1,
+        help="the number of experiments that share a GPU of `--gpus`")
+    parser.add_argument("--max-retries", type=int, default=1,
+        help="the number of times a failed experiment is requeued")
+    parser.add_argument("--ledger", type=str, default="benchmark_ledger.json",
+        help="the path of the JSON ledger of the wall time and SPS of every experiment")
+    parser.add_argument("--fork-server", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the experiments are forked from a server that has already imported torch, gym, etc. instead of started from scratch")
     parser.add_argument("--auto-tag", type=lambda x: bool(strtobool(x)), default=True, nargs="?", const=True,
         help="if toggled, the runs will be tagged with git tags, commit, and pull request number if possible")
     args = parser.parse_args()
@@ -27,12 +50,103 @@ def parse_args():
     return args
 
 
-def run_experiment(command: str):
+def run_experiment(command: str, cores=None, env=None, fork_server=None):
     command_list = shlex.split(command)
-    print(f"running {command}")
-    fd = subprocess.Popen(command_list)
+    print(f"running {command}" + (f" on cores {cores}" if cores else ""))
+    start_time = time.time()
+    sps = None
+    if fork_server is not None:
+        with tempfile.NamedTemporaryFile("r") as log:
+            forked_run = fork_server.start(command, log.name, env, cores)
+            # echo the log of the experiment while it runs
+            for line in tail_log(log, lambda: forked_run.poll() is None):
+                sys.stdout.write(line)
+                match = re.search(r"SPS: (\d+)", line)
+                if match:
+                    sps = int(match.group(1))
+            return_code = forked_run.wait()
+        print(f"saved {forked_run.startup_time_saved:.2f}s of startup time on {command}")
+        return return_code, time.time() - start_time, sps, forked_run.startup_time_saved
+    # the process inherits the affinity of the worker thread, pinned to `cores` by `run_worker`
+    fd = subprocess.Popen(command_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    for line in fd.stdout:
+        sys.stdout.write(line)
+        match = re.search(r"SPS: (\d+)", line)
+        if match:
+            sps = int(match.group(1))
     return_code = fd.wait()
-    assert return_code == 0
+    return return_code, time.time() - start_time, sps, 0.0
+
+
+def make_slots(args):
+    """
+    Split the machine into `args.workers` slots with disjoint core sets, a GPU (if `--gpus`), and
+    enough memory (if `--memory-per-job`) for one experiment each.
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    num_slots = args.workers
+    threads_per_job = args.threads_per_job
+    if len(cores) > 0:
+        threads_per_job = threads_per_job or max(len(cores) // num_slots, 1)
+        num_slots = min(num_slots, max(len(cores) // threads_per_job, 1))
+    if args.memory_per_job > 0:
+        total_memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30
+        num_slots = min(num_slots, max(int(total_memory // args.memory_per_job), 1))
+    if len(args.gpus) > 0:
+        num_slots = min(num_slots, len(args.gpus) * args.jobs_per_gpu)
+    if num_slots < args.workers:
+        print(f"running {num_slots} experiments at once instead of --workers {args.workers} to avoid oversubscription")
+
+    slots = []
+    for i in range(num_slots):
+        env = dict(os.environ)
+        slot_cores = None
+        if len(cores) > 0:
+            slot_cores = cores[i * threads_per_job : (i + 1) * threads_per_job]
+            # `torch` uses `OMP_NUM_THREADS` as its default number of threads
+            env["OMP_NUM_THREADS"] = env["MKL_NUM_THREADS"] = str(threads_per_job)
+        if len(args.gpus) > 0:
+            env["CUDA_VISIBLE_DEVICES"] = args.gpus[i // args.jobs_per_gpu]
+        slots += [(slot_cores, env)]
+    return slots
+
+
+def run_worker(slot, jobs: queue.Queue, ledger: list, ledger_lock: threading.Lock, args, fork_server=None):
+    cores, env = slot
+    if cores:
+        # on Linux, pid 0 is the calling thread: only this worker and the experiments it starts are pinned,
+        # without the `preexec_fn` that `subprocess` cannot safely run in a multi-threaded process
+        os.sched_setaffinity(0, cores)
+    while True:
+        try:
+            job = jobs.get_nowait()
+        except queue.Empty:
+            return
+        return_code, wall_time, sps, startup_time_saved = run_experiment(job["command"], cores, env, fork_server)
+        with ledger_lock:
+            ledger += [
+                dict(
+                    job,
+                    return_code=return_code,
+                    wall_time=wall_time,
+                    sps=sps,
+                    cores=cores,
+                    startup_time_saved=startup_time_saved,
+                )
+            ]
+            with open(args.ledger, "w") as f:
+                json.dump(ledger, f, indent=2)
+        if return_code != 0:
+            if job["attempt"] < args.max_retries:
+                print(f"requeueing {job['command']}, which failed with return code {return_code}")
+                jobs.put(dict(job, attempt=job["attempt"] + 1))
+            else:
+                print(f"giving up on {job['command']}, which failed with return code {return_code}")
+
+
+def failed_commands(ledger: list, max_retries: int):
+    """The commands of the ledger that failed on their last attempt."""
+    return [entry["command"] for entry in ledger if entry["return_code"] != 0 and entry["attempt"] == max_retries]
 
 
 def autotag() -> str:
@@ -74,20 +188,39 @@ if __name__ == "__main__":
             os.environ["WANDB_TAGS"] = wandb_tag
 
     commands = []
+    jobs = queue.Queue()
     for seed in range(0, args.num_seeds):
         for env_id in args.env_ids:
             commands += [" ".join([args.command, "--env-id", env_id, "--seed", str(args.start_seed + seed)])]
+            jobs.put(dict(command=commands[-1], env_id=env_id, seed=args.start_seed + seed, attempt=0))
 
     print("======= commands to run:")
     for command in commands:
         print(command)
 
     if args.workers > 0:
-        from concurrent.futures import ThreadPoolExecutor
-
-        executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="cleanrl-benchmark-worker-")
-        for command in commands:
-            executor.submit(run_experiment, command)
-        executor.shutdown(wait=True)
+        ledger, ledger_lock = [], threading.Lock()
+        fork_server = None
+        if args.fork_server:
+            fork_server = ForkServer()
+        workers = [
+            threading.Thread(
+                target=run_worker,
+                args=(slot, jobs, ledger, ledger_lock, args, fork_server),
+                name=f"cleanrl-benchmark-worker-{i}",
+            )
+            for i, slot in enumerate(make_slots(args))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        failed = failed_commands(ledger, args.max_retries)
+        print(f"======= ledger of {len(ledger)} runs saved to {args.ledger}")
+        if len(failed) > 0:
+            print("======= failed commands:")
+            for command in failed:
+                print(command)
+            sys.exit(1)
     else:
         print("not running the experiments because --workers is set to 0; just printing the commands to run")
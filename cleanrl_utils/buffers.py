@@ -1,20 +1,6 @@
 import numpy as np
 
 
-def unique(sorted_array):
-    """
-    More efficient implementation of np.unique for sorted arrays
-    :param sorted_array: (np.ndarray)
-    :return:(np.ndarray) sorted_array without duplicate elements
-    """
-    if len(sorted_array) == 1:
-        return sorted_array
-    left = sorted_array[:-1]
-    right = sorted_array[1:]
-    uniques = np.append(right != left, True)
-    return sorted_array[uniques]
-
-
 class SegmentTree:
     def __init__(self, capacity, operation, neutral_element):
         """
@@ -31,32 +17,24 @@ class SegmentTree:
                `reduce` operation which reduces `operation` over
                a contiguous subsequence of items in the array.
 
+        The tree is stored in a single contiguous numpy array of size `2 * capacity`:
+        node `i` has children `2 * i` and `2 * i + 1`, the root is node `1` and the
+        leaves live in `[capacity, 2 * capacity)`. Both `reduce` and `__setitem__` walk
+        the tree bottom-up one level at a time, so batched queries and updates cost
+        `O(lg capacity)` vectorized numpy operations instead of Python recursion.
+
         :param capacity: (int) Total size of the array - must be a power of two.
-        :param operation: (lambda (Any, Any): Any) operation for combining elements (eg. sum, max) must form a
+        :param operation: (np.ufunc) operation for combining elements (eg. np.add, np.minimum) must form a
             mathematical group together with the set of possible values for array elements (i.e. be associative)
         :param neutral_element: (Any) neutral element for the operation above. eg. float('-inf') for max and 0 for sum.
         """
         assert capacity > 0 and capacity & (capacity - 1) == 0, "capacity must be positive and a power of 2."
         self._capacity = capacity
-        self._value = [neutral_element for _ in range(2 * capacity)]
+        self._depth = capacity.bit_length() - 1
+        self._value = np.full(2 * capacity, neutral_element, dtype=np.float64)
         self._operation = operation
         self.neutral_element = neutral_element
 
-    def _reduce_helper(self, start, end, node, node_start, node_end):
-        if start == node_start and end == node_end:
-            return self._value[node]
-        mid = (node_start + node_end) // 2
-        if end <= mid:
-            return self._reduce_helper(start, end, 2 * node, node_start, mid)
-        else:
-            if mid + 1 <= start:
-                return self._reduce_helper(start, end, 2 * node + 1, mid + 1, node_end)
-            else:
-                return self._operation(
-                    self._reduce_helper(start, mid, 2 * node, node_start, mid),
-                    self._reduce_helper(mid + 1, end, 2 * node + 1, mid + 1, node_end),
-                )
-
     def reduce(self, start=0, end=None):
         """
         Returns result of applying `self.operation`
@@ -64,30 +42,70 @@ class SegmentTree:
 
             self.operation(arr[start], operation(arr[start+1], operation(... arr[end])))
 
-        :param start: (int) beginning of the subsequence
-        :param end: (int) end of the subsequences
+        `start` and `end` may also be integer arrays of the same shape, in which case
+        all the ranges are reduced at once and an array of results is returned.
+
+        :param start: (int or np.ndarray) beginning of the subsequence
+        :param end: (int or np.ndarray) end of the subsequences
         :return: (Any) result of reducing self.operation over the specified range of array elements.
         """
         if end is None:
             end = self._capacity
-        if end < 0:
-            end += self._capacity
-        end -= 1
-        return self._reduce_helper(start, end, 1, 0, self._capacity - 1)
+        if np.isscalar(start) and np.isscalar(end):
+            if end < 0:
+                end += self._capacity
+            if start == 0 and end == self._capacity:
+                # the root already holds the reduction over the whole array
+                return self._value[1]
+            return self._reduce_scalar(start, end)
+        start, end = np.broadcast_arrays(np.asarray(start, dtype=np.int64), np.asarray(end, dtype=np.int64))
+        end = np.where(end < 0, end + self._capacity, end)
+        return self._reduce_batch(start, end)
+
+    def _reduce_scalar(self, start, end):
+        # iterative bottom-up reduction over the half-open leaf range [start, end)
+        result = self.neutral_element
+        start += self._capacity
+        end += self._capacity
+        while start < end:
+            if start & 1:
+                result = self._operation(result, self._value[start])
+                start += 1
+            if end & 1:
+                end -= 1
+                result = self._operation(result, self._value[end])
+            start >>= 1
+            end >>= 1
+        return result
+
+    def _reduce_batch(self, start, end):
+        # same walk as `_reduce_scalar`, applied to every range at once with masks;
+        # masked-out ranges may point one past the last node, hence the clipped gathers
+        result = np.full(start.shape, self.neutral_element, dtype=self._value.dtype)
+        start = start + self._capacity
+        end = end + self._capacity
+        for _ in range(self._depth + 1):
+            take_start = (start < end) & (start & 1 == 1)
+            result = np.where(take_start, self._operation(result, self._value.take(start, mode="clip")), result)
+            start = start + take_start
+            take_end = (start < end) & (end & 1 == 1)
+            end = end - take_end
+            result = np.where(take_end, self._operation(result, self._value.take(end, mode="clip")), result)
+            start >>= 1
+            end >>= 1
+        return result
 
     def __setitem__(self, idx, val):
         # indexes of the leaf
-        idxs = idx + self._capacity
+        idxs = np.asarray(idx) + self._capacity
         self._value[idxs] = val
-        if isinstance(idxs, int):
-            idxs = np.array([idxs])
-        # go up one level in the tree and remove duplicate indexes
-        idxs = unique(idxs // 2)
-        while len(idxs) > 1 or idxs[0] > 0:
-            # as long as there are non-zero indexes, update the corresponding values
+        # remove duplicate indexes once; siblings sharing a parent only cause a redundant
+        # (but identical) write, which is cheaper than deduplicating at every level
+        idxs = np.unique(idxs)
+        for _ in range(self._depth):
+            # go up one level in the tree and recompute all touched parents at once
+            idxs = idxs // 2
             self._value[idxs] = self._operation(self._value[2 * idxs], self._value[2 * idxs + 1])
-            # go up one level in the tree and remove duplicate indexes
-            idxs = unique(idxs // 2)
 
     def __getitem__(self, idx):
         assert np.max(idx) < self._capacity
@@ -98,7 +116,6 @@ class SegmentTree:
 class SumSegmentTree(SegmentTree):
     def __init__(self, capacity):
         super().__init__(capacity=capacity, operation=np.add, neutral_element=0.0)
-        self._value = np.array(self._value)
 
     def sum(self, start=0, end=None):
         """
@@ -128,26 +145,22 @@ class SumSegmentTree(SegmentTree):
         assert np.max(prefixsum) <= self.sum() + 1e-5
         assert isinstance(prefixsum[0], float)
 
-        idx = np.ones(len(prefixsum), dtype=int)
-        cont = np.ones(len(prefixsum), dtype=bool)
-
-        while np.any(cont):  # while not all nodes are leafs
-            idx[cont] = 2 * idx[cont]
-            prefixsum_new = np.where(self._value[idx] <= prefixsum, prefixsum - self._value[idx], prefixsum)
-            # prepare update of prefixsum for all right children
-            idx = np.where(np.logical_or(self._value[idx] > prefixsum, np.logical_not(cont)), idx, idx + 1)
-            # Select child node for non-leaf nodes
-            prefixsum = prefixsum_new
-            # update prefixsum
-            cont = idx < self._capacity
-            # collect leafs
+        prefixsum = np.array(prefixsum, dtype=np.float64)
+        idx = np.ones(len(prefixsum), dtype=np.int64)
+        # all the leaves sit at the same depth, so every query descends exactly `self._depth` levels
+        for _ in range(self._depth):
+            idx *= 2
+            left = self._value[idx]
+            go_right = left <= prefixsum
+            # update prefixsum for all right children and select the child node
+            prefixsum -= np.where(go_right, left, 0.0)
+            idx += go_right
         return idx - self._capacity
 
 
 class MinSegmentTree(SegmentTree):
     def __init__(self, capacity):
         super().__init__(capacity=capacity, operation=np.minimum, neutral_element=float("inf"))
-        self._value = np.array(self._value)
 
     def min(self, start=0, end=None):
         """
@@ -160,9 +173,17 @@ class MinSegmentTree(SegmentTree):
         return super().reduce(start, end)
 
 
+import mmap
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
 import warnings
+import weakref
 from abc import ABC, abstractmethod
-from typing import Dict, Generator, NamedTuple, Optional, Union
+from typing import Any, Dict, Generator, List, NamedTuple, Optional, Union
 
 import numpy as np
 import torch as th
@@ -174,6 +195,12 @@ try:
 except ImportError:
     psutil = None
 
+try:
+    # Count page faults of memory-mapped storage when possible
+    import resource
+except ImportError:
+    resource = None
+
 from stable_baselines3.common.preprocessing import get_action_dim, get_obs_shape
 from stable_baselines3.common.type_aliases import (
     ReplayBufferSamples,
@@ -181,6 +208,8 @@ from stable_baselines3.common.type_aliases import (
 )
 from stable_baselines3.common.vec_env import VecNormalize
 
+from cleanrl_utils.gae import compute_gae
+
 
 class PrioritizedReplayBufferSamples(NamedTuple):
     observations: th.Tensor
@@ -267,6 +296,13 @@ class BaseBuffer(ABC):
         self.pos = 0
         self.full = False
 
+    @staticmethod
+    def _randint(low: int, high: int, size: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        # the global `np.random` state, unless the caller has its own generator (e.g. a sampling thread)
+        if rng is None:
+            return np.random.randint(low, high, size=size)
+        return rng.integers(low, high, size=size)
+
     def sample(self, batch_size: int, env: Optional[VecNormalize] = None):
         """
         :param batch_size: Number of element to sample
@@ -332,6 +368,13 @@ class ReplayBuffer(BaseBuffer):
         at a cost of more complexity.
         See https://github.com/DLR-RM/stable-baselines3/issues/37#issuecomment-637501195
         and https://github.com/DLR-RM/stable-baselines3/pull/28#issuecomment-637559274
+    :param storage: Where to store the observations, either ``"memory"`` or ``"memmap"``.
+        With ``"memmap"``, observations and next observations are backed by ``np.memmap`` files
+        in a new temporary directory so that buffers larger than the RAM can be used; the page cache keeps
+        the hot part of the buffer in memory. See ``storage_stats`` for page-fault and read-latency counters.
+    :param storage_dir: Parent directory of the temporary directory of the memory-mapped files
+        (e.g. a large local disk), defaults to the system temporary directory;
+        only used with ``storage="memmap"``
     """
 
     def __init__(
@@ -342,30 +385,46 @@ class ReplayBuffer(BaseBuffer):
         device: Union[th.device, str] = "cpu",
         n_envs: int = 1,
         optimize_memory_usage: bool = False,
+        storage: str = "memory",
+        storage_dir: Optional[str] = None,
     ):
         super().__init__(buffer_size, observation_space, action_space, device, n_envs=n_envs)
 
-        assert n_envs == 1, "Replay buffer only support single environment for now"
+        if storage not in ["memory", "memmap"]:
+            raise ValueError(f"Unknown storage {storage}")
 
         # Check that the replay buffer can fit into the memory
         if psutil is not None:
             mem_available = psutil.virtual_memory().available
 
         self.optimize_memory_usage = optimize_memory_usage
-        self.observations = np.zeros((self.buffer_size, self.n_envs) + self.obs_shape, dtype=observation_space.dtype)
+        self.storage = storage
+        self.storage_dir = None
+        if storage == "memmap":
+            # a directory per buffer, so that several buffers can share `storage_dir`
+            if storage_dir is not None:
+                os.makedirs(storage_dir, exist_ok=True)
+            self.storage_dir = tempfile.mkdtemp(prefix="replay_buffer_", dir=storage_dir)
+            # the files can be many GB: delete them when the buffer is garbage collected or the interpreter exits,
+            # even if `close` is never called
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self.storage_dir, ignore_errors=True)
+        self._num_reads, self._read_time, self._major_page_faults, self._minor_page_faults = 0, 0.0, 0, 0
+        self.observations = self._allocate_observations("observations")
         if optimize_memory_usage:
             # `observations` contains also the next observation
             self.next_observations = None
         else:
-            self.next_observations = np.zeros((self.buffer_size, self.n_envs) + self.obs_shape, dtype=observation_space.dtype)
+            self.next_observations = self._allocate_observations("next_observations")
         self.actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=action_space.dtype)
         self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
         self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
 
         if psutil is not None:
-            total_memory_usage = self.observations.nbytes + self.actions.nbytes + self.rewards.nbytes + self.dones.nbytes
-            if self.next_observations is not None:
-                total_memory_usage += self.next_observations.nbytes
+            total_memory_usage = self.actions.nbytes + self.rewards.nbytes + self.dones.nbytes
+            if self.storage == "memory":
+                total_memory_usage += self.observations.nbytes
+                if self.next_observations is not None:
+                    total_memory_usage += self.next_observations.nbytes
 
             if total_memory_usage > mem_available:
                 # Convert to GB
@@ -376,6 +435,75 @@ class ReplayBuffer(BaseBuffer):
                     f"replay buffer {total_memory_usage:.2f}GB > {mem_available:.2f}GB"
                 )
 
+    def _allocate_observations(self, name: str) -> np.ndarray:
+        """
+        Allocate a ``(buffer_size, n_envs) + obs_shape`` observation array, either in memory
+        or backed by a memory-mapped file.
+
+        In the file, every observation starts at an offset that keeps it within as few pages as
+        possible: observations smaller than a page are padded to a power of two so that none
+        straddles a page boundary, larger ones are padded to a whole number of pages.
+        A random batch gather then touches the minimal number of pages.
+
+        :param name: name of the array, used as file name
+        :return: the observation array
+        """
+        shape = (self.buffer_size, self.n_envs) + self.obs_shape
+        dtype = self.observation_space.dtype
+        if self.storage == "memory":
+            return np.zeros(shape, dtype=dtype)
+
+        obs_nbytes = int(np.prod(self.obs_shape)) * dtype.itemsize
+        if obs_nbytes >= mmap.PAGESIZE:
+            stride = -(-obs_nbytes // mmap.PAGESIZE) * mmap.PAGESIZE
+        else:
+            stride = 1 << (obs_nbytes - 1).bit_length()
+        path = os.path.join(self.storage_dir, f"{name}.memmap")
+        raw = np.memmap(path, dtype=np.uint8, mode="w+", shape=(self.buffer_size * self.n_envs, stride))
+        obs_strides = np.zeros(self.obs_shape, dtype=dtype).strides
+        return np.ndarray(shape, dtype=dtype, buffer=raw, strides=(self.n_envs * stride, stride) + obs_strides)
+
+    def _read_observations(self, array: np.ndarray, batch_inds: np.ndarray, env_indices: np.ndarray) -> np.ndarray:
+        if self.storage == "memory":
+            return array[batch_inds, env_indices, :]
+        # gather with the page-fault and latency counters of the memory-mapped storage
+        usage = resource.getrusage(resource.RUSAGE_SELF) if resource is not None else None
+        start_time = time.perf_counter()
+        data = array[batch_inds, env_indices, :]
+        self._read_time += time.perf_counter() - start_time
+        self._num_reads += 1
+        if usage is not None:
+            new_usage = resource.getrusage(resource.RUSAGE_SELF)
+            self._major_page_faults += new_usage.ru_majflt - usage.ru_majflt
+            self._minor_page_faults += new_usage.ru_minflt - usage.ru_minflt
+        return data
+
+    def storage_stats(self) -> Dict[str, float]:
+        """
+        Counters of the memory-mapped storage, accumulated over the observation reads done
+        when sampling: the number of reads, the page faults they caused (major faults hit the disk)
+        and their average latency in milliseconds.
+
+        :return: dictionary of counters, empty with ``storage="memory"``
+        """
+        if self.storage == "memory":
+            return {}
+        return {
+            "num_reads": self._num_reads,
+            "major_page_faults": self._major_page_faults,
+            "minor_page_faults": self._minor_page_faults,
+            "read_latency_ms": 1000 * self._read_time / max(self._num_reads, 1),
+        }
+
+    def close(self) -> None:
+        """
+        Release the memory-mapped storage and delete its files and directory.
+        """
+        self.observations, self.next_observations = None, None
+        if self.storage_dir is not None:
+            self._finalizer()
+            self.storage_dir = None
+
     def add(self, obs: np.ndarray, next_obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray) -> None:
         # Copy to avoid modification by reference
         self.observations[self.pos] = np.array(obs).copy()
@@ -384,7 +512,8 @@ class ReplayBuffer(BaseBuffer):
         else:
             self.next_observations[self.pos] = np.array(next_obs).copy()
 
-        self.actions[self.pos] = np.array(action).copy()
+        # Reshape to write the `(n_envs,)` actions of discrete action spaces in one go
+        self.actions[self.pos] = np.array(action).reshape((self.n_envs, self.action_dim)).copy()
         self.rewards[self.pos] = np.array(reward).copy()
         self.dones[self.pos] = np.array(done).copy()
 
@@ -405,30 +534,374 @@ class ReplayBuffer(BaseBuffer):
             to normalize the observations/rewards when sampling
         :return:
         """
+        return self._get_samples(self._sample_batch_inds(batch_size), env=env)
+
+    def _sample_batch_inds(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
         if not self.optimize_memory_usage:
-            return super().sample(batch_size=batch_size, env=env)
+            upper_bound = self.buffer_size if self.full else self.pos
+            return self._randint(0, upper_bound, batch_size, rng)
         # Do not sample the element with index `self.pos` as the transitions is invalid
         # (we use only one array to store `obs` and `next_obs`)
         if self.full:
-            batch_inds = (np.random.randint(1, self.buffer_size, size=batch_size) + self.pos) % self.buffer_size
-        else:
-            batch_inds = np.random.randint(0, self.pos, size=batch_size)
-        return self._get_samples(batch_inds, env=env)
+            return (self._randint(1, self.buffer_size, batch_size, rng) + self.pos) % self.buffer_size
+        return self._randint(0, self.pos, batch_size, rng)
 
     def _get_samples(self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None) -> ReplayBufferSamples:
+        return ReplayBufferSamples(*tuple(map(self.to_torch, self._get_arrays(batch_inds, env))))
+
+    def _get_arrays(
+        self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None, rng: Optional[np.random.Generator] = None
+    ) -> tuple:
+        # Sample randomly the env idx
+        env_indices = self._randint(0, self.n_envs, len(batch_inds), rng)
+
         if self.optimize_memory_usage:
-            next_obs = self._normalize_obs(self.observations[(batch_inds + 1) % self.buffer_size, 0, :], env)
+            next_obs = self._normalize_obs(
+                self._read_observations(self.observations, (batch_inds + 1) % self.buffer_size, env_indices), env
+            )
         else:
-            next_obs = self._normalize_obs(self.next_observations[batch_inds, 0, :], env)
+            next_obs = self._normalize_obs(self._read_observations(self.next_observations, batch_inds, env_indices), env)
 
         data = (
-            self._normalize_obs(self.observations[batch_inds, 0, :], env),
-            self.actions[batch_inds, 0, :],
+            self._normalize_obs(self._read_observations(self.observations, batch_inds, env_indices), env),
+            self.actions[batch_inds, env_indices, :],
             next_obs,
+            self.dones[batch_inds, env_indices].reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
+        )
+        return data
+
+
+class FrameStackReplayBuffer(BaseBuffer):
+    """
+    Replay buffer for stacked-frame observations (e.g. Atari with ``FrameStack(4)``)
+    which stores every frame only once.
+
+    Frames are written to a ring of single frames and each transition only keeps
+    the (absolute) index of the newest frame of its observation and next observation.
+    Consecutive transitions of an episode share all but one frame, so a step usually
+    writes a single frame; whenever the incoming stack does not continue the previous
+    one (e.g. after a reset), the whole stack is written. Stacked observations are
+    rebuilt with a single fancy-index gather when sampling.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space of the stacked observations,
+        the first axis being the stack axis
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param frame_capacity: Number of frames kept in the ring. Defaults to ``buffer_size + buffer_size // 8``
+        to leave room for the full stacks written at episode starts; transitions whose
+        frames have been overwritten are evicted from the buffer.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        frame_capacity: Optional[int] = None,
+    ):
+        super().__init__(buffer_size, observation_space, action_space, device, n_envs=n_envs)
+
+        assert n_envs == 1, "Replay buffer only support single environment for now"
+
+        self.frame_stack = self.obs_shape[0]
+        if frame_capacity is None:
+            frame_capacity = buffer_size + buffer_size // 8
+        assert frame_capacity >= 2 * self.frame_stack, "frame_capacity must hold at least two stacked observations"
+        self.frame_capacity = frame_capacity
+
+        # Check that the replay buffer can fit into the memory
+        if psutil is not None:
+            mem_available = psutil.virtual_memory().available
+
+        self.frames = np.zeros((self.frame_capacity,) + self.obs_shape[1:], dtype=observation_space.dtype)
+        self.obs_frame_ids = np.zeros((self.buffer_size, self.n_envs), dtype=np.int64)
+        self.next_obs_frame_ids = np.zeros((self.buffer_size, self.n_envs), dtype=np.int64)
+        self.actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=action_space.dtype)
+        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+
+        # absolute counters: frames and transitions written so far, and the oldest transition still valid
+        self.num_frames = 0
+        self.num_transitions = 0
+        self.first_valid = 0
+        self._last_next_obs = None
+
+        if psutil is not None:
+            total_memory_usage = (
+                self.frames.nbytes
+                + self.obs_frame_ids.nbytes
+                + self.next_obs_frame_ids.nbytes
+                + self.actions.nbytes
+                + self.rewards.nbytes
+                + self.dones.nbytes
+            )
+            if total_memory_usage > mem_available:
+                # Convert to GB
+                total_memory_usage /= 1e9
+                mem_available /= 1e9
+                warnings.warn(
+                    "This system does not have apparently enough memory to store the complete "
+                    f"replay buffer {total_memory_usage:.2f}GB > {mem_available:.2f}GB"
+                )
+
+    def size(self) -> int:
+        """
+        :return: The current size of the buffer
+        """
+        return self.num_transitions - self.first_valid
+
+    def reset(self) -> None:
+        super().reset()
+        self.num_frames = 0
+        self.num_transitions = 0
+        self.first_valid = 0
+        self._last_next_obs = None
+
+    def _write_frames(self, frames: np.ndarray) -> int:
+        """
+        Append frames to the ring and evict the transitions referencing overwritten frames.
+
+        :param frames: frames to append, of shape ``(n_frames,) + frame_shape``
+        :return: absolute index of the last written frame
+        """
+        self.frames[(self.num_frames + np.arange(len(frames))) % self.frame_capacity] = frames
+        self.num_frames += len(frames)
+        oldest_frame = self.num_frames - self.frame_capacity
+        while self.first_valid < self.num_transitions:
+            pos = self.first_valid % self.buffer_size
+            if min(self.obs_frame_ids[pos, 0], self.next_obs_frame_ids[pos, 0]) - self.frame_stack + 1 >= oldest_frame:
+                break
+            self.first_valid += 1
+        return self.num_frames - 1
+
+    def add(self, obs: np.ndarray, next_obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray) -> None:
+        obs = np.asarray(obs).reshape(self.obs_shape)
+        next_obs = np.asarray(next_obs).reshape(self.obs_shape)
+
+        if self._last_next_obs is not None and np.array_equal(obs, self._last_next_obs):
+            # same episode: the newest frame of `obs` is the one written for the previous `next_obs`
+            obs_frame_id = self.num_frames - 1
+        else:
+            obs_frame_id = self._write_frames(obs)
+        if np.array_equal(next_obs[:-1], obs[1:]):
+            next_obs_frame_id = self._write_frames(next_obs[-1:])
+        else:
+            next_obs_frame_id = self._write_frames(next_obs)
+        self._last_next_obs = next_obs.copy()
+
+        self.obs_frame_ids[self.pos] = obs_frame_id
+        self.next_obs_frame_ids[self.pos] = next_obs_frame_id
+        self.actions[self.pos] = np.array(action).copy()
+        self.rewards[self.pos] = np.array(reward).copy()
+        self.dones[self.pos] = np.array(done).copy()
+
+        self.num_transitions += 1
+        self.first_valid = max(self.first_valid, self.num_transitions - self.buffer_size)
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def sample(self, batch_size: int, env: Optional[VecNormalize] = None) -> ReplayBufferSamples:
+        """
+        :param batch_size: Number of element to sample
+        :param env: associated gym VecEnv
+            to normalize the observations/rewards when sampling
+        :return:
+        """
+        return self._get_samples(self._sample_batch_inds(batch_size), env=env)
+
+    def _sample_batch_inds(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        return self._randint(self.first_valid, self.num_transitions, batch_size, rng) % self.buffer_size
+
+    def _get_samples(self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None) -> ReplayBufferSamples:
+        return ReplayBufferSamples(*tuple(map(self.to_torch, self._get_arrays(batch_inds, env))))
+
+    def _get_arrays(
+        self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None, rng: Optional[np.random.Generator] = None
+    ) -> tuple:
+        # (batch_size, 2, frame_stack) absolute frame indices of the obs and next_obs stacks
+        frame_ids = np.stack([self.obs_frame_ids[batch_inds, 0], self.next_obs_frame_ids[batch_inds, 0]], axis=1)
+        frame_ids = frame_ids[:, :, None] + np.arange(-self.frame_stack + 1, 1)
+        stacks = self.frames[frame_ids % self.frame_capacity]
+
+        data = (
+            self._normalize_obs(stacks[:, 0], env),
+            self.actions[batch_inds, 0, :],
+            self._normalize_obs(stacks[:, 1], env),
             self.dones[batch_inds],
             self._normalize_reward(self.rewards[batch_inds], env),
         )
-        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+        return data
+
+
+class PrefetchReplayBuffer:
+    """
+    Wrapper around a replay buffer (``ReplayBuffer`` or ``FrameStackReplayBuffer``) that samples
+    batches in a background thread, so that the indexing and the host-to-device copy overlap
+    with the learner step instead of sitting on its critical path.
+
+    A worker thread keeps a bounded queue of ready batches. On CUDA devices, each batch is gathered
+    into pinned staging tensors and copied with ``non_blocking=True`` on a side stream; ``sample``
+    makes the current stream wait for that copy. ``add`` and the worker's gather are serialized
+    by a lock, so transitions can be added while batches are being prefetched; a prefetched batch
+    may however not contain the transitions added after it was sampled. The worker samples with its
+    own generator rather than the global ``np.random`` state. If it fails, ``sample`` raises its error
+    on every later call.
+
+    ``add`` and ``sample`` take the same arguments as the ones of the stable-baselines3 ``ReplayBuffer``,
+    so that it can replace it in the scripts.
+
+    :param replay_buffer: the wrapped replay buffer, its ``device`` is the device of the batches
+    :param batch_size: Number of element to sample
+    :param prefetch: Max number of ready batches kept in the queue
+    :param seed: Seed of the generator of the worker
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    """
+
+    def __init__(
+        self,
+        replay_buffer: BaseBuffer,
+        batch_size: int,
+        prefetch: int = 2,
+        seed: Optional[int] = None,
+        handle_timeout_termination: bool = False,
+    ):
+        self.replay_buffer = replay_buffer
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.handle_timeout_termination = handle_timeout_termination
+        self.device = th.device(replay_buffer.device)
+        self._rng = np.random.default_rng(seed)
+        self._error = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._worker = None
+        self._stream = th.cuda.Stream(self.device) if self.device.type == "cuda" else None
+        # one more set of staging tensors than the queue can hold, to fill one while the others are in flight
+        self._staging = [None] * (prefetch + 1)
+        self._staging_events = [None] * (prefetch + 1)
+        self._num_batches, self._stall_time = 0, 0.0
+
+    def __getattr__(self, name):
+        # forward `size`, `pos`, `full`, ... to the wrapped buffer
+        return getattr(self.replay_buffer, name)
+
+    def add(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        if self.handle_timeout_termination:
+            # a time-out is not a termination: the transition is stored with ``done=False``
+            timeouts = np.array([info.get("TimeLimit.truncated", False) for info in infos])
+            done = np.logical_and(done, np.logical_not(timeouts))
+        with self._lock:
+            self.replay_buffer.add(obs, next_obs, action, reward, done)
+
+    def sample(self, batch_size: Optional[int] = None) -> ReplayBufferSamples:
+        """
+        Return the next prefetched batch, starting the worker thread on the first call.
+
+        :param batch_size: Number of element to sample, must match the one given at construction
+        :return:
+        """
+        assert batch_size is None or batch_size == self.batch_size, "the batch size is fixed at construction"
+        if self._error is not None:
+            # the worker has stopped after the error, no batch would ever come
+            raise self._error
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="cleanrl-prefetch-worker", daemon=True)
+            self._worker.start()
+        start_time = time.perf_counter()
+        batch, event = self._queue.get()
+        self._stall_time += time.perf_counter() - start_time
+        if isinstance(batch, Exception):
+            self._error = batch
+            raise batch
+        if event is not None:
+            stream = th.cuda.current_stream(self.device)
+            stream.wait_event(event)
+            for tensor in batch:
+                # the tensors were allocated on the side stream
+                tensor.record_stream(stream)
+        self._num_batches += 1
+        return batch
+
+    def stats(self) -> Dict[str, float]:
+        """
+        :return: the current queue depth, the number of batches returned by ``sample``
+            and the total time ``sample`` spent waiting for the worker, in seconds
+        """
+        return {"queue_depth": self._queue.qsize(), "num_batches": self._num_batches, "stall_time": self._stall_time}
+
+    def close(self) -> None:
+        """
+        Stop the worker thread.
+        """
+        self._stop.set()
+        if self._worker is not None:
+            while self._worker.is_alive():
+                # unblock a worker waiting on a full queue
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._worker.join(timeout=0.01)
+            self._worker = None
+
+    def _run(self) -> None:
+        slot = 0
+        while not self._stop.is_set():
+            try:
+                with self._lock:
+                    batch_inds = self.replay_buffer._sample_batch_inds(self.batch_size, rng=self._rng)
+                    data = self.replay_buffer._get_arrays(batch_inds, rng=self._rng)
+                item = self._to_device(data, slot)
+            except Exception as e:
+                item = (e, None)
+            slot = (slot + 1) % len(self._staging)
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if isinstance(item[0], Exception):
+                return
+
+    def _to_device(self, data: tuple, slot: int):
+        if self._stream is None:
+            # the gathered arrays are fresh copies, no need to copy them again on the CPU
+            batch = tuple(th.from_numpy(np.ascontiguousarray(array)).to(self.device) for array in data)
+            return ReplayBufferSamples(*batch), None
+
+        if self._staging[slot] is None:
+            self._staging[slot] = [th.empty(array.shape, dtype=th.from_numpy(array).dtype).pin_memory() for array in data]
+        elif self._staging_events[slot] is not None:
+            # the previous copy out of this staging slot must be done before overwriting it
+            self._staging_events[slot].synchronize()
+        staging = self._staging[slot]
+        for tensor, array in zip(staging, data):
+            tensor.copy_(th.from_numpy(array))
+        with th.cuda.stream(self._stream):
+            batch = ReplayBufferSamples(*tuple(tensor.to(self.device, non_blocking=True) for tensor in staging))
+            event = th.cuda.Event()
+            event.record(self._stream)
+        self._staging_events[slot] = event
+        return batch, event
 
 
 class RolloutBuffer(BaseBuffer):
@@ -503,18 +976,15 @@ class RolloutBuffer(BaseBuffer):
         # convert to numpy
         last_values = last_values.clone().cpu().numpy().flatten()
 
-        last_gae_lam = 0
-        for step in reversed(range(self.buffer_size)):
-            if step == self.buffer_size - 1:
-                next_non_terminal = 1.0 - dones
-                next_values = last_values
-            else:
-                next_non_terminal = 1.0 - self.dones[step + 1]
-                next_values = self.values[step + 1]
-            delta = self.rewards[step] + self.gamma * next_values * next_non_terminal - self.values[step]
-            last_gae_lam = delta + self.gamma * self.gae_lambda * next_non_terminal * last_gae_lam
-            self.advantages[step] = last_gae_lam
-        self.returns = self.advantages + self.values
+        self.advantages, self.returns = compute_gae(
+            self.rewards,
+            self.values,
+            self.dones,
+            last_values,
+            np.asarray(dones, dtype=np.float32),
+            self.gamma,
+            self.gae_lambda,
+        )
 
     def add(
         self, obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray, value: th.Tensor, log_prob: th.Tensor
@@ -593,7 +1063,8 @@ class PrioritizedReplayBuffer(BaseBuffer):
     :param observation_space: Observation space
     :param action_space: Action space
     :param device:
-    :param n_envs: Number of parallel environments
+    :param n_envs: Number of parallel environments,
+        the priorities are kept per ``(pos, env)`` transition, flattened as ``pos * n_envs + env``
     """
 
     def __init__(
@@ -607,7 +1078,6 @@ class PrioritizedReplayBuffer(BaseBuffer):
     ):
         super().__init__(buffer_size, observation_space, action_space, device, n_envs=n_envs)
 
-        assert n_envs == 1, "Replay buffer only support single environment for now"
         assert alpha >= 0
 
         self.observations = np.zeros((self.buffer_size, self.n_envs) + self.obs_shape, dtype=observation_space.dtype)
@@ -617,7 +1087,7 @@ class PrioritizedReplayBuffer(BaseBuffer):
         self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
 
         it_capacity = 1
-        while it_capacity < buffer_size:
+        while it_capacity < buffer_size * n_envs:
             it_capacity *= 2
         self._alpha = alpha
         self._it_sum = SumSegmentTree(it_capacity)
@@ -629,12 +1099,14 @@ class PrioritizedReplayBuffer(BaseBuffer):
         self.observations[self.pos] = np.array(obs).copy()
         self.next_observations[self.pos] = np.array(next_obs).copy()
 
-        self.actions[self.pos] = np.array(action).copy()
+        # Reshape to write the `(n_envs,)` actions of discrete action spaces in one go
+        self.actions[self.pos] = np.array(action).reshape((self.n_envs, self.action_dim)).copy()
         self.rewards[self.pos] = np.array(reward).copy()
         self.dones[self.pos] = np.array(done).copy()
 
-        self._it_sum[self.pos] = self._max_weight**self._alpha
-        self._it_min[self.pos] = self._max_weight**self._alpha
+        tree_inds = self.pos * self.n_envs + np.arange(self.n_envs)
+        self._it_sum[tree_inds] = self._max_weight**self._alpha
+        self._it_min[tree_inds] = self._max_weight**self._alpha
 
         self.pos += 1
         if self.pos == self.buffer_size:
@@ -642,14 +1114,16 @@ class PrioritizedReplayBuffer(BaseBuffer):
             self.pos = 0
 
     def _get_samples(self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None) -> PrioritizedReplayBufferSamples:
-        next_obs = self._normalize_obs(self.next_observations[batch_inds, 0, :], env)
+        # `batch_inds` index the flattened (pos, env) grid
+        batch_inds, env_indices = np.divmod(batch_inds, self.n_envs)
+        next_obs = self._normalize_obs(self.next_observations[batch_inds, env_indices, :], env)
 
         data = (
-            self._normalize_obs(self.observations[batch_inds, 0, :], env),
-            self.actions[batch_inds, 0, :],
+            self._normalize_obs(self.observations[batch_inds, env_indices, :], env),
+            self.actions[batch_inds, env_indices, :],
             next_obs,
-            self.dones[batch_inds],
-            self._normalize_reward(self.rewards[batch_inds], env),
+            self.dones[batch_inds, env_indices].reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
         )
 
         return data
@@ -664,18 +1138,18 @@ class PrioritizedReplayBuffer(BaseBuffer):
             to normalize the observations/rewards when sampling
         :return:
         """
-        # Sample indices
-        mass = []
-        total = self._it_sum.sum(0, self.size() - 1)
+        # Sample indices over the flattened (pos, env) grid
+        num_transitions = self.size() * self.n_envs
+        total = self._it_sum.sum(0, num_transitions)
         # TODO(szymon): should we ensure no repeats?
         mass = np.random.random(size=batch_size) * total
         batch_inds = self._it_sum.find_prefixsum_idx(mass)
         th_data = self._get_samples(batch_inds, env=env)
 
         p_min = self._it_min.min() / self._it_sum.sum()
-        max_weight = (p_min * self.size()) ** (-beta)
+        max_weight = (p_min * num_transitions) ** (-beta)
         p_sample = self._it_sum[batch_inds] / self._it_sum.sum()
-        weights = (p_sample * self.size()) ** (-beta) / max_weight
+        weights = (p_sample * num_transitions) ** (-beta) / max_weight
 
         return PrioritizedReplayBufferSamples(*tuple(map(self.to_torch, th_data)), weights=weights, indices=batch_inds)
 
@@ -686,14 +1160,14 @@ class PrioritizedReplayBuffer(BaseBuffer):
         sets weight of transition at index idxes[i] in buffer
         to weights[i].
 
-        :param batch_inds: ([int]) np.ndarray of idxes of sampled transitions
+        :param batch_inds: ([int]) np.ndarray of idxes of sampled transitions, as returned in ``indices`` by ``sample``
         :param weights: ([float]) np.ndarray of updated weights corresponding to transitions at the sampled idxes
             denoted by variable `batch_inds`.
         """
         assert len(batch_inds) == len(weights)
         assert np.min(weights) > 0
         assert np.min(batch_inds) >= 0
-        assert np.max(batch_inds) < self.size()
+        assert np.max(batch_inds) < self.size() * self.n_envs
         self._it_sum[batch_inds] = weights**self._alpha
         self._it_min[batch_inds] = weights**self._alpha
 
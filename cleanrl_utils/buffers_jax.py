@@ -0,0 +1,194 @@
+from typing import Any, Optional
+
+import flax
+import gymnasium as gym
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+
+@flax.struct.dataclass
+class ReplayBufferSamples:
+    observations: jnp.array
+    actions: jnp.array
+    next_observations: jnp.array
+    dones: jnp.array
+    rewards: jnp.array
+
+
+@flax.struct.dataclass
+class ReplayBufferState:
+    """
+    Replay buffer living on the accelerator, as an immutable pytree.
+
+    ``add`` and ``sample`` are pure functions of the state, so they can be called
+    inside ``jax.jit`` and ``jax.lax.scan`` together with the update step, e.g.
+
+        rb = ReplayBufferState.create(buffer_size, envs.single_observation_space, envs.single_action_space)
+
+        @partial(jax.jit, donate_argnums=(0,))
+        def add_and_update(rb, q_state, key, obs, next_obs, actions, rewards, dones):
+            rb = rb.add(obs, next_obs, actions, rewards, dones)
+            data = rb.sample(key, batch_size)
+            ...
+
+    Donating the state lets XLA write the new transitions in place instead of copying the buffer.
+    Like ``cleanrl_utils.buffers.ReplayBuffer``, transitions are stored in a ``(buffer_size, n_envs)`` grid
+    and ``sample`` draws a position and an env index per element.
+
+    :param observations: (buffer_size, n_envs, *obs_shape)
+    :param next_observations: (buffer_size, n_envs, *obs_shape), ``None`` with ``optimize_memory_usage``
+    :param actions: (buffer_size, n_envs, *action_shape)
+    :param rewards: (buffer_size, n_envs)
+    :param dones: (buffer_size, n_envs)
+    :param pos: position of the next write
+    :param full: whether the buffer has wrapped around
+    :param optimize_memory_usage: store the next observation in ``observations[pos + 1]``,
+        see ``cleanrl_utils.buffers.ReplayBuffer``
+    """
+
+    observations: jnp.array
+    next_observations: Optional[jnp.array]
+    actions: jnp.array
+    rewards: jnp.array
+    dones: jnp.array
+    pos: jnp.array
+    full: jnp.array
+    optimize_memory_usage: bool = flax.struct.field(pytree_node=False, default=False)
+
+    @classmethod
+    def create(
+        cls,
+        buffer_size: int,
+        observation_space: gym.spaces.Space,
+        action_space: gym.spaces.Space,
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+    ) -> "ReplayBufferState":
+        def zeros(shape, dtype):
+            return jnp.zeros((buffer_size, n_envs) + shape, dtype=jax.dtypes.canonicalize_dtype(dtype))
+
+        return cls(
+            observations=zeros(observation_space.shape, observation_space.dtype),
+            next_observations=None if optimize_memory_usage else zeros(observation_space.shape, observation_space.dtype),
+            actions=zeros(action_space.shape, action_space.dtype),
+            rewards=zeros((), jnp.float32),
+            dones=zeros((), jnp.float32),
+            pos=jnp.array(0, dtype=jnp.int32),
+            full=jnp.array(False),
+            optimize_memory_usage=optimize_memory_usage,
+        )
+
+    @property
+    def buffer_size(self) -> int:
+        return self.observations.shape[0]
+
+    def size(self) -> jnp.array:
+        """
+        :return: The current size of the buffer
+        """
+        return jnp.where(self.full, self.buffer_size, self.pos)
+
+    def add(
+        self, obs: jnp.array, next_obs: jnp.array, action: jnp.array, reward: jnp.array, done: jnp.array
+    ) -> "ReplayBufferState":
+        """
+        Write one ``(n_envs, ...)`` batch of transitions at the current position.
+
+        :return: the new buffer state
+        """
+        observations = self.observations.at[self.pos].set(obs)
+        next_observations = self.next_observations
+        if self.optimize_memory_usage:
+            observations = observations.at[(self.pos + 1) % self.buffer_size].set(next_obs)
+        else:
+            next_observations = next_observations.at[self.pos].set(next_obs)
+        pos = (self.pos + 1) % self.buffer_size
+        return self.replace(
+            observations=observations,
+            next_observations=next_observations,
+            actions=self.actions.at[self.pos].set(jnp.reshape(action, self.actions.shape[1:])),
+            rewards=self.rewards.at[self.pos].set(reward),
+            dones=self.dones.at[self.pos].set(done),
+            pos=pos,
+            full=self.full | (pos == 0),
+        )
+
+    def sample(self, key: jax.random.PRNGKey, batch_size: int) -> ReplayBufferSamples:
+        """
+        Sample elements from the replay buffer.
+
+        :param key: PRNG key
+        :param batch_size: Number of element to sample, must be static under ``jax.jit``
+        :return: samples with a leading ``batch_size`` axis; rewards and dones are flat
+        """
+        pos_key, env_key = jax.random.split(key)
+        if self.optimize_memory_usage:
+            # Do not sample the element with index `self.pos` as the transitions is invalid
+            # (we use only one array to store `obs` and `next_obs`)
+            start = jnp.where(self.full, self.pos + 1, 0)
+            num_valid = jnp.where(self.full, self.buffer_size - 1, self.pos)
+        else:
+            start = 0
+            num_valid = self.size()
+        batch_inds = (start + jax.random.randint(pos_key, (batch_size,), 0, num_valid)) % self.buffer_size
+        env_inds = jax.random.randint(env_key, (batch_size,), 0, self.observations.shape[1])
+
+        if self.optimize_memory_usage:
+            next_observations = self.observations[(batch_inds + 1) % self.buffer_size, env_inds]
+        else:
+            next_observations = self.next_observations[batch_inds, env_inds]
+        return ReplayBufferSamples(
+            observations=self.observations[batch_inds, env_inds],
+            actions=self.actions[batch_inds, env_inds],
+            next_observations=next_observations,
+            dones=self.dones[batch_inds, env_inds],
+            rewards=self.rewards[batch_inds, env_inds],
+        )
+
+
+class DeviceReplayBuffer:
+    """
+    Host-side handle on a ``ReplayBufferState``, for the scripts that step their envs on the host.
+
+    ``add`` takes the same arguments as the one of the stable-baselines3 ``ReplayBuffer`` (``infos`` is
+    ignored, pass the terminations as ``done``) and writes the transitions with a jitted
+    ``ReplayBufferState.add`` that donates the previous state. The batches are sampled from ``state``
+    inside the jitted update.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: store the next observation in ``observations[pos + 1]``
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: gym.spaces.Space,
+        action_space: gym.spaces.Space,
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+    ):
+        self.state = ReplayBufferState.create(
+            buffer_size, observation_space, action_space, n_envs=n_envs, optimize_memory_usage=optimize_memory_usage
+        )
+        self._add = jax.jit(ReplayBufferState.add, donate_argnums=(0,))
+
+    def size(self) -> int:
+        """
+        :return: The current size of the buffer
+        """
+        return int(self.state.size())
+
+    def add(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[Any] = None,
+    ) -> None:
+        self.state = self._add(self.state, obs, next_obs, action, reward, done)
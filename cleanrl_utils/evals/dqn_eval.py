@@ -16,27 +16,35 @@ def evaluate(
     device: torch.device = torch.device("cpu"),
     epsilon: float = 0.05,
     capture_video: bool = True,
+    num_envs: int = 1,
+    async_envs: bool = False,
 ):
-    envs = gym.vector.SyncVectorEnv([make_env(env_id, 0, 0, capture_video, run_name)])
+    env_fns = [make_env(env_id, i, i, capture_video, run_name) for i in range(num_envs)]
+    envs = gym.vector.AsyncVectorEnv(env_fns) if async_envs else gym.vector.SyncVectorEnv(env_fns)
     model = Model(envs).to(device)
     model.load_state_dict(torch.load(model_path, map_location=device))
     model.eval()
 
     obs, _ = envs.reset()
     episodic_returns = []
+    # each env runs a fixed share of the episodes: counting the first `eval_episodes` episodes to finish
+    # across all envs would over-sample the short ones
+    episode_counts = np.zeros(envs.num_envs, dtype=int)
+    episode_targets = np.array([(eval_episodes + i) // envs.num_envs for i in range(envs.num_envs)])
     while len(episodic_returns) < eval_episodes:
-        if random.random() < epsilon:
-            actions = np.array([envs.single_action_space.sample() for _ in range(envs.num_envs)])
-        else:
-            q_values = model(torch.Tensor(obs).to(device))
-            actions = torch.argmax(q_values, dim=1).cpu().numpy()
+        q_values = model(torch.Tensor(obs).to(device))
+        actions = torch.argmax(q_values, dim=1).cpu().numpy()
+        for i in range(envs.num_envs):
+            if random.random() < epsilon:
+                actions[i] = envs.single_action_space.sample()
         next_obs, _, _, _, infos = envs.step(actions)
         if "final_info" in infos:
-            for info in infos["final_info"]:
-                if "episode" not in info:
+            for i, info in enumerate(infos["final_info"]):
+                if info is None or "episode" not in info or episode_counts[i] >= episode_targets[i]:
                     continue
                 print(f"eval_episode={len(episodic_returns)}, episodic_return={info['episode']['r']}")
                 episodic_returns += [info["episode"]["r"]]
+                episode_counts[i] += 1
         obs = next_obs
 
     return episodic_returns
@@ -18,9 +18,10 @@ def evaluate(
     run_name: str,
     Model: nn.Module,
     capture_video: bool = True,
+    num_envs: int = 1,
     seed=1,
 ):
-    envs = make_env(env_id, seed, num_envs=1)()
+    envs = make_env(env_id, seed, num_envs=num_envs)()
     Network, Actor, Critic = Model
     next_obs = envs.reset()
     network = Network()
@@ -53,34 +54,35 @@ def evaluate(
         action = jnp.argmax(logits - jnp.log(-jnp.log(u)), axis=1)
         return action, key
 
-    # a simple non-vectorized version
-
     episodic_returns = []
-    for episode in range(eval_episodes):
-        episodic_return = 0
-        next_obs = envs.reset()
-        terminated = False
+    # each env runs a fixed share of the episodes: counting the first `eval_episodes` episodes to finish
+    # across all envs would over-sample the short ones
+    episode_counts = np.zeros(num_envs, dtype=int)
+    episode_targets = np.array([(eval_episodes + i) // num_envs for i in range(num_envs)])
+    episodic_return = np.zeros(num_envs)
+    next_obs = envs.reset()
+    if capture_video:
+        recorded_frames = []
+        # conversion from grayscale into rgb
+        recorded_frames.append(cv2.cvtColor(next_obs[0][-1], cv2.COLOR_GRAY2RGB))
+    while len(episodic_returns) < eval_episodes:
+        actions, key = get_action_and_value(network_params, actor_params, next_obs, key)
+        next_obs, _, _, infos = envs.step(np.array(actions))
+        episodic_return += infos["reward"]
 
-        if capture_video:
-            recorded_frames = []
-            # conversion from grayscale into rgb
+        if capture_video and episode_counts[0] == 0:
             recorded_frames.append(cv2.cvtColor(next_obs[0][-1], cv2.COLOR_GRAY2RGB))
-        while not terminated:
-            actions, key = get_action_and_value(network_params, actor_params, next_obs, key)
-            next_obs, _, _, infos = envs.step(np.array(actions))
-            episodic_return += infos["reward"][0]
-            terminated = sum(infos["terminated"]) == 1
-
-            if capture_video and episode == 0:
-                recorded_frames.append(cv2.cvtColor(next_obs[0][-1], cv2.COLOR_GRAY2RGB))
 
-            if terminated:
-                print(f"eval_episode={len(episodic_returns)}, episodic_return={episodic_return}")
-                episodic_returns.append(episodic_return)
-                if capture_video and episode == 0:
+        for i in np.flatnonzero(infos["terminated"]):
+            if episode_counts[i] < episode_targets[i]:
+                print(f"eval_episode={len(episodic_returns)}, episodic_return={episodic_return[i]}")
+                episodic_returns.append(episodic_return[i])
+                if capture_video and i == 0 and episode_counts[i] == 0:
                     clip = ImageSequenceClip(recorded_frames, fps=24)
                     os.makedirs(f"videos/{run_name}", exist_ok=True)
-                    clip.write_videofile(f"videos/{run_name}/{episode}.mp4", logger="bar")
+                    clip.write_videofile(f"videos/{run_name}/0.mp4", logger="bar")
+                episode_counts[i] += 1
+            episodic_return[i] = 0
 
     return episodic_returns
 
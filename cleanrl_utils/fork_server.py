@@ -0,0 +1,190 @@
+"""
+Run training scripts in processes forked from a server that has already imported the heavy modules.
+
+A fresh `python cleanrl/<script>.py` spends seconds importing `torch`, `gym`, `tensorboard` and
+`stable_baselines3` before it trains, which is a large share of the wall time of short runs. The
+server imports them once, and every experiment is a fork of it running the script's `__main__`
+through `runpy`, with its own `sys.argv`, environment variables and output file. The forks run in the
+working directory of the process that submits them, so like experiments started from a shell they share
+its `runs/` and `videos/` directories, where each run writes to its own `run_name`.
+
+A fork can also stream its scalars to the launcher like `python -m cleanrl_utils.metrics_stream`, which
+is how the `Tuner` runs its experiments in forks.
+"""
+import importlib.util
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import runpy
+import shlex
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, TextIO
+
+PRELOAD_MODULES = ["numpy", "torch", "torch.utils.tensorboard", "gym", "gymnasium", "stable_baselines3"]
+
+
+def split_command(command: str):
+    """Split `poetry run python cleanrl/ppo.py --seed 1` into `("cleanrl/ppo.py", ["--seed", "1"])`."""
+    command_list = shlex.split(command)
+    for i, token in enumerate(command_list):
+        if token.endswith(".py"):
+            return token, command_list[i + 1 :]
+    raise ValueError(f"no python script in the command {command!r}")
+
+
+def tail_log(log: TextIO, running: Callable[[], bool], interval: float = 0.1) -> Iterator[str]:
+    """
+    Yield the lines of `log` as they are written, until `running()` is False and the whole file has been read.
+    """
+    pending = ""
+    while True:
+        # check before reading, so that the lines written before the end are all read
+        alive = running()
+        for line in iter(log.readline, ""):
+            pending += line
+            if pending.endswith("\n"):
+                yield pending
+                pending = ""
+        if not alive:
+            break
+        time.sleep(interval)
+    if pending:
+        yield pending
+
+
+def _run_script(script, argv, env, cwd, cores, log_path, started_at, metrics_conn):
+    started_at.value = time.time()
+    os.environ.clear()
+    os.environ.update(env)
+    if cores:
+        os.sched_setaffinity(0, cores)
+    if "torch" in sys.modules and "OMP_NUM_THREADS" in env:
+        sys.modules["torch"].set_num_threads(int(env["OMP_NUM_THREADS"]))
+    # the forks share the state of the server, so reseed the unseeded generators like a new interpreter would
+    random.seed()
+    if "numpy" in sys.modules:
+        sys.modules["numpy"].random.seed()
+    log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.chdir(cwd)
+    if metrics_conn is not None:
+        # stream the scalars to the launcher, as `python -m cleanrl_utils.metrics_stream` does
+        import torch.utils.tensorboard
+
+        from cleanrl_utils.metrics_stream import METRICS_FD_ENV, MetricsWriter
+
+        os.environ[METRICS_FD_ENV] = str(os.dup(metrics_conn.fileno()))
+        torch.utils.tensorboard.SummaryWriter = MetricsWriter
+    sys.argv = [script] + argv
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    runpy.run_path(script, run_name="__main__")
+
+
+class ForkServer:
+    """
+    :param preload: the modules the server imports before forking the experiments
+    """
+
+    def __init__(self, preload: List[str] = PRELOAD_MODULES) -> None:
+        self.ctx = multiprocessing.get_context("forkserver")
+        self.ctx.set_forkserver_preload(preload)
+        # the startup each experiment saves is roughly what a new interpreter takes to import `preload`
+        preload = [module for module in preload if importlib.util.find_spec(module.split(".")[0]) is not None]
+        start_time = time.time()
+        subprocess.run([sys.executable, "-c", f"import {', '.join(preload)}"], check=True)
+        self.import_time = time.time() - start_time
+
+    def start(
+        self,
+        command: str,
+        log_path: str,
+        env: Optional[Dict[str, str]] = None,
+        cores: Optional[List[int]] = None,
+        metrics_fd: Optional[int] = None,
+    ) -> "ForkedRun":
+        """
+        Start the script of `command` in a fork of the server.
+
+        :param command: the command of the experiment; everything before the script (e.g. `poetry run python`) is ignored
+        :param log_path: the file the stdout and stderr of the experiment go to
+        :param env: the environment variables of the experiment; defaults to those of this process
+        :param cores: the cores to pin the experiment to
+        :param metrics_fd: if set, the write end of a pipe the script streams its scalars to, as with
+            `python -m cleanrl_utils.metrics_stream`; the caller keeps its own descriptor
+        :return: the running experiment
+        """
+        script, argv = split_command(command)
+        started_at = self.ctx.Value("d", 0.0)
+        # a connection is the way to hand a file descriptor to a fork of the server
+        metrics_conn = None
+        if metrics_fd is not None:
+            metrics_conn = multiprocessing.connection.Connection(os.dup(metrics_fd), readable=False)
+        process = self.ctx.Process(
+            target=_run_script,
+            args=(
+                script,
+                argv,
+                dict(env if env is not None else os.environ),
+                os.getcwd(),
+                cores,
+                log_path,
+                started_at,
+                metrics_conn,
+            ),
+        )
+        submitted_at = time.time()
+        process.start()
+        if metrics_conn is not None:
+            metrics_conn.close()
+        return ForkedRun(process, started_at, submitted_at, self.import_time)
+
+    def run(
+        self,
+        command: str,
+        log_path: str,
+        env: Optional[Dict[str, str]] = None,
+        cores: Optional[List[int]] = None,
+    ):
+        """
+        Run the script of `command` in a fork of the server and wait for it, see `start`.
+
+        :return: the exit code of the experiment and its startup time saved in seconds
+        """
+        forked_run = self.start(command, log_path, env, cores)
+        return forked_run.wait(), forked_run.startup_time_saved
+
+
+class ForkedRun:
+    """
+    An experiment running in a fork of a `ForkServer`, with the `poll`, `wait` and `kill` of a `subprocess.Popen`.
+    """
+
+    def __init__(self, process, started_at, submitted_at: float, import_time: float) -> None:
+        self.process = process
+        self.started_at = started_at
+        self.submitted_at = submitted_at
+        self.import_time = import_time
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.exitcode
+
+    @property
+    def startup_time_saved(self) -> float:
+        """The time a new interpreter would have spent importing the preloaded modules, minus the time to fork."""
+        return self.import_time - (self.started_at.value - self.submitted_at)
+
+    def poll(self) -> Optional[int]:
+        return self.process.exitcode
+
+    def wait(self) -> int:
+        self.process.join()
+        return self.process.exitcode
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
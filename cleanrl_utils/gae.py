@@ -0,0 +1,72 @@
+from typing import Tuple, Union
+
+import numpy as np
+import torch
+
+Array = Union[torch.Tensor, np.ndarray]
+
+
+def _discounted_cumsum_torch_eager(deltas: torch.Tensor, coefs: torch.Tensor) -> torch.Tensor:
+    advantages = torch.empty_like(deltas)
+    lastgaelam = torch.zeros_like(deltas[0])
+    for t in range(deltas.shape[0] - 1, -1, -1):
+        # one fused kernel per step: advantages[t] = deltas[t] + coefs[t] * advantages[t + 1]
+        lastgaelam = torch.addcmul(deltas[t], coefs[t], lastgaelam, out=advantages[t])
+    return advantages
+
+
+_discounted_cumsum_torch_scripted = None
+
+
+def _discounted_cumsum_torch(deltas: torch.Tensor, coefs: torch.Tensor) -> torch.Tensor:
+    # scripted on first use rather than at import, where `torch.jit.script` warns about its deprecation
+    global _discounted_cumsum_torch_scripted
+    if _discounted_cumsum_torch_scripted is None:
+        _discounted_cumsum_torch_scripted = torch.jit.script(_discounted_cumsum_torch_eager)
+    return _discounted_cumsum_torch_scripted(deltas, coefs)
+
+
+def _discounted_cumsum_numpy(deltas: np.ndarray, coefs: np.ndarray) -> np.ndarray:
+    advantages = np.empty_like(deltas)
+    lastgaelam = 0
+    for t in reversed(range(deltas.shape[0])):
+        advantages[t] = lastgaelam = deltas[t] + coefs[t] * lastgaelam
+    return advantages
+
+
+def compute_gae(
+    rewards: Array,
+    values: Array,
+    dones: Array,
+    next_value: Array,
+    next_done: Array,
+    gamma: float,
+    gae_lambda: float,
+) -> Tuple[Array, Array]:
+    """
+    Generalized Advantage Estimation (https://arxiv.org/abs/1506.02438) over a rollout of `num_steps` steps.
+
+    Matches the backwards `for t in reversed(range(num_steps))` loop of the PPO scripts: `dones[t]` flags that
+    `obs[t]` is the first observation of a new episode, and the rollout is bootstrapped with `next_value`
+    unless `next_done` is set. The TD errors and discount coefficients are computed for the whole rollout at
+    once, so only the recurrence itself runs step by step: in TorchScript for torch tensors and in NumPy for
+    numpy arrays. For a non-episodic stream such as RND's intrinsic reward, pass zeros as `dones` and `next_done`.
+
+    :param rewards: (num_steps, num_envs) rewards
+    :param values: (num_steps, num_envs) value estimates
+    :param dones: (num_steps, num_envs) done flags
+    :param next_value: (num_envs,) or (1, num_envs) value estimate of the observation following the rollout
+    :param next_done: (num_envs,) done flags of the observation following the rollout
+    :param gamma: the discount factor
+    :param gae_lambda: the GAE lambda
+    :return: the (num_steps, num_envs) advantages and returns
+    """
+    if isinstance(rewards, torch.Tensor):
+        cat, discounted_cumsum = torch.cat, _discounted_cumsum_torch
+    else:
+        cat, discounted_cumsum = np.concatenate, _discounted_cumsum_numpy
+    next_values = cat([values[1:], next_value.reshape((1,) + tuple(values.shape[1:]))])
+    nextnonterminal = 1.0 - cat([dones[1:], next_done.reshape((1,) + tuple(dones.shape[1:]))])
+    deltas = rewards + gamma * next_values * nextnonterminal - values
+    advantages = discounted_cumsum(deltas, gamma * gae_lambda * nextnonterminal)
+    return advantages, advantages + values
@@ -0,0 +1,73 @@
+"""
+Run a training script with its tensorboard scalars streamed to the process that launched it.
+
+`python -m cleanrl_utils.metrics_stream cleanrl/ppo.py --seed 1` runs `cleanrl/ppo.py --seed 1` with
+`torch.utils.tensorboard.SummaryWriter` replaced by `MetricsWriter`, which writes every `add_scalar`
+call as a `tag\\tstep\\tvalue` line to the file descriptor in the `CLEANRL_METRICS_FD` environment
+variable. If `CLEANRL_WRITE_EVENT_FILES` is `0`, no tensorboard event file is written at all.
+
+The first line is `metrics_stream/created_at`, the wall-clock time the script created its writer,
+which tells the launcher how long the script took to start.
+"""
+import os
+import runpy
+import sys
+import time
+
+import numpy as np
+import torch.utils.tensorboard
+from torch.utils.tensorboard import SummaryWriter
+
+METRICS_FD_ENV = "CLEANRL_METRICS_FD"
+WRITE_EVENT_FILES_ENV = "CLEANRL_WRITE_EVENT_FILES"
+CREATED_AT_TAG = "metrics_stream/created_at"
+
+_metrics_stream = None
+
+
+class MetricsWriter:
+    """
+    Drop-in replacement of `SummaryWriter` that also streams the scalars to `CLEANRL_METRICS_FD`.
+
+    All the other methods (`add_text`, `add_histogram`, ...) go to a regular `SummaryWriter`, or do
+    nothing if the event files are disabled.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        global _metrics_stream
+        if _metrics_stream is None:
+            _metrics_stream = os.fdopen(int(os.environ[METRICS_FD_ENV]), "w", buffering=1)
+            _metrics_stream.write(f"{CREATED_AT_TAG}\tNone\t{time.time()}\n")
+        self.stream = _metrics_stream
+        self.writer = None
+        if os.environ.get(WRITE_EVENT_FILES_ENV, "1") == "1":
+            self.writer = SummaryWriter(*args, **kwargs)
+
+    def add_scalar(self, tag, scalar_value, global_step=None, *args, **kwargs) -> None:
+        self.stream.write(f"{tag}\t{global_step}\t{np.asarray(scalar_value).item()}\n")
+        if self.writer is not None:
+            self.writer.add_scalar(tag, scalar_value, global_step, *args, **kwargs)
+
+    def close(self) -> None:
+        self.stream.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def __getattr__(self, name):
+        if self.writer is not None:
+            return getattr(self.writer, name)
+        return lambda *args, **kwargs: None
+
+
+def parse_metric(line: str):
+    """Parse a `tag\\tstep\\tvalue` line written by `MetricsWriter` into `(tag, step, value)`."""
+    tag, step, value = line.rstrip("\n").split("\t")
+    return tag, None if step == "None" else int(float(step)), float(value)
+
+
+if __name__ == "__main__":
+    torch.utils.tensorboard.SummaryWriter = MetricsWriter
+    script = sys.argv[1]
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    runpy.run_path(script, run_name="__main__")
@@ -0,0 +1,213 @@
+"""
+Throughput benchmark suite with regression tracking across commits.
+
+Every case runs a script for a fixed number of steps on an environment available on any CPU machine
+(classic control, or the Atari-shaped stubs of `cleanrl_utils.atari_stub`). Its scalars are streamed
+through `cleanrl_utils.metrics_stream`. The suite records the final SPS, the average of every
+`perf/*` phase timing, the peak RSS and the startup time of each case, appends them
+to a JSON history keyed by git commit, and flags regressions against a stored baseline. A case that
+fails is recorded as such, and the suite goes on with the other cases.
+
+Usage:
+    python -m cleanrl_utils.perf --update-baseline   # on the reference commit
+    python -m cleanrl_utils.perf                     # on a later commit
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from distutils.util import strtobool
+
+from cleanrl_utils.metrics_stream import (
+    CREATED_AT_TAG,
+    METRICS_FD_ENV,
+    WRITE_EVENT_FILES_ENV,
+    parse_metric,
+)
+
+CASES = {
+    "ppo-CartPole-v1": ["cleanrl/ppo.py", "--env-id", "CartPole-v1", "--total-timesteps", "50000"],
+    "ppo-Acrobot-v1": ["cleanrl/ppo.py", "--env-id", "Acrobot-v1", "--total-timesteps", "50000"],
+    "dqn-CartPole-v1": [
+        "cleanrl/dqn.py",
+        "--env-id",
+        "CartPole-v1",
+        "--total-timesteps",
+        "20000",
+        "--learning-starts",
+        "1000",
+    ],
+    "ppo_continuous_action-Pendulum-v1": [
+        "cleanrl/ppo_continuous_action.py",
+        "--env-id",
+        "Pendulum-v1",
+        "--total-timesteps",
+        "20000",
+    ],
+    "ppo_atari-AtariStub-v0": ["cleanrl/ppo_atari.py", "--env-id", "AtariStub-v0", "--total-timesteps", "10000"],
+    "dqn_atari-AtariStub-v0": [
+        "cleanrl/dqn_atari.py",
+        "--env-id",
+        "AtariStub-v0",
+        "--total-timesteps",
+        "10000",
+        "--learning-starts",
+        "1000",
+        "--buffer-size",
+        "10000",
+    ],
+}
+# higher is better for `sps`; lower is better for the other metrics
+HIGHER_IS_BETTER = ["sps"]
+
+
+def parse_args():
+    # fmt: off
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", default=list(CASES.keys()), choices=list(CASES.keys()),
+        help="the cases of the suite to run")
+    parser.add_argument("--history", type=str, default="perf_history.json",
+        help="the JSON file the results of every run of the suite are appended to")
+    parser.add_argument("--baseline", type=str, default="perf_baseline.json",
+        help="the JSON file of the baseline results the current results are compared to")
+    parser.add_argument("--update-baseline", type=lambda x: bool(strtobool(x)), default=False, nargs="?", const=True,
+        help="if toggled, the current results become the baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+        help="the relative change from the baseline beyond which a metric is flagged as a regression")
+    args = parser.parse_args()
+    # fmt: on
+    return args
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"]).decode("ascii").strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def run_case(command):
+    """
+    Run `command` (a script and its arguments) under `cleanrl_utils.metrics_stream` on the CPU, with `--perf-metrics`.
+
+    :return: the SPS, phase timings, peak RSS (MB), startup time and wall time of the run
+    """
+    metrics_fd, write_fd = os.pipe()
+    env = dict(os.environ, **{METRICS_FD_ENV: str(write_fd), WRITE_EVENT_FILES_ENV: "0"})
+    launch = "import runpy, cleanrl_utils.atari_stub; runpy.run_module('cleanrl_utils.metrics_stream', run_name='__main__')"
+    start_time = time.time()
+    process = subprocess.Popen(
+        [sys.executable, "-c", launch] + command + ["--cuda", "False", "--perf-metrics"],
+        stdout=subprocess.DEVNULL,
+        env=env,
+        pass_fds=(write_fd,),
+    )
+    os.close(write_fd)
+
+    scalars = {}
+
+    def read_metrics():
+        with os.fdopen(metrics_fd) as metrics:
+            for line in metrics:
+                tag, _, value = parse_metric(line)
+                scalars.setdefault(tag, []).append(value)
+
+    reader = threading.Thread(target=read_metrics)
+    reader.start()
+    # `wait4` reaps the process and returns its resource usage, in which `ru_maxrss` is in KB on Linux
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    reader.join()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    result = {
+        "sps": scalars["charts/SPS"][-1],
+        "startup_time": scalars[CREATED_AT_TAG][0] - start_time,
+        "peak_rss_mb": rusage.ru_maxrss / 1024,
+        "wall_time": time.time() - start_time,
+    }
+    for tag, values in scalars.items():
+        if tag.startswith("perf/"):
+            result[tag] = sum(values) / len(values)
+    return result
+
+
+def run_suite(cases):
+    """
+    :param cases: the names of the cases of `CASES` to run
+    :return: the results of `run_case` of the cases that succeeded, and the error of the cases that failed
+    """
+    results, failures = {}, {}
+    for case in cases:
+        print(f"running {case}")
+        try:
+            results[case] = run_case(CASES[case])
+        except Exception as e:
+            # a broken case must not hide the results of the other ones
+            failures[case] = repr(e)
+            print(f"{case}: failed with {failures[case]}")
+            continue
+        print(
+            f"{case}: SPS {results[case]['sps']:.0f}, startup {results[case]['startup_time']:.2f}s, "
+            f"peak RSS {results[case]['peak_rss_mb']:.0f} MB"
+        )
+    return results, failures
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    :return: `(case, metric, baseline value, current value)` for every metric of `results` that is
+        worse than in `baseline` by more than `threshold` (relative)
+    """
+    regressions = []
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            if case not in baseline or metric not in baseline[case] or metric == "wall_time":
+                continue
+            baseline_value = baseline[case][metric]
+            if metric in HIGHER_IS_BETTER:
+                regressed = value < baseline_value * (1 - threshold)
+            else:
+                regressed = value > baseline_value * (1 + threshold)
+            if regressed:
+                regressions += [(case, metric, baseline_value, value)]
+    return regressions
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    commit = git_commit()
+    results, failures = run_suite(args.cases)
+    regressions = []
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+    history += [{"commit": commit, "time": int(time.time()), "results": results, "failures": failures}]
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"commit": commit, "results": results}, f, indent=2)
+        print(f"saved the results of {commit} as the baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline["results"], args.threshold)
+        print(f"| case | metric | baseline ({baseline['commit']}) | current ({commit}) |")
+        for case, metric, baseline_value, value in regressions:
+            print(f"| {case} | {metric} | {baseline_value:.4g} | {value:.4g} |")
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regressions beyond {args.threshold:.0%}")
+        else:
+            print(f"no regressions beyond {args.threshold:.0%}")
+    if len(failures) > 0:
+        print(f"{len(failures)} cases failed: {', '.join(failures)}")
+    if len(regressions) > 0 or len(failures) > 0:
+        sys.exit(1)
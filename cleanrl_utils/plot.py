@@ -1,7 +1,5 @@
 import argparse
 import os
-import pickle
-from os import path
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -10,6 +8,8 @@ import pandas as pd
 import seaborn as sns
 import wandb
 
+from cleanrl_utils.plot_data import fetch_runs, get_df_for_env
+
 mpl.rcParams["text.usetex"] = True
 mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"  # for \text command
 
@@ -64,54 +64,10 @@ exp_convert_dict = {
 
 # args.feature_of_interest = 'charts/episodic_return'
 feature_name = args.feature_of_interest.replace("/", "_")
-if not os.path.exists(feature_name):
-    os.makedirs(feature_name)
-    with open(f"{feature_name}/cache.pkl", "wb") as handle:
-        pickle.dump([[], [], [], {}, [], set()], handle, protocol=pickle.HIGHEST_PROTOCOL)
-with open(f"{feature_name}/cache.pkl", "rb") as handle:
-    summary_list, config_list, name_list, envs, exp_names, ids = pickle.load(handle)
-
-# Change oreilly-class/cifar to <entity/project-name>
-runs = api.runs(args.wandb_project)
-data = []
-for idx, run in enumerate(runs):
-    if run.id not in ids:
-        ids.add(run.id)
-        if args.feature_of_interest in run.summary:
-            metrics_dataframe = run.history(keys=[args.feature_of_interest, "global_step"], samples=args.samples)
-            exp_name = run.config["exp_name"]
-            for param in args.hyper_params_tuned:
-                if param in run.config:
-                    exp_name += "-" + param + "-" + str(run.config[param]) + "-"
-
-            metrics_dataframe.insert(len(metrics_dataframe.columns), "algo", exp_name)
-            exp_names += [exp_name]
-            metrics_dataframe.insert(len(metrics_dataframe.columns), "seed", run.config["seed"])
-
-            data += [metrics_dataframe]
-            if run.config["env_id"] not in envs:
-                envs[run.config["env_id"]] = [metrics_dataframe]
-                envs[run.config["env_id"] + "total_timesteps"] = run.config["total_timesteps"]
-            else:
-                envs[run.config["env_id"]] += [metrics_dataframe]
-
-            # run.summary are the output key/values like accuracy.  We call ._json_dict to omit large files
-            summary_list.append(run.summary._json_dict)
-
-            # run.config is the input metrics.  We remove special values that start with _.
-            config_list.append({k: v for k, v in run.config.items() if not k.startswith("_")})
-
-            # run.name is the name of the run.
-            name_list.append(run.name)
-
-
-summary_df = pd.DataFrame.from_records(summary_list)
-config_df = pd.DataFrame.from_records(config_list)
-name_df = pd.DataFrame({"name": name_list})
-all_df = pd.concat([name_df, config_df, summary_df], axis=1)
-# data = pd.concat(data, ignore_index=True)
-with open(f"{feature_name}/cache.pkl", "wb") as handle:
-    pickle.dump([summary_list, config_list, name_list, envs, exp_names, ids], handle, protocol=pickle.HIGHEST_PROTOCOL)
+runs, histories = fetch_runs(
+    api, args.wandb_project, args.feature_of_interest, feature_name, args.samples, args.hyper_params_tuned, env_dict
+)
+exp_names = list(runs["algo"])
 print("data loaded")
 
 # https://stackoverflow.com/questions/42281844/what-is-the-mathematics-behind-the-smoothing-parameter-in-tensorboards-scalar#_=_
@@ -126,39 +82,9 @@ def smooth(scalars, weight):  # Weight between 0 and 1
     return smoothed
 
 
-# smoothing
-for env in envs:
-    if not env.endswith("total_timesteps"):
-        for idx, metrics_dataframe in enumerate(envs[env]):
-            envs[env][idx] = metrics_dataframe.dropna(subset=[args.feature_of_interest])
-#             envs[env][idx][args.feature_of_interest] = smooth(metrics_dataframe[args.feature_of_interest], 0.85)
-
 sns.set(style="darkgrid")
 
 
-def get_df_for_env(env_id):
-    env_total_timesteps = envs[env_id + "total_timesteps"]
-    env_increment = env_total_timesteps / 500
-    envs_same_x_axis = []
-    for sampled_run in envs[env_id]:
-        df = pd.DataFrame(columns=sampled_run.columns)
-        x_axis = [i * env_increment for i in range(500 - 2)]
-        current_row = 0
-        for timestep in x_axis:
-            while sampled_run.iloc[current_row]["global_step"] < timestep:
-                current_row += 1
-                if current_row > len(sampled_run) - 2:
-                    break
-            if current_row > len(sampled_run) - 2:
-                break
-            temp_row = sampled_run.iloc[current_row].copy()
-            temp_row["global_step"] = timestep
-            df = df.append(temp_row)
-
-        envs_same_x_axis += [df]
-    return pd.concat(envs_same_x_axis, ignore_index=True)
-
-
 def export_legend(ax, filename="legend.pdf"):
     try:
         # import matplotlib as mpl
@@ -188,8 +114,6 @@ def export_legend(ax, filename="legend.pdf"):
         print(f"export legend failed: {filename}")
 
 
-if not os.path.exists(f"{feature_name}/data"):
-    os.makedirs(f"{feature_name}/data")
 if not os.path.exists(f"{feature_name}/plots"):
     os.makedirs(f"{feature_name}/plots")
 if not os.path.exists(f"{feature_name}/legends"):
@@ -214,23 +138,18 @@ if args.font_size:
 
 stats = {item: [] for item in ["env_id", "exp_name", args.feature_of_interest]}
 # uncommenet the following to generate all figures
-for env in set(all_df["env_id"]):
-    if not path.exists(f"{feature_name}/data/{env}.pkl"):
-        with open(f"{feature_name}/data/{env}.pkl", "wb") as handle:
-            data = get_df_for_env(env)
-            data["seed"] = data["seed"].astype(float)
-            data[args.feature_of_interest] = data[args.feature_of_interest].astype(float)
-            pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
-    else:
-        with open(f"{feature_name}/data/{env}.pkl", "rb") as handle:
-            data = pickle.load(handle)
-            print(f"{env}'s data loaded")
+for env in set(runs["env_id"]):
+    data = get_df_for_env(runs, histories, env, args.num_points_x_axis)
+    data["seed"] = data["seed"].astype(float)
+    data[args.feature_of_interest] = data[args.feature_of_interest].astype(float)
 
-    def _smooth(df):
-        df[args.feature_of_interest] = smooth(list(df[args.feature_of_interest]), args.smooth_weight)
-        return df
+    def _smooth(scalars):
+        return smooth(list(scalars), args.smooth_weight)
 
-    plot_data = data.groupby(["seed", "algo"]).apply(_smooth).loc[data["algo"].isin(interested_exp_names)]
+    smoothed_data = data.copy()
+    smoothed_data[args.feature_of_interest] = data.groupby(["seed", "algo"])[args.feature_of_interest].transform(_smooth)
+
+    plot_data = smoothed_data.loc[data["algo"].isin(interested_exp_names)]
     ax = sns.lineplot(
         data=plot_data,
         x="global_step",
@@ -250,7 +169,7 @@ for env in set(all_df["env_id"]):
 
     # export legend
     legend_df = pd.DataFrame()
-    legend_df = legend_df.append(plot_data)
+    legend_df = pd.concat([legend_df, plot_data])
     legend_df = legend_df.reset_index()
     ax = sns.lineplot(
         data=legend_df,
@@ -270,8 +189,8 @@ for env in set(all_df["env_id"]):
         last_n_episodes_global_step = sorted(algo_data["global_step"].unique())[-args.last_n_episodes]
         last_n_episodes_features = (
             algo_data[algo_data["global_step"] > last_n_episodes_global_step]
-            .groupby(["seed"])
-            .mean()[args.feature_of_interest]
+            .groupby(["seed"])[args.feature_of_interest]
+            .mean()
         )
 
         for item in last_n_episodes_features:
@@ -286,4 +205,9 @@ for env in set(all_df["env_id"]):
 # analysis
 stats_df = pd.DataFrame(stats)
 g = stats_df.groupby(["env_id", "exp_name"]).agg(lambda x: f"{np.mean(x):.2f} ± {np.std(x):.2f}")
-print(g.reset_index().pivot("exp_name", "env_id", args.feature_of_interest).to_latex().replace("±", r"$\pm$"))
+print(
+    g.reset_index()
+    .pivot(index="exp_name", columns="env_id", values=args.feature_of_interest)
+    .to_latex()
+    .replace("±", r"$\pm$")
+)
@@ -0,0 +1,139 @@
+"""
+Data of the plot scripts: run histories fetched from wandb, cached in a columnar store, and resampled onto a shared x-axis.
+
+The cache of a feature is two parquet files (which need `pyarrow`) keyed by run id: `runs.parquet`
+has one row per run seen in the project, and `histories.parquet` has the logged points of the runs
+that have the feature. Later calls only fetch the runs that are not in the cache yet, and the runs that
+were not finished when they were cached. `settings.json` records the fetch settings that change what is
+cached (`samples`, `hyper_params_tuned` and `env_dict`); the whole cache is fetched again when they change.
+"""
+import json
+import os
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+RUNS_FILE = "runs.parquet"
+HISTORIES_FILE = "histories.parquet"
+SETTINGS_FILE = "settings.json"
+
+
+def fetch_runs(
+    api,
+    wandb_project: str,
+    feature_of_interest: str,
+    cache_dir: str,
+    samples: int = 500,
+    hyper_params_tuned: Sequence[str] = (),
+    env_dict: Dict[str, str] = {},
+):
+    """
+    :param api: a `wandb.Api()`
+    :param cache_dir: the directory of the cache of `feature_of_interest`
+    :param samples: the number of points of the history of each run to fetch
+    :param hyper_params_tuned: config entries appended to the `exp_name` of the runs, as `-{param}-{value}-`
+    :param env_dict: env ids renamed to another env id, whose runs get the `shaped` suffix
+    :return: the runs that have the feature (`run_id`, `name`, `env_id`, `algo`, `seed`, `total_timesteps`)
+        and their histories (`run_id`, `global_step` and `feature_of_interest`)
+    """
+    runs_path, histories_path = os.path.join(cache_dir, RUNS_FILE), os.path.join(cache_dir, HISTORIES_FILE)
+    settings_path = os.path.join(cache_dir, SETTINGS_FILE)
+    settings = dict(samples=samples, hyper_params_tuned=list(hyper_params_tuned), env_dict=dict(env_dict))
+    runs, histories = [], []
+    if os.path.exists(runs_path) and os.path.exists(settings_path):
+        with open(settings_path) as f:
+            cached_settings = json.load(f)
+        if cached_settings == settings:
+            runs, histories = [pd.read_parquet(runs_path)], [pd.read_parquet(histories_path)]
+            # the runs that were still running (or crashed) when they were cached are fetched again
+            finished = runs[0]["run_id"][runs[0]["state"] == "finished"]
+            runs[0] = runs[0][runs[0]["run_id"].isin(finished)]
+            histories[0] = histories[0][histories[0]["run_id"].isin(finished)]
+    known_ids = set(runs[0]["run_id"]) if runs else set()
+
+    new_runs = []
+    for run in api.runs(wandb_project):
+        if run.id in known_ids:
+            continue
+        # runs without the feature are recorded too, so they are not fetched again
+        record = dict(run_id=run.id, name=run.name, state=run.state, has_history=feature_of_interest in run.summary)
+        if record["has_history"]:
+            exp_name = run.config["exp_name"]
+            for param in hyper_params_tuned:
+                if param in run.config:
+                    exp_name += "-" + param + "-" + str(run.config[param]) + "-"
+            env_id = run.config["env_id"]
+            # hacks
+            if env_id in env_dict:
+                exp_name += "shaped"
+                env_id = env_dict[env_id]
+            record.update(env_id=env_id, algo=exp_name, seed=run.config["seed"], total_timesteps=run.config["total_timesteps"])
+            history = run.history(keys=[feature_of_interest, "global_step"], samples=samples)
+            history = history[["global_step", feature_of_interest]].dropna()
+            history.insert(0, "run_id", run.id)
+            histories += [history]
+        new_runs += [record]
+
+    if new_runs:
+        runs += [pd.DataFrame.from_records(new_runs)]
+    runs = pd.concat(runs, ignore_index=True) if runs else pd.DataFrame(columns=["run_id", "name", "state", "has_history"])
+    if histories:
+        histories = pd.concat(histories, ignore_index=True)
+    else:
+        histories = pd.DataFrame(columns=["run_id", "global_step", feature_of_interest])
+    if new_runs:
+        os.makedirs(cache_dir, exist_ok=True)
+        runs.to_parquet(runs_path)
+        histories.to_parquet(histories_path)
+        with open(settings_path, "w") as f:
+            json.dump(settings, f)
+    runs = runs[runs["has_history"].astype(bool)].drop(columns=["state", "has_history"]).reset_index(drop=True)
+    return runs, histories
+
+
+def resample_runs(histories: pd.DataFrame, total_timesteps: float, num_points: int = 500) -> pd.DataFrame:
+    """
+    Resample the histories of several runs onto `num_points - 2` evenly spaced steps in `[0, total_timesteps)`.
+
+    Each step takes the first logged point of the run at or after it, excluding the last logged point of
+    the run; steps after that have no point. The runs are matched in one `pd.merge_asof`.
+
+    :param histories: the logged points of the runs, with `run_id` and `global_step` columns
+    :return: the resampled points, with the columns of `histories` and `global_step` set to the sampled steps
+    """
+    columns = list(histories.columns)
+    x_axis = np.arange(num_points - 2) * (total_timesteps / num_points)
+    run_ids = histories["run_id"].unique()
+    # the runs keep the order in which they appear in `histories`
+    histories = histories.assign(
+        global_step=histories["global_step"].astype(np.float64),
+        run_index=histories["run_id"].map(dict(zip(run_ids, range(len(run_ids))))),
+    )
+    histories = histories.sort_values(["run_index", "global_step"], kind="stable")
+    points = histories[histories.duplicated("run_index", keep="last")].sort_values("global_step", kind="stable")
+    steps = pd.DataFrame({"run_index": np.repeat(np.arange(len(run_ids)), len(x_axis)), "step": np.tile(x_axis, len(run_ids))})
+    resampled = pd.merge_asof(
+        steps.sort_values("step", kind="stable"),
+        points,
+        left_on="step",
+        right_on="global_step",
+        by="run_index",
+        direction="forward",
+    )
+    resampled = resampled.dropna(subset=["global_step"])
+    resampled["global_step"] = resampled["step"]
+    resampled = resampled.sort_values(["run_index", "global_step"], kind="stable")
+    return resampled[columns].reset_index(drop=True)
+
+
+def get_df_for_env(runs: pd.DataFrame, histories: pd.DataFrame, env_id: str, num_points: int = 500) -> pd.DataFrame:
+    """
+    :return: the resampled histories of the runs of `env_id` (see `resample_runs`) with their `algo` and `seed`,
+        on the x-axis of the `total_timesteps` of the first run of `env_id`
+    """
+    env_runs = runs[runs["env_id"] == env_id]
+    data = resample_runs(
+        histories[histories["run_id"].isin(env_runs["run_id"])], env_runs["total_timesteps"].iloc[0], num_points
+    )
+    return data.merge(env_runs[["run_id", "algo", "seed"]], on="run_id")
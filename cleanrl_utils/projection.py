@@ -0,0 +1,31 @@
+import torch
+
+
+def categorical_projection(next_atoms: torch.Tensor, next_pmfs: torch.Tensor, atoms: torch.Tensor) -> torch.Tensor:
+    """
+    Project the target distribution of C51 (https://arxiv.org/abs/1707.06887) back onto the support `atoms`.
+
+    The probability mass of each shifted atom is split between its two neighbouring atoms.
+    All the rows of the batch are projected at once with a single `scatter_add_`
+    instead of two `index_add_` calls per row.
+
+    :param next_atoms: (batch_size, n_atoms) shifted atoms, e.g. `rewards + gamma * atoms * (1 - dones)`
+    :param next_pmfs: (batch_size, n_atoms) probabilities of the shifted atoms
+    :param atoms: (n_atoms,) evenly spaced support of the distribution
+    :return: (batch_size, n_atoms) projected probabilities
+    """
+    n_atoms = atoms.shape[0]
+    v_min, v_max = atoms[0], atoms[-1]
+    delta_z = atoms[1] - atoms[0]
+    tz = next_atoms.clamp(v_min, v_max)
+
+    b = (tz - v_min) / delta_z
+    l = b.floor().clamp(0, n_atoms - 1)
+    u = b.ceil().clamp(0, n_atoms - 1)
+    # (l == u).float() handles the case where bj is exactly an integer
+    # example bj = 1, then the upper ceiling should be uj= 2, and lj= 1
+    d_m_l = (u + (l == u).float() - b) * next_pmfs
+    d_m_u = (b - l) * next_pmfs
+    target_pmfs = torch.zeros_like(next_pmfs)
+    target_pmfs.scatter_add_(1, torch.cat([l, u], dim=1).long(), torch.cat([d_m_l, d_m_u], dim=1))
+    return target_pmfs
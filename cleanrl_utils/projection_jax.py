@@ -0,0 +1,32 @@
+import jax.numpy as jnp
+
+
+def categorical_projection(next_atoms: jnp.ndarray, next_pmfs: jnp.ndarray, atoms: jnp.ndarray) -> jnp.ndarray:
+    """
+    Project the target distribution of C51 (https://arxiv.org/abs/1707.06887) back onto the support `atoms`.
+
+    The probability mass of each shifted atom is split between its two neighbouring atoms.
+    All the rows of the batch are projected at once with a single scatter-add
+    instead of a `jax.lax.fori_loop` over the rows.
+
+    :param next_atoms: (batch_size, n_atoms) shifted atoms, e.g. `rewards + gamma * atoms * (1 - dones)`
+    :param next_pmfs: (batch_size, n_atoms) probabilities of the shifted atoms
+    :param atoms: (n_atoms,) evenly spaced support of the distribution
+    :return: (batch_size, n_atoms) projected probabilities
+    """
+    n_atoms = atoms.shape[0]
+    v_min, v_max = atoms[0], atoms[-1]
+    delta_z = atoms[1] - atoms[0]
+    tz = jnp.clip(next_atoms, v_min, v_max)
+
+    b = (tz - v_min) / delta_z
+    l = jnp.clip(jnp.floor(b), 0, n_atoms - 1)
+    u = jnp.clip(jnp.ceil(b), 0, n_atoms - 1)
+    # (l == u).astype(jnp.float) handles the case where bj is exactly an integer
+    # example bj = 1, then the upper ceiling should be uj= 2, and lj= 1
+    d_m_l = (u + (l == u).astype(jnp.float32) - b) * next_pmfs
+    d_m_u = (b - l) * next_pmfs
+    target_pmfs = jnp.zeros_like(next_pmfs)
+    rows = jnp.arange(next_pmfs.shape[0])[:, None]
+    indices = jnp.concatenate([l, u], axis=1).astype(jnp.int32)
+    return target_pmfs.at[rows, indices].add(jnp.concatenate([d_m_l, d_m_u], axis=1))
@@ -0,0 +1,161 @@
+"""
+Per-phase timing and profiler traces of the training loop.
+
+`charts/SPS` averages the throughput over the whole run, which hides where the time goes. A
+`PhaseTimer` accumulates the time spent in each `with timer("env_step"):` block and `write` logs
+the mean milliseconds per block as `perf/env_step_ms` (etc.) and the SPS since the last `write` as
+`perf/SPS`. A phase that spans a long block can be timed with `timer.start("update")` and
+`timer.stop("update")` instead, without re-indenting the block. When it is disabled, `timer(phase)`
+returns a shared no-op context, so the instrumentation can stay in the scripts at the cost of one
+attribute lookup per block.
+
+A `Profiler` captures a `torch.profiler` or `jax.profiler` trace of a window of updates, which can
+be opened in the profile tab of tensorboard.
+"""
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "start_time")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        if self.timer.synchronize is not None:
+            self.timer.synchronize()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timer.synchronize is not None:
+            self.timer.synchronize()
+        self.timer.totals[self.name] += time.perf_counter() - self.start_time
+        self.timer.counts[self.name] += 1
+        return False
+
+
+class PhaseTimer:
+    """
+    :param enabled: if False, `timer(phase)` is a no-op and `write` logs nothing
+    :param synchronize: called before reading the clock, e.g. `torch.cuda.synchronize`, so that the
+        asynchronous device work is charged to the phase that launched it
+    """
+
+    def __init__(self, enabled: bool = True, synchronize: Optional[Callable[[], None]] = None) -> None:
+        self.enabled = enabled
+        self.synchronize = synchronize
+        self.phases = {}
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.window_start_time = time.perf_counter()
+        self.window_start_step = 0
+
+    def __call__(self, name: str):
+        if not self.enabled:
+            return _NULL_PHASE
+        if name not in self.phases:
+            self.phases[name] = _Phase(self, name)
+        return self.phases[name]
+
+    def start(self, name: str) -> None:
+        """Start timing the phase `name`, like entering `with timer(name):`."""
+        if self.enabled:
+            self(name).__enter__()
+
+    def stop(self, name: str) -> None:
+        """Stop timing the phase `name` started by `start`."""
+        if self.enabled:
+            self(name).__exit__(None, None, None)
+
+    def write(self, writer, global_step: int) -> None:
+        """Log the mean time of each phase and the SPS since the last call as `perf/*` scalars, then reset them."""
+        if not self.enabled:
+            return
+        for name, total in self.totals.items():
+            writer.add_scalar(f"perf/{name}_ms", 1000 * total / self.counts[name], global_step)
+        now = time.perf_counter()
+        writer.add_scalar("perf/SPS", (global_step - self.window_start_step) / (now - self.window_start_time), global_step)
+        self.totals.clear()
+        self.counts.clear()
+        self.window_start_time = now
+        self.window_start_step = global_step
+
+
+class Profiler:
+    """
+    Trace the updates `start` to `start + num_updates - 1`, counting one update per call of `step`.
+
+    :param backend: `torch` or `jax`
+    :param log_dir: the directory the trace is written to, e.g. `runs/{run_name}/profile`
+    :param start: the update at which the trace starts (the first update is 1)
+    :param num_updates: the number of updates to trace
+    :param enabled: if False, `step` and `close` do nothing
+    """
+
+    def __init__(self, backend: str, log_dir: str, start: int, num_updates: int, enabled: bool = True) -> None:
+        assert backend in ["torch", "jax"], f"unknown profiler backend {backend}"
+        self.backend = backend
+        self.log_dir = log_dir
+        self.start = start
+        self.num_updates = num_updates
+        self.enabled = enabled
+        self.update = 0
+        self.profile = None
+        self.active = False
+
+    def step(self) -> None:
+        """Mark the start of a new update."""
+        if not self.enabled:
+            return
+        self.update += 1
+        if self.update == self.start:
+            self._start_trace()
+        elif self.update == self.start + self.num_updates:
+            self.close()
+
+    def _start_trace(self) -> None:
+        if self.backend == "torch":
+            import torch
+
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities += [torch.profiler.ProfilerActivity.CUDA]
+            self.profile = torch.profiler.profile(
+                activities=activities,
+                record_shapes=True,
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.log_dir),
+            )
+            self.profile.start()
+        else:
+            import jax
+
+            jax.profiler.start_trace(self.log_dir)
+        self.active = True
+
+    def close(self) -> None:
+        """Stop the trace if it is running, e.g. because the run ended inside the window."""
+        if not self.active:
+            return
+        if self.backend == "torch":
+            self.profile.stop()
+        else:
+            import jax
+
+            jax.profiler.stop_trace()
+        self.active = False
+        print(f"saved the profiler trace to {self.log_dir}")
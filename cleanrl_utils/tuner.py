@@ -1,24 +1,99 @@
 import os
-import runpy
+import shlex
+import subprocess
 import sys
+import tempfile
+import threading
 import time
+from collections import deque
 from typing import Callable, Dict, List, Optional
 
 import numpy as np
 import optuna
 import wandb
 from rich import print
-from tensorboard.backend.event_processing import event_accumulator
 
+from cleanrl_utils.fork_server import ForkServer, tail_log
+from cleanrl_utils.metrics_stream import (
+    METRICS_FD_ENV,
+    WRITE_EVENT_FILES_ENV,
+    parse_metric,
+)
 
-class HiddenPrints:
-    def __enter__(self):
-        self._original_stdout = sys.stdout
-        sys.stdout = open(os.devnull, "w")
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.stdout.close()
-        sys.stdout = self._original_stdout
+class Experiment:
+    """
+    A run of the tuned script with one seed on one environment, in its own subprocess.
+
+    The script runs under `cleanrl_utils.metrics_stream`, which streams the scalars it logs through a
+    pipe. A reader thread keeps the last `metric_last_n_average_window` values of `metric` while the
+    script trains, so the tuner neither waits for the run to finish nor parses its event file.
+    With a `fork_server`, the script runs in a fork of it instead of a new interpreter, and its output
+    is read from a log file.
+    """
+
+    def __init__(
+        self,
+        script: str,
+        args: List[str],
+        metric: str,
+        metric_last_n_average_window: int,
+        env: Dict[str, str],
+        write_event_files: bool = True,
+        fork_server: Optional[ForkServer] = None,
+    ) -> None:
+        self.command = [sys.executable, "-m", "cleanrl_utils.metrics_stream", script] + args
+        self.metric = metric
+        self.global_step = 0
+        self.metric_values = deque(maxlen=metric_last_n_average_window)
+        self.output = deque(maxlen=20)
+        metrics_fd, write_fd = os.pipe()
+        env = dict(env, **{METRICS_FD_ENV: str(write_fd), WRITE_EVENT_FILES_ENV: str(int(write_event_files))})
+        self.log = None
+        if fork_server is None:
+            self.process = subprocess.Popen(
+                self.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env, pass_fds=(write_fd,)
+            )
+            output = self.process.stdout
+        else:
+            self.log = tempfile.NamedTemporaryFile("r")
+            self.process = fork_server.start(shlex.join([script] + args), self.log.name, env, metrics_fd=write_fd)
+            output = tail_log(self.log, self.running)
+        os.close(write_fd)
+        self.readers = [
+            threading.Thread(target=self._read_output, args=(output,), daemon=True),
+            threading.Thread(target=self._read_metrics, args=(metrics_fd,), daemon=True),
+        ]
+        for reader in self.readers:
+            reader.start()
+
+    def _read_output(self, output) -> None:
+        for line in output:
+            self.output.append(line)
+
+    def _read_metrics(self, metrics_fd: int) -> None:
+        with os.fdopen(metrics_fd) as metrics:
+            for line in metrics:
+                tag, step, value = parse_metric(line)
+                if tag == self.metric:
+                    self.global_step = step if step is not None else self.global_step
+                    self.metric_values.append(value)
+
+    def running(self) -> bool:
+        return self.process.poll() is None
+
+    def wait(self) -> None:
+        self.process.wait()
+        for reader in self.readers:
+            reader.join()
+        if self.log is not None:
+            self.log.close()
+        if self.process.returncode != 0:
+            raise subprocess.CalledProcessError(self.process.returncode, self.command, output="".join(self.output))
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
 
 
 class Tuner:
@@ -36,6 +111,12 @@ class Tuner:
         storage: str = "sqlite:///cleanrl_hpopt.db",
         study_name: str = "",
         wandb_kwargs: Dict[str, any] = {},
+        num_trials_in_parallel: int = 1,
+        num_experiments_in_parallel: int = 1,
+        num_threads_per_experiment: Optional[int] = None,
+        pruning_report_frequency: int = 10000,
+        write_event_files: bool = True,
+        fork_server: bool = False,
     ) -> None:
         self.script = script
         self.metric = metric
@@ -67,6 +148,24 @@ class Tuner:
         if len(self.study_name) == 0:
             self.study_name = f"tuner_{int(time.time())}"
         self.wandb_kwargs = wandb_kwargs
+        if len(self.wandb_kwargs.keys()) > 0 and num_trials_in_parallel > 1:
+            # the concurrent trials run in threads of this process, where `wandb.init(reinit=True)` finishes the
+            # run of the other trials
+            raise ValueError("`wandb_kwargs` cannot be used with `num_trials_in_parallel > 1`")
+        self.num_trials_in_parallel = num_trials_in_parallel
+        self.num_experiments_in_parallel = num_experiments_in_parallel
+        self.experiment_env = dict(os.environ)
+        if num_threads_per_experiment is not None:
+            for var in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+                self.experiment_env[var] = str(num_threads_per_experiment)
+        self.pruning_report_frequency = pruning_report_frequency
+        self.write_event_files = write_event_files
+        self.fork_server = ForkServer() if fork_server else None
+
+    def normalize_score(self, env_id: str, score: float) -> float:
+        if self.target_scores[env_id] is not None:
+            return (score - self.target_scores[env_id][0]) / (self.target_scores[env_id][1] - self.target_scores[env_id][0])
+        return score
 
     def tune(self, num_trials: int, num_seeds: int) -> None:
         def objective(trial: optuna.Trial):
@@ -83,43 +182,66 @@ class Tuner:
                 )
 
             algo_command = [f"--{key}={value}" for key, value in params.items()]
+            exp_name = f"{self.study_name}_{trial.number}"
+            pending = [(seed, env_id) for seed in range(num_seeds) for env_id in self.target_scores.keys()]
+            experiments = {}
+            reported_step = 0
+            try:
+                while pending or any(experiment.running() for experiment in experiments.values()):
+                    while pending and sum(e.running() for e in experiments.values()) < self.num_experiments_in_parallel:
+                        seed, env_id = pending.pop(0)
+                        experiments[(seed, env_id)] = Experiment(
+                            self.script,
+                            algo_command + [f"--env-id={env_id}", f"--seed={seed}", f"--exp-name={exp_name}", "--track=False"],
+                            self.metric,
+                            self.metric_last_n_average_window,
+                            self.experiment_env,
+                            self.write_event_files,
+                            self.fork_server,
+                        )
+                    time.sleep(1)
+                    for experiment in experiments.values():
+                        if not experiment.running():
+                            experiment.wait()
+
+                    # report the normalized score of the streamed metric so far every
+                    # `pruning_report_frequency` steps summed over the experiments of the trial
+                    step = sum(experiment.global_step for experiment in experiments.values())
+                    step -= step % self.pruning_report_frequency
+                    intermediate_scores = [
+                        self.normalize_score(env_id, np.average(e.metric_values))
+                        for (_, env_id), e in experiments.items()
+                        if len(e.metric_values) > 0
+                    ]
+                    if step > reported_step and len(intermediate_scores) > 0:
+                        reported_step = step
+                        trial.report(np.average(intermediate_scores), step=step)
+                        if trial.should_prune():
+                            if run:
+                                run.finish(quiet=True)
+                            raise optuna.TrialPruned()
+            finally:
+                for experiment in experiments.values():
+                    if experiment.running():
+                        experiment.kill()
+
             normalized_scoress = []
             for seed in range(num_seeds):
                 normalized_scores = []
                 for env_id in self.target_scores.keys():
-                    sys.argv = algo_command + [f"--env-id={env_id}", f"--seed={seed}", "--track=False"]
-                    with HiddenPrints():
-                        experiment = runpy.run_path(path_name=self.script, run_name="__main__")
-
-                    # read metric from tensorboard
-                    ea = event_accumulator.EventAccumulator(f"runs/{experiment['run_name']}")
-                    ea.Reload()
-                    metric_values = [
-                        scalar_event.value for scalar_event in ea.Scalars(self.metric)[-self.metric_last_n_average_window :]
-                    ]
+                    metric_values = experiments[(seed, env_id)].metric_values
                     print(
                         f"The average episodic return on {env_id} is {np.average(metric_values)} averaged over the last {self.metric_last_n_average_window} episodes."
                     )
-                    if self.target_scores[env_id] is not None:
-                        normalized_scores += [
-                            (np.average(metric_values) - self.target_scores[env_id][0])
-                            / (self.target_scores[env_id][1] - self.target_scores[env_id][0])
-                        ]
-                    else:
-                        normalized_scores += [np.average(metric_values)]
+                    normalized_scores += [self.normalize_score(env_id, np.average(metric_values))]
                     if run:
                         run.log({f"{env_id}_return": np.average(metric_values)})
 
                 normalized_scoress += [normalized_scores]
                 aggregated_normalized_score = self.aggregation_fn(normalized_scores)
                 print(f"The {self.aggregation_type} normalized score is {aggregated_normalized_score} with num_seeds={seed}")
-                trial.report(aggregated_normalized_score, step=seed)
                 if run:
                     run.log({"aggregated_normalized_score": aggregated_normalized_score})
-                if trial.should_prune():
-                    if run:
-                        run.finish(quiet=True)
-                    raise optuna.TrialPruned()
 
             if run:
                 run.finish(quiet=True)
@@ -138,9 +260,11 @@ class Tuner:
         print("run another tuner with the following command:")
         print(f"python -m cleanrl_utils.tuner --study-name {self.study_name}")
         print("==========================================================================================")
+        # the trials only wait on their experiments' subprocesses, so threads are enough to run them concurrently
         study.optimize(
             objective,
             n_trials=num_trials,
+            n_jobs=self.num_trials_in_parallel,
         )
         print(f"The best trial obtains a normalized score of {study.best_trial.value}", study.best_trial.params)
         return study.best_trial
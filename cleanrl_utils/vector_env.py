@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+import gym
+import gymnasium
+import numpy as np
+from gym.vector.utils import concatenate
+
+ENV_BACKENDS = ["sync", "async", "thread"]
+
+
+class ThreadVectorEnv(gym.vector.SyncVectorEnv):
+    """
+    Vectorized environment that steps the sub-environments concurrently in a thread pool.
+
+    The sub-environments live in the learner process like in `gym.vector.SyncVectorEnv`, so nothing
+    is pickled, but the emulators and the numpy/OpenCV preprocessing wrappers release the GIL for
+    most of a step and can therefore overlap on several cores.
+
+    :param env_fns: functions that create the environments
+    :param num_workers: the number of threads; defaults to one per sub-environment
+    """
+
+    def __init__(self, env_fns, observation_space=None, action_space=None, copy=True, num_workers=None):
+        super().__init__(env_fns, observation_space=observation_space, action_space=action_space, copy=copy)
+        self.executor = ThreadPoolExecutor(max_workers=num_workers or self.num_envs)
+
+    def _step_env(self, i, action):
+        env = self.envs[i]
+        observation, self._rewards[i], self._dones[i], info = env.step(action)
+        if self._dones[i]:
+            info["terminal_observation"] = observation
+            observation = env.reset()
+        return observation, info
+
+    def step_wait(self):
+        observations, infos = zip(*self.executor.map(self._step_env, range(self.num_envs), self._actions))
+        self.observations = concatenate(self.single_observation_space, observations, self.observations)
+        return (
+            deepcopy(self.observations) if self.copy else self.observations,
+            np.copy(self._rewards),
+            np.copy(self._dones),
+            list(infos),
+        )
+
+    def close_extras(self, **kwargs):
+        self.executor.shutdown()
+        super().close_extras(**kwargs)
+
+
+class GymnasiumThreadVectorEnv(gymnasium.vector.SyncVectorEnv):
+    """
+    `ThreadVectorEnv` for environments of the gymnasium API, e.g. those of `ppo_continuous_action.py`.
+
+    :param env_fns: functions that create the environments
+    :param num_workers: the number of threads; defaults to one per sub-environment
+    """
+
+    def __init__(self, env_fns, observation_space=None, action_space=None, copy=True, num_workers=None):
+        super().__init__(env_fns, observation_space=observation_space, action_space=action_space, copy=copy)
+        self.executor = ThreadPoolExecutor(max_workers=num_workers or self.num_envs)
+
+    def _step_env(self, i, action):
+        env = self.envs[i]
+        observation, self._rewards[i], self._terminateds[i], self._truncateds[i], info = env.step(action)
+        if self._terminateds[i] or self._truncateds[i]:
+            old_observation, old_info = observation, info
+            observation, info = env.reset()
+            info["final_observation"] = old_observation
+            info["final_info"] = old_info
+        return observation, info
+
+    def step_wait(self):
+        observations, env_infos = zip(*self.executor.map(self._step_env, range(self.num_envs), self._actions))
+        infos = {}
+        for i, info in enumerate(env_infos):
+            infos = self._add_info(infos, info, i)
+        self.observations = gymnasium.vector.utils.concatenate(self.single_observation_space, observations, self.observations)
+        return (
+            deepcopy(self.observations) if self.copy else self.observations,
+            np.copy(self._rewards),
+            np.copy(self._terminateds),
+            np.copy(self._truncateds),
+            infos,
+        )
+
+    def close_extras(self, **kwargs):
+        self.executor.shutdown()
+        super().close_extras(**kwargs)
+
+
+def make_vector_env(env_fns, backend="sync", vector=gym.vector):
+    """
+    Build the vector environment used by the PPO scripts.
+
+    :param env_fns: functions that create the environments
+    :param backend: `sync` steps the environments one after the other in the learner process,
+        `async` runs one subprocess per environment that writes its observations in place into a
+        shared-memory buffer (so observations are never pickled), and `thread` steps the environments
+        concurrently in a thread pool (see `ThreadVectorEnv`)
+    :param vector: the `vector` module of the API of the environments, `gym.vector` or `gymnasium.vector`
+    :return: the vector environment
+    """
+    if backend == "sync":
+        return vector.SyncVectorEnv(env_fns)
+    if backend == "async":
+        return vector.AsyncVectorEnv(env_fns, shared_memory=True)
+    if backend == "thread":
+        return ThreadVectorEnv(env_fns) if vector is gym.vector else GymnasiumThreadVectorEnv(env_fns)
+    raise ValueError(f"unknown env backend {backend!r}, expected one of {ENV_BACKENDS}")
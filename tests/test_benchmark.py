@@ -0,0 +1,66 @@
+import json
+import os
+import queue
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from cleanrl_utils.benchmark import failed_commands, make_slots, run_worker
+
+
+def make_args(**kwargs):
+    args = dict(workers=4, threads_per_job=0, memory_per_job=0, gpus=[], jobs_per_gpu=1, max_retries=1, ledger="")
+    return SimpleNamespace(**dict(args, **kwargs))
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    # 8 cores and 16 GB of memory
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(os, "sysconf", lambda name: {"SC_PAGE_SIZE": 4096, "SC_PHYS_PAGES": 16 * 2**30 // 4096}[name])
+
+
+def test_make_slots(machine):
+    slots = make_slots(make_args())
+    assert [cores for cores, _ in slots] == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    assert all(env["OMP_NUM_THREADS"] == "2" for _, env in slots)
+
+    # capped by the cores
+    slots = make_slots(make_args(threads_per_job=3))
+    assert [cores for cores, _ in slots] == [[0, 1, 2], [3, 4, 5]]
+    assert all(env["OMP_NUM_THREADS"] == "3" for _, env in slots)
+
+    # capped by the memory
+    assert len(make_slots(make_args(threads_per_job=1, memory_per_job=5))) == 3
+
+    # capped by the GPUs
+    slots = make_slots(make_args(threads_per_job=1, gpus=["0", "1"], jobs_per_gpu=1))
+    assert [env["CUDA_VISIBLE_DEVICES"] for _, env in slots] == ["0", "1"]
+    slots = make_slots(make_args(workers=8, threads_per_job=1, gpus=["0", "1"], jobs_per_gpu=3))
+    assert [env["CUDA_VISIBLE_DEVICES"] for _, env in slots] == ["0", "0", "0", "1", "1", "1"]
+    cores = [core for slot_cores, _ in slots for core in slot_cores]
+    assert len(cores) == len(set(cores))
+
+
+def test_run_worker_requeues_failed_experiments(tmp_path):
+    args = make_args(max_retries=2, ledger=str(tmp_path / "ledger.json"))
+    fail = f"{sys.executable} -c 'import sys; sys.exit(3)'"
+    succeed = f"{sys.executable} -c 'print(\"SPS: 100\")'"
+    jobs = queue.Queue()
+    for command in [fail, succeed]:
+        jobs.put(dict(command=command, attempt=0))
+    ledger = []
+    run_worker((None, dict(os.environ)), jobs, ledger, threading.Lock(), args)
+
+    assert [(entry["command"], entry["attempt"], entry["return_code"]) for entry in ledger] == [
+        (fail, 0, 3),
+        (succeed, 0, 0),
+        (fail, 1, 3),
+        (fail, 2, 3),
+    ]
+    assert ledger[1]["sps"] == 100
+    with open(args.ledger) as f:
+        assert json.load(f) == ledger
+    assert failed_commands(ledger, args.max_retries) == [fail]
@@ -0,0 +1,237 @@
+import gc
+import os
+import tempfile
+
+import numpy as np
+import pytest
+from gym import spaces
+
+from cleanrl_utils.buffers import (
+    FrameStackReplayBuffer,
+    MinSegmentTree,
+    PrefetchReplayBuffer,
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+    SumSegmentTree,
+)
+
+
+def test_segment_tree_reduce():
+    rng = np.random.default_rng(1)
+    capacity = 64
+    values = rng.uniform(0.1, 2.0, size=capacity)
+    sum_tree, min_tree = SumSegmentTree(capacity), MinSegmentTree(capacity)
+    sum_tree[np.arange(capacity)] = values
+    min_tree[np.arange(capacity)] = values
+
+    assert np.isclose(sum_tree.sum(), values.sum())
+    assert min_tree.min() == values.min()
+    for start, end in [(0, 1), (3, 17), (5, 64), (31, 33), (0, -1), (10, 10)]:
+        expected = values[start:end]
+        assert np.isclose(sum_tree.sum(start, end), expected.sum())
+        assert min_tree.min(start, end) == (expected.min() if len(expected) else float("inf"))
+
+    starts = rng.integers(0, capacity, size=100)
+    ends = starts + rng.integers(0, capacity - starts + 1)
+    expected_sums = np.array([values[s:e].sum() for s, e in zip(starts, ends)])
+    expected_mins = np.array([values[s:e].min() if e > s else float("inf") for s, e in zip(starts, ends)])
+    assert np.allclose(sum_tree.sum(starts, ends), expected_sums)
+    assert np.array_equal(min_tree.min(starts, ends), expected_mins)
+
+
+def test_segment_tree_setitem():
+    rng = np.random.default_rng(2)
+    capacity = 32
+    values = np.zeros(capacity)
+    sum_tree, min_tree = SumSegmentTree(capacity), MinSegmentTree(capacity)
+    sum_tree[np.arange(capacity)] = values
+    min_tree[np.arange(capacity)] = values
+    for _ in range(20):
+        # unsorted and possibly repeated indices
+        idx = rng.integers(0, capacity, size=7)
+        val = rng.uniform(0.0, 1.0, size=7)
+        values[idx] = val
+        sum_tree[idx] = val
+        min_tree[idx] = val
+        assert np.isclose(sum_tree.sum(), values.sum())
+        assert min_tree.min() == values.min()
+        assert np.array_equal(sum_tree[np.arange(capacity)], values)
+    sum_tree[3] = 5.0
+    values[3] = 5.0
+    assert np.isclose(sum_tree.sum(), values.sum())
+
+
+def test_find_prefixsum_idx():
+    rng = np.random.default_rng(3)
+    capacity = 128
+    values = rng.uniform(0.0, 1.0, size=capacity)
+    values[rng.integers(0, capacity, size=10)] = 0.0
+    sum_tree = SumSegmentTree(capacity)
+    sum_tree[np.arange(capacity)] = values
+
+    prefixsum = rng.uniform(0.0, values.sum(), size=1000)
+    expected = np.searchsorted(np.cumsum(values), prefixsum, side="right")
+    assert np.array_equal(sum_tree.find_prefixsum_idx(prefixsum), expected)
+    assert sum_tree.find_prefixsum_idx(0.0)[0] == np.argmax(values > 0)
+
+
+def _frame_stack_trajectory(rng, num_steps, frame_stack=4, frame_shape=(6, 6)):
+    """Emulates `FrameStack` on a random-frame env with resets and truncations."""
+    new_frame = lambda: rng.integers(0, 256, size=frame_shape, dtype=np.uint8)  # noqa: E731
+    reset = lambda: np.stack([new_frame()] * frame_stack)  # noqa: E731
+    obs = reset()
+    for _ in range(num_steps):
+        next_obs = np.concatenate([obs[1:], new_frame()[None]])
+        done = rng.random() < 0.05
+        truncated = not done and rng.random() < 0.02
+        yield obs, next_obs, rng.integers(0, 4), rng.random(), done
+        obs = reset() if done or truncated else next_obs
+
+
+def test_frame_stack_replay_buffer():
+    rng = np.random.default_rng(4)
+    observation_space = spaces.Box(0, 255, (4, 6, 6), np.uint8)
+    for frame_capacity in [None, 40]:
+        rb = FrameStackReplayBuffer(64, observation_space, spaces.Discrete(4), frame_capacity=frame_capacity)
+        transitions = []
+        for obs, next_obs, action, reward, done in _frame_stack_trajectory(rng, 300):
+            rb.add(obs[None], next_obs[None], np.array([action]), np.array([reward]), np.array([done]))
+            transitions.append((obs, next_obs, action, reward, done))
+        assert rb.frames.shape[0] == (72 if frame_capacity is None else 40)
+        assert 0 < rb.size() <= 64
+
+        batch_inds = np.arange(rb.first_valid, rb.num_transitions)
+        data = rb._get_samples(batch_inds % rb.buffer_size)
+        expected = transitions[rb.first_valid :]
+        assert np.array_equal(data.observations.numpy(), np.stack([t[0] for t in expected]))
+        assert np.array_equal(data.next_observations.numpy(), np.stack([t[1] for t in expected]))
+        assert np.array_equal(data.actions.numpy()[:, 0], [t[2] for t in expected])
+        assert np.array_equal(data.dones.numpy()[:, 0], [t[4] for t in expected])
+
+        data = rb.sample(32)
+        assert data.observations.shape == (32, 4, 6, 6)
+        assert data.next_observations.dtype == data.observations.dtype
+
+
+def test_replay_buffer_memmap_storage(tmp_path):
+    rng = np.random.default_rng(5)
+    for obs_shape in [(3,), (4, 33, 33)]:
+        observation_space = spaces.Box(0, 255, obs_shape, np.uint8)
+        rb = ReplayBuffer(50, observation_space, spaces.Discrete(2), storage="memmap", storage_dir=str(tmp_path))
+        # a second buffer in the same directory must not overwrite the files of the first
+        other_rb = ReplayBuffer(50, observation_space, spaces.Discrete(2), storage="memmap", storage_dir=str(tmp_path))
+        rb_memory = ReplayBuffer(50, observation_space, spaces.Discrete(2))
+        for _ in range(70):
+            obs, next_obs = rng.integers(0, 256, size=(2, 1) + obs_shape, dtype=np.uint8)
+            for buffer in [rb, rb_memory]:
+                buffer.add(obs, next_obs, np.array([1]), np.array([1.0]), np.array([False]))
+            other_rb.add(next_obs, obs, np.array([0]), np.array([0.0]), np.array([True]))
+        assert len(list(tmp_path.iterdir())) == 2
+        assert len(os.listdir(rb.storage_dir)) == 2
+        other_rb.close()
+
+        batch_inds = rng.integers(0, 50, size=16)
+        data, expected = rb._get_samples(batch_inds), rb_memory._get_samples(batch_inds)
+        assert np.array_equal(data.observations.numpy(), expected.observations.numpy())
+        assert np.array_equal(data.next_observations.numpy(), expected.next_observations.numpy())
+        assert rb.storage_stats()["num_reads"] == 2
+        assert rb_memory.storage_stats() == {}
+        rb.close()
+        assert len(list(tmp_path.iterdir())) == 0
+
+    rb = ReplayBuffer(10, spaces.Box(0, 255, (3,), np.uint8), spaces.Discrete(2), storage="memmap")
+    assert os.path.dirname(rb.storage_dir) == tempfile.gettempdir()
+    rb.close()
+
+    # the files are deleted with the buffer even if `close` is never called
+    rb = ReplayBuffer(10, spaces.Box(0, 255, (3,), np.uint8), spaces.Discrete(2), storage="memmap", storage_dir=str(tmp_path))
+    del rb
+    gc.collect()
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_prefetch_replay_buffer():
+    rb = PrefetchReplayBuffer(ReplayBuffer(100, spaces.Box(-1, 1, (3,), np.float32), spaces.Discrete(2)), batch_size=8)
+    for step in range(150):
+        obs = np.full((1, 3), step, dtype=np.float32)
+        rb.add(obs, obs + 1, np.array([step % 2]), np.array([1.0]), np.array([False]))
+        if step >= 10:
+            data = rb.sample(8)
+            assert data.observations.shape == (8, 3)
+            # next_observations stay aligned with observations despite the concurrent adds
+            assert (data.next_observations == data.observations + 1).all()
+            assert (data.actions[:, 0] == data.observations[:, 0].long() % 2).all()
+    assert rb.size() == 100
+    stats = rb.stats()
+    assert stats["num_batches"] == 140
+    assert 0 <= stats["queue_depth"] <= 2
+    rb.close()
+
+
+def test_prefetch_replay_buffer_seed_and_error():
+    batches = []
+    for _ in range(2):
+        rb = ReplayBuffer(100, spaces.Box(-1, 1, (3,), np.float32), spaces.Discrete(2))
+        for step in range(100):
+            obs = np.full((1, 3), step, dtype=np.float32)
+            rb.add(obs, obs + 1, np.array([step % 2]), np.array([1.0]), np.array([False]))
+        rb = PrefetchReplayBuffer(rb, batch_size=8, seed=1)
+        global_state = np.random.get_state()[1].copy()
+        batches += [rb.sample().observations]
+        rb.close()
+        # the worker does not consume the global random state
+        assert (np.random.get_state()[1] == global_state).all()
+    assert (batches[0] == batches[1]).all()
+
+    # sampling an empty buffer fails in the worker, every later call raises the error again
+    rb = PrefetchReplayBuffer(ReplayBuffer(100, spaces.Box(-1, 1, (3,), np.float32), spaces.Discrete(2)), batch_size=8)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            rb.sample()
+    rb.close()
+
+    # as with the stable-baselines3 buffer, time-outs are stored as non-terminal transitions
+    rb = PrefetchReplayBuffer(
+        ReplayBuffer(100, spaces.Box(-1, 1, (3,), np.float32), spaces.Discrete(2)),
+        batch_size=8,
+        handle_timeout_termination=True,
+    )
+    obs = np.zeros((1, 3), dtype=np.float32)
+    rb.add(obs, obs, np.array([0]), np.array([1.0]), np.array([True]), [{"TimeLimit.truncated": True}])
+    rb.add(obs, obs, np.array([0]), np.array([1.0]), np.array([True]), [{}])
+    assert (rb.dones[:2, 0] == [0.0, 1.0]).all()
+    rb.close()
+
+
+def test_replay_buffers_multi_env():
+    n_envs = 3
+    observation_space, action_space = spaces.Box(-1, 1, (2,), np.float32), spaces.Discrete(5)
+    buffers = [
+        ReplayBuffer(20, observation_space, action_space, n_envs=n_envs),
+        ReplayBuffer(20, observation_space, action_space, n_envs=n_envs, optimize_memory_usage=True),
+        PrioritizedReplayBuffer(20, 0.6, observation_space, action_space, n_envs=n_envs),
+    ]
+    obs = np.zeros((n_envs, 2), dtype=np.float32)
+    for step in range(30):
+        # encode (step, env) in the observation
+        obs[:, 0], obs[:, 1] = step, np.arange(n_envs)
+        next_obs = obs.copy()
+        next_obs[:, 0] += 1
+        for rb in buffers:
+            rb.add(obs, next_obs, np.arange(n_envs) + 1, np.arange(n_envs) * 0.5, np.zeros(n_envs))
+
+    for rb in buffers:
+        data = rb.sample(256, beta=0.4) if isinstance(rb, PrioritizedReplayBuffer) else rb.sample(256)
+        assert data.observations.shape == (256, 2)
+        assert data.dones.shape == data.rewards.shape == (256, 1)
+        envs = data.observations[:, 1].long()
+        assert set(envs.tolist()) == set(range(n_envs))
+        assert (data.next_observations[:, 0] == data.observations[:, 0] + 1).all()
+        assert (data.next_observations[:, 1] == data.observations[:, 1]).all()
+        assert (data.actions[:, 0] == envs + 1).all()
+        assert (data.rewards[:, 0] == envs * 0.5).all()
+
+    rb = buffers[2]
+    data = rb.sample(64, beta=0.4)
+    rb.update_weights(data.indices, np.full(64, 3.0))
+    assert rb._it_sum.sum() > 20 * n_envs
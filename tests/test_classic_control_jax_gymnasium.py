@@ -9,6 +9,14 @@ def test_dqn_jax():
     )
 
 
+def test_dqn_jax_updates_per_dispatch():
+    subprocess.run(
+        "python cleanrl/dqn_jax.py --learning-starts 200 --total-timesteps 245 --updates-per-dispatch 4",
+        shell=True,
+        check=True,
+    )
+
+
 def test_c51_jax():
     subprocess.run(
         "python cleanrl/c51_jax.py --learning-starts 200 --total-timesteps 205",
@@ -17,6 +25,14 @@ def test_c51_jax():
     )
 
 
+def test_c51_jax_updates_per_dispatch():
+    subprocess.run(
+        "python cleanrl/c51_jax.py --learning-starts 200 --total-timesteps 245 --updates-per-dispatch 4",
+        shell=True,
+        check=True,
+    )
+
+
 def test_c51_jax_eval():
     subprocess.run(
         "python cleanrl/c51_jax.py --save-model True --learning-starts 200 --total-timesteps 205",
@@ -39,3 +39,11 @@ def test_ppo_atari_envpool_xla_jax_scan_eval():
         shell=True,
         check=True,
     )
+
+
+def test_ppo_atari_envpool_xla_jax_scan_multi_device():
+    subprocess.run(
+        "XLA_FLAGS=--xla_force_host_platform_device_count=2 JAX_PLATFORMS=cpu python cleanrl/ppo_atari_envpool_xla_jax_scan.py --num-devices 2 --num-envs 8 --num-steps 6 --update-epochs 1 --num-minibatches 1 --total-timesteps 256",
+        shell=True,
+        check=True,
+    )
@@ -0,0 +1,65 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+import torch
+
+from cleanrl_utils.evals.dqn_eval import evaluate
+
+
+class FixedLengthEnv(gym.Env):
+    """Gives a reward of 1 per step and ends every episode after `episode_length` steps."""
+
+    observation_space = gym.spaces.Box(-1.0, 1.0, (2,), np.float32)
+    action_space = gym.spaces.Discrete(2)
+
+    def __init__(self, episode_length):
+        self.episode_length = episode_length
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        self.t = 0
+        return np.zeros(2, dtype=np.float32), {}
+
+    def step(self, action):
+        self.t += 1
+        return np.zeros(2, dtype=np.float32), 1.0, self.t == self.episode_length, False, {}
+
+
+def make_env(env_id, seed, idx, capture_video, run_name):
+    def thunk():
+        # the first env finishes its episodes much faster than the others
+        env = FixedLengthEnv(1 if idx == 0 else 20)
+        env = gym.wrappers.RecordEpisodeStatistics(env)
+        env.action_space.seed(seed)
+        return env
+
+    return thunk
+
+
+class QNetwork(torch.nn.Module):
+    def __init__(self, envs):
+        super().__init__()
+        self.network = torch.nn.Linear(2, envs.single_action_space.n)
+
+    def forward(self, x):
+        return self.network(x)
+
+
+@pytest.mark.parametrize("num_envs,async_envs", [(1, False), (4, False), (4, True)])
+def test_dqn_eval_num_envs(tmp_path, num_envs, async_envs):
+    envs = gym.vector.SyncVectorEnv([make_env("", 0, 0, False, "")])
+    model_path = str(tmp_path / "q_network.pth")
+    torch.save(QNetwork(envs).state_dict(), model_path)
+    episodic_returns = evaluate(
+        model_path,
+        make_env,
+        "",
+        eval_episodes=8,
+        run_name="eval",
+        Model=QNetwork,
+        capture_video=False,
+        num_envs=num_envs,
+        async_envs=async_envs,
+    )
+    # the short episodes of the first env make up only its share of the returns
+    assert sorted(np.array(episodic_returns).flatten().tolist()) == [1.0] * (8 // num_envs) + [20.0] * (8 - 8 // num_envs)
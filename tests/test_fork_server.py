@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from cleanrl_utils.fork_server import ForkServer, split_command, tail_log
+from cleanrl_utils.metrics_stream import (
+    CREATED_AT_TAG,
+    WRITE_EVENT_FILES_ENV,
+    parse_metric,
+)
+
+
+def test_split_command():
+    assert split_command("poetry run python cleanrl/ppo.py --seed 1") == ("cleanrl/ppo.py", ["--seed", "1"])
+    with pytest.raises(ValueError):
+        split_command("poetry run python -m cleanrl_utils.benchmark")
+
+
+def test_fork_server_isolates_experiments(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(
+        "import os, random, sys\n"
+        "print(sys.argv[1:], os.environ['EXPERIMENT'], random.random())\n"
+        "sys.exit(int(sys.argv[1]))\n"
+    )
+    fork_server = ForkServer(preload=["numpy"])
+    outputs = []
+    for i in range(2):
+        log_path = str(tmp_path / f"{i}.log")
+        exitcode, _ = fork_server.run(f"python {script} {i}", log_path, env=dict(os.environ, EXPERIMENT=f"e{i}"))
+        assert exitcode == i
+        with open(log_path) as f:
+            outputs += [f.read().split()]
+    assert outputs[0][:2] == ["['0']", "e0"]
+    assert outputs[1][:2] == ["['1']", "e1"]
+    # the forks do not share the state of the python random number generator
+    assert outputs[0][2] != outputs[1][2]
+
+
+def test_fork_server_streams_metrics_and_log(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(
+        "import time\n"
+        "from torch.utils.tensorboard import SummaryWriter\n"
+        "writer = SummaryWriter('runs/test')\n"
+        "for step in range(3):\n"
+        "    writer.add_scalar('charts/episodic_return', step, step)\n"
+        "    print('step', step, flush=True)\n"
+        "    time.sleep(0.2)\n"
+        "writer.close()\n"
+    )
+    fork_server = ForkServer(preload=["numpy"])
+    metrics_fd, write_fd = os.pipe()
+    log_path = str(tmp_path / "script.log")
+    env = dict(os.environ, **{WRITE_EVENT_FILES_ENV: "0"})
+    with open(log_path, "w+") as log:
+        forked_run = fork_server.start(f"python {script}", log_path, env, metrics_fd=write_fd)
+        os.close(write_fd)
+        lines = list(tail_log(log, lambda: forked_run.poll() is None, interval=0.01))
+    assert forked_run.wait() == 0
+    assert lines == ["step 0\n", "step 1\n", "step 2\n"]
+    with os.fdopen(metrics_fd) as metrics:
+        metrics = [parse_metric(line) for line in metrics]
+    assert metrics[0][0] == CREATED_AT_TAG
+    assert metrics[1:] == [("charts/episodic_return", step, float(step)) for step in range(3)]
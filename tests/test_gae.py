@@ -0,0 +1,60 @@
+import numpy as np
+import torch
+
+from cleanrl_utils.gae import compute_gae
+
+
+def compute_gae_python_loop(rewards, values, dones, next_value, next_done, num_steps, gamma, gae_lambda, episodic=True):
+    # the loop previously copied into the PPO scripts
+    advantages = torch.zeros_like(rewards)
+    lastgaelam = 0
+    for t in reversed(range(num_steps)):
+        if t == num_steps - 1:
+            nextnonterminal = 1.0 - next_done if episodic else 1.0
+            nextvalues = next_value
+        else:
+            nextnonterminal = 1.0 - dones[t + 1] if episodic else 1.0
+            nextvalues = values[t + 1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        advantages[t] = lastgaelam = delta + gamma * gae_lambda * nextnonterminal * lastgaelam
+    return advantages, advantages + values
+
+
+def make_rollout(num_steps, num_envs, seed):
+    generator = torch.Generator().manual_seed(seed)
+    rewards = torch.rand((num_steps, num_envs), generator=generator) * 2 - 1
+    values = torch.rand((num_steps, num_envs), generator=generator)
+    dones = torch.randint(0, 2, (num_steps, num_envs), generator=generator).float()
+    next_value = torch.rand((1, num_envs), generator=generator)
+    next_done = torch.randint(0, 2, (num_envs,), generator=generator).float()
+    return rewards, values, dones, next_value, next_done
+
+
+def test_compute_gae():
+    num_steps, num_envs, gamma, gae_lambda = 123, 7, 0.99, 0.95
+    rollout = make_rollout(num_steps, num_envs, seed=42)
+    expected_advantages, expected_returns = compute_gae_python_loop(*rollout, num_steps, gamma, gae_lambda)
+
+    advantages, returns = compute_gae(*rollout, gamma, gae_lambda)
+    assert advantages.shape == (num_steps, num_envs)
+    assert torch.allclose(advantages, expected_advantages, atol=1e-5)
+    assert torch.allclose(returns, expected_returns, atol=1e-5)
+
+    advantages, returns = compute_gae(*[x.numpy() for x in rollout], gamma, gae_lambda)
+    assert isinstance(advantages, np.ndarray) and advantages.dtype == np.float32
+    np.testing.assert_allclose(advantages, expected_advantages.numpy(), atol=1e-5)
+    np.testing.assert_allclose(returns, expected_returns.numpy(), atol=1e-5)
+
+
+def test_compute_gae_non_episodic():
+    # the intrinsic reward stream of `ppo_rnd_envpool.py` ignores the done flags
+    num_steps, num_envs, int_gamma, gae_lambda = 128, 4, 0.99, 0.95
+    rewards, values, dones, next_value, next_done = make_rollout(num_steps, num_envs, seed=0)
+    expected_advantages, expected_returns = compute_gae_python_loop(
+        rewards, values, dones, next_value, next_done, num_steps, int_gamma, gae_lambda, episodic=False
+    )
+    advantages, returns = compute_gae(
+        rewards, values, torch.zeros_like(dones), next_value, torch.zeros_like(next_done), int_gamma, gae_lambda
+    )
+    assert torch.allclose(advantages, expected_advantages, atol=1e-5)
+    assert torch.allclose(returns, expected_returns, atol=1e-5)
@@ -0,0 +1,61 @@
+from functools import partial
+
+import gymnasium as gym
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from cleanrl_utils.buffers_jax import DeviceReplayBuffer, ReplayBufferState
+
+
+def test_replay_buffer_state():
+    buffer_size, n_envs, batch_size = 16, 2, 64
+    observation_space = gym.spaces.Box(-np.inf, np.inf, (3,), np.float32)
+    action_space = gym.spaces.Discrete(4)
+
+    def env_step(carry, step):
+        rb, key = carry
+        # encode (step, env) in the observations, the action and the reward
+        obs = jnp.stack([jnp.full((n_envs,), step, jnp.float32), jnp.arange(n_envs, dtype=jnp.float32)], axis=1)
+        obs = jnp.concatenate([obs, jnp.zeros((n_envs, 1))], axis=1)
+        next_obs = obs.at[:, 0].add(1)
+        rb = rb.add(obs, next_obs, step % 4 + jnp.zeros(n_envs, jnp.int32), obs[:, 1] + step, jnp.zeros(n_envs))
+        key, sample_key = jax.random.split(key)
+        data = rb.sample(sample_key, batch_size)
+        return (rb, key), data
+
+    for optimize_memory_usage in [False, True]:
+        rb = ReplayBufferState.create(
+            buffer_size, observation_space, action_space, n_envs=n_envs, optimize_memory_usage=optimize_memory_usage
+        )
+        run = jax.jit(partial(jax.lax.scan, env_step), donate_argnums=(0,))
+        (rb, _), data = run((rb, jax.random.PRNGKey(0)), jnp.arange(40))
+
+        assert int(rb.size()) == buffer_size and bool(rb.full)
+        assert data.observations.shape == (40, batch_size, 3)
+        assert data.rewards.shape == data.dones.shape == (40, batch_size)
+        steps, envs = data.observations[..., 0], data.observations[..., 1]
+        # only transitions added so far are sampled, and they are consistent
+        assert (steps <= jnp.arange(40)[:, None]).all()
+        assert (steps > jnp.arange(40)[:, None] - buffer_size).all()
+        assert (data.next_observations[..., 0] == steps + 1).all()
+        assert (data.next_observations[..., 1] == envs).all()
+        assert (data.actions == steps % 4).all()
+        assert (data.rewards == steps + envs).all()
+        assert set(np.unique(envs).tolist()) == {0, 1}
+
+
+def test_device_replay_buffer():
+    observation_space = gym.spaces.Box(-np.inf, np.inf, (3,), np.float32)
+    rb = DeviceReplayBuffer(8, observation_space, gym.spaces.Discrete(4))
+    for step in range(10):
+        obs = np.full((1, 3), step, dtype=np.float32)
+        # the gymnasium `infos` dict is ignored, as with `handle_timeout_termination=False`
+        rb.add(obs, obs + 1, np.array([step % 4]), np.array([1.0]), np.array([step == 9]), {})
+    assert rb.size() == 8
+    data = jax.jit(ReplayBufferState.sample, static_argnums=(2,))(rb.state, jax.random.PRNGKey(0), 32)
+    steps = data.observations[:, 0]
+    assert (steps >= 2).all()
+    assert (data.next_observations[:, 0] == steps + 1).all()
+    assert (data.actions == steps % 4).all()
+    assert (data.dones == (steps == 9)).all()
@@ -0,0 +1,41 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from cleanrl_utils.projection_jax import categorical_projection
+
+
+def test_categorical_projection():
+    batch_size, n_atoms, v_min, v_max, gamma = 64, 51, -10.0, 10.0, 0.99
+    key = jax.random.PRNGKey(0)
+    key, *k = jax.random.split(key, 4)
+    atoms = jnp.asarray(np.linspace(v_min, v_max, num=n_atoms))
+    # include exact atom positions, clipped rewards and terminal transitions
+    rewards = jnp.concatenate([jax.random.normal(k[0], (batch_size - 4, 1)) * 5, jnp.array([[0.0], [1.0], [50.0], [-50.0]])])
+    dones = (jax.random.uniform(k[1], (batch_size, 1)) < 0.2).astype(jnp.float32)
+    next_pmfs = jax.nn.softmax(jax.random.normal(k[2], (batch_size, n_atoms)), axis=1)
+    next_atoms = rewards + gamma * atoms * (1 - dones)
+
+    @jax.jit
+    def project_loop(next_atoms, next_pmfs):
+        # the `fori_loop` previously used in c51_jax.py / c51_atari_jax.py
+        delta_z = atoms[1] - atoms[0]
+        tz = jnp.clip(next_atoms, v_min, v_max)
+        b = (tz - v_min) / delta_z
+        l = jnp.clip(jnp.floor(b), 0, n_atoms - 1)
+        u = jnp.clip(jnp.ceil(b), 0, n_atoms - 1)
+        d_m_l = (u + (l == u).astype(jnp.float32) - b) * next_pmfs
+        d_m_u = (b - l) * next_pmfs
+        target_pmfs = jnp.zeros_like(next_pmfs)
+
+        def project_to_bins(i, val):
+            val = val.at[i, l[i].astype(jnp.int32)].add(d_m_l[i])
+            val = val.at[i, u[i].astype(jnp.int32)].add(d_m_u[i])
+            return val
+
+        return jax.lax.fori_loop(0, target_pmfs.shape[0], project_to_bins, target_pmfs)
+
+    expected = project_loop(next_atoms, next_pmfs)
+    target_pmfs = jax.jit(categorical_projection)(next_atoms, next_pmfs, atoms)
+    assert jnp.allclose(target_pmfs, expected, atol=1e-7)
+    assert jnp.allclose(target_pmfs.sum(1), 1.0, atol=1e-5)
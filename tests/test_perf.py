@@ -0,0 +1,44 @@
+import gym
+import gymnasium
+
+import cleanrl_utils.atari_stub  # noqa: F401 registers AtariStub-v0
+from cleanrl_utils.perf import CASES, find_regressions, run_suite
+
+
+def test_find_regressions():
+    baseline = {"ppo": {"sps": 1000.0, "startup_time": 2.0, "peak_rss_mb": 800.0, "wall_time": 10.0}}
+    results = {
+        "ppo": {"sps": 850.0, "startup_time": 2.1, "peak_rss_mb": 1000.0, "wall_time": 20.0},
+        "dqn": {"sps": 10.0},
+    }
+    assert find_regressions(results, baseline, threshold=0.1) == [
+        ("ppo", "sps", 1000.0, 850.0),
+        ("ppo", "peak_rss_mb", 800.0, 1000.0),
+    ]
+    assert find_regressions(results, baseline, threshold=0.5) == []
+
+
+def test_run_suite_continues_after_failure(monkeypatch):
+    monkeypatch.setitem(CASES, "missing-script", ["cleanrl/missing_script.py"])
+    monkeypatch.setitem(CASES, "bad-argument", ["cleanrl/ppo.py", "--no-such-argument"])
+    results, failures = run_suite(["missing-script", "bad-argument"])
+    assert results == {}
+    assert list(failures) == ["missing-script", "bad-argument"]
+
+
+def test_atari_stub():
+    env = gym.make("AtariStub-v0")
+    obs = env.reset()
+    assert obs.shape == (210, 160, 3)
+    lives = env.unwrapped.ale.lives()
+    for _ in range(200):
+        obs, _, done, _ = env.step(env.action_space.sample())
+    assert env.unwrapped.ale.lives() == lives - 1
+    assert env.unwrapped.get_action_meanings()[1] == "FIRE"
+
+    env = gymnasium.make("AtariStub-v0")
+    obs, _ = env.reset(seed=1)
+    assert env.observation_space.contains(obs)
+    for _ in range(1000):
+        _, _, terminated, truncated, _ = env.step(env.action_space.sample())
+    assert terminated and not truncated
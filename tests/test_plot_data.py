@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from cleanrl_utils.plot_data import fetch_runs, get_df_for_env, resample_runs
+
+
+def resample_run_loop(sampled_run, total_timesteps, num_points):
+    # the row-by-row loop previously in `get_df_for_env` of the plot scripts
+    rows = []
+    x_axis = [i * total_timesteps / num_points for i in range(num_points - 2)]
+    current_row = 0
+    for timestep in x_axis:
+        while sampled_run.iloc[current_row]["global_step"] < timestep:
+            current_row += 1
+            if current_row > len(sampled_run) - 2:
+                break
+        if current_row > len(sampled_run) - 2:
+            break
+        temp_row = sampled_run.iloc[current_row].copy()
+        temp_row["global_step"] = timestep
+        rows += [temp_row]
+    return pd.DataFrame(rows, columns=sampled_run.columns)
+
+
+def make_histories(num_runs, seed=0):
+    rng = np.random.default_rng(seed)
+    histories = []
+    for i in range(num_runs):
+        # irregular logging with repeated steps, stopping at different points of the run
+        global_step = np.sort(rng.integers(0, rng.integers(2000, 12000), size=rng.integers(1, 80)))
+        histories += [
+            pd.DataFrame(
+                {"run_id": f"run{i}", "global_step": global_step, "charts/episodic_return": rng.normal(size=len(global_step))}
+            )
+        ]
+    return histories
+
+
+def test_resample_runs_matches_loop():
+    histories = make_histories(20)
+    expected = pd.concat([resample_run_loop(history, 10000, 50) for history in histories], ignore_index=True)
+    resampled = resample_runs(pd.concat(histories, ignore_index=True), 10000, 50)
+    assert list(resampled.columns) == ["run_id", "global_step", "charts/episodic_return"]
+    np.testing.assert_array_equal(resampled["run_id"], expected["run_id"])
+    np.testing.assert_allclose(resampled["global_step"], expected["global_step"].astype(float))
+    np.testing.assert_allclose(resampled["charts/episodic_return"], expected["charts/episodic_return"].astype(float))
+
+
+class FakeRun:
+    def __init__(self, run_id, env_id, has_feature=True, state="finished"):
+        self.id = run_id
+        self.name = run_id
+        self.state = state
+        self.summary = {"charts/episodic_return": 1.0} if has_feature else {}
+        self.config = {"exp_name": "ppo", "env_id": env_id, "seed": 1, "total_timesteps": 1000, "learning_rate": 0.1}
+        self.history_calls = 0
+
+    def history(self, keys, samples):
+        self.history_calls += 1
+        return pd.DataFrame({"global_step": np.arange(0, 1000, 10), "charts/episodic_return": np.arange(100.0), "_step": 0})
+
+
+def test_fetch_runs_is_incremental(tmp_path):
+    project = [FakeRun("a", "CartPole-v1"), FakeRun("b", "CartPole-v1", has_feature=False)]
+    api = SimpleNamespace(runs=lambda wandb_project: project)
+    runs, histories = fetch_runs(
+        api, "cleanrl/test", "charts/episodic_return", str(tmp_path), hyper_params_tuned=["learning_rate"]
+    )
+    assert list(runs["run_id"]) == ["a"]
+    assert runs["algo"][0] == "ppo-learning_rate-0.1-"
+    assert len(histories) == 100
+
+    project += [FakeRun("c", "Acrobot-v1"), FakeRun("d", "Acrobot-v1", state="running")]
+    runs, histories = fetch_runs(
+        api, "cleanrl/test", "charts/episodic_return", str(tmp_path), hyper_params_tuned=["learning_rate"]
+    )
+    assert [run.history_calls for run in project] == [1, 0, 1, 1]
+    assert list(runs["run_id"]) == ["a", "c", "d"]
+    assert list(histories.columns) == ["run_id", "global_step", "charts/episodic_return"]
+    assert len(histories) == 300
+
+    # the run that was still running is fetched again, and only its latest history is kept
+    project[3].state = "finished"
+    runs, histories = fetch_runs(
+        api, "cleanrl/test", "charts/episodic_return", str(tmp_path), hyper_params_tuned=["learning_rate"]
+    )
+    assert [run.history_calls for run in project] == [1, 0, 1, 2]
+    assert sorted(runs["run_id"]) == ["a", "c", "d"]
+    assert len(histories) == 300
+
+    # the fetch settings are part of the cache key
+    runs, histories = fetch_runs(api, "cleanrl/test", "charts/episodic_return", str(tmp_path))
+    assert [run.history_calls for run in project] == [2, 0, 2, 3]
+    assert list(runs["algo"].unique()) == ["ppo"]
+    runs, histories = fetch_runs(api, "cleanrl/test", "charts/episodic_return", str(tmp_path))
+    assert [run.history_calls for run in project] == [2, 0, 2, 3]
+
+    data = get_df_for_env(runs, histories, "Acrobot-v1", num_points=100)
+    assert set(data["run_id"]) == {"c", "d"}
+    assert list(data["algo"].unique()) == ["ppo"] and list(data["seed"].unique()) == [1]
+    assert len(data) == 2 * 98
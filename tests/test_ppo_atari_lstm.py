@@ -0,0 +1,62 @@
+import gym
+import torch
+
+from cleanrl.ppo_atari_lstm import Agent
+
+
+class Envs:
+    single_action_space = gym.spaces.Discrete(4)
+
+
+def get_states_loop(agent, x, lstm_state, done):
+    # the per-timestep loop previously used in `Agent.get_states`
+    hidden = agent.network(x / 255.0)
+    batch_size = lstm_state[0].shape[1]
+    hidden = hidden.reshape((-1, batch_size, agent.lstm.input_size))
+    done = done.reshape((-1, batch_size))
+    new_hidden = []
+    for h, d in zip(hidden, done):
+        h, lstm_state = agent.lstm(
+            h.unsqueeze(0),
+            (
+                (1.0 - d).view(1, -1, 1) * lstm_state[0],
+                (1.0 - d).view(1, -1, 1) * lstm_state[1],
+            ),
+        )
+        new_hidden += [h]
+    new_hidden = torch.flatten(torch.cat(new_hidden), 0, 1)
+    return new_hidden, lstm_state
+
+
+def test_get_states_packed():
+    torch.manual_seed(0)
+    agent = Agent(Envs())
+    num_steps, num_envs = 32, 4
+    x = torch.randint(0, 256, (num_steps * num_envs, 1, 84, 84), dtype=torch.uint8)
+    lstm_state = (torch.randn(1, num_envs, 128), torch.randn(1, num_envs, 128))
+    # include a done on the first step, an env that never resets and one that resets on the last step
+    done = (torch.rand(num_steps, num_envs) < 0.1).float()
+    done[0, 1] = 1.0
+    done[:, 2] = 0.0
+    done[-1, 3] = 1.0
+    with torch.no_grad():
+        expected_hidden, expected_state = get_states_loop(agent, x, lstm_state, done.flatten())
+        hidden, state = agent.get_states(x, lstm_state, done.flatten())
+    assert hidden.shape == expected_hidden.shape
+    assert torch.allclose(hidden, expected_hidden, atol=1e-6)
+    assert torch.allclose(state[0], expected_state[0], atol=1e-6)
+    assert torch.allclose(state[1], expected_state[1], atol=1e-6)
+
+
+def test_get_states_single_step():
+    torch.manual_seed(0)
+    agent = Agent(Envs())
+    num_envs = 4
+    x = torch.randint(0, 256, (num_envs, 1, 84, 84), dtype=torch.uint8)
+    lstm_state = (torch.randn(1, num_envs, 128), torch.randn(1, num_envs, 128))
+    done = torch.tensor([0.0, 1.0, 0.0, 1.0])
+    with torch.no_grad():
+        expected_hidden, expected_state = get_states_loop(agent, x, lstm_state, done)
+        hidden, state = agent.get_states(x, lstm_state, done)
+    assert torch.equal(hidden, expected_hidden)
+    assert torch.equal(state[0], expected_state[0]) and torch.equal(state[1], expected_state[1])
@@ -0,0 +1,31 @@
+import torch
+
+from cleanrl_utils.projection import categorical_projection
+
+
+def test_categorical_projection():
+    torch.manual_seed(0)
+    batch_size, n_atoms, v_min, v_max, gamma = 64, 51, -10.0, 10.0, 0.99
+    atoms = torch.linspace(v_min, v_max, steps=n_atoms)
+    # include exact atom positions, clipped rewards and terminal transitions
+    rewards = torch.cat([torch.randn(batch_size - 4, 1) * 5, torch.tensor([[0.0], [1.0], [50.0], [-50.0]])])
+    dones = (torch.rand(batch_size, 1) < 0.2).float()
+    next_pmfs = torch.softmax(torch.randn(batch_size, n_atoms), dim=1)
+    next_atoms = rewards + gamma * atoms * (1 - dones)
+
+    # the per-row loop previously used in c51.py / c51_atari.py
+    delta_z = atoms[1] - atoms[0]
+    tz = next_atoms.clamp(v_min, v_max)
+    b = (tz - v_min) / delta_z
+    l = b.floor().clamp(0, n_atoms - 1)
+    u = b.ceil().clamp(0, n_atoms - 1)
+    d_m_l = (u + (l == u).float() - b) * next_pmfs
+    d_m_u = (b - l) * next_pmfs
+    expected = torch.zeros_like(next_pmfs)
+    for i in range(expected.size(0)):
+        expected[i].index_add_(0, l[i].long(), d_m_l[i])
+        expected[i].index_add_(0, u[i].long(), d_m_u[i])
+
+    target_pmfs = categorical_projection(next_atoms, next_pmfs, atoms)
+    assert torch.allclose(target_pmfs, expected, atol=1e-7)
+    assert torch.allclose(target_pmfs.sum(1), torch.ones(batch_size), atol=1e-5)
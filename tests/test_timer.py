@@ -0,0 +1,45 @@
+import time
+
+from cleanrl_utils.timer import PhaseTimer
+
+
+class FakeWriter:
+    def __init__(self):
+        self.scalars = {}
+
+    def add_scalar(self, tag, value, global_step):
+        self.scalars[tag] = value
+
+
+def test_phase_timer():
+    synchronized = []
+    timer = PhaseTimer(synchronize=lambda: synchronized.append(True))
+    for _ in range(2):
+        with timer("env_step"):
+            time.sleep(0.01)
+    timer.start("update")
+    time.sleep(0.03)
+    timer.stop("update")
+    writer = FakeWriter()
+    timer.write(writer, 100)
+    assert set(writer.scalars) == {"perf/env_step_ms", "perf/update_ms", "perf/SPS"}
+    assert 10 <= writer.scalars["perf/env_step_ms"] < writer.scalars["perf/update_ms"]
+    assert writer.scalars["perf/SPS"] > 0
+    assert len(synchronized) == 6
+
+    # the phases and the SPS window are reset after each write
+    writer = FakeWriter()
+    timer.write(writer, 200)
+    assert set(writer.scalars) == {"perf/SPS"}
+
+
+def test_disabled_phase_timer():
+    timer = PhaseTimer(enabled=False)
+    with timer("env_step"):
+        pass
+    assert timer("env_step") is timer("update")
+    timer.start("update")
+    timer.stop("update")
+    writer = FakeWriter()
+    timer.write(writer, 100)
+    assert writer.scalars == {}
@@ -1,6 +1,10 @@
+import os
+
 import optuna
+import pytest
 
-from cleanrl_utils.tuner import Tuner
+from cleanrl_utils.fork_server import ForkServer
+from cleanrl_utils.tuner import Experiment, Tuner
 
 
 def test_tuner():
@@ -31,3 +35,75 @@ def test_tuner():
         num_trials=1,
         num_seeds=1,
     )
+
+
+def test_tuner_parallel():
+    tuner = Tuner(
+        script="cleanrl/ppo.py",
+        metric="charts/episodic_return",
+        metric_last_n_average_window=50,
+        direction="maximize",
+        target_scores={
+            "CartPole-v1": [0, 500],
+            "Acrobot-v1": [-500, 0],
+        },
+        params_fn=lambda trial: {
+            "learning-rate": trial.suggest_loguniform("learning-rate", 0.0003, 0.003),
+            "num-steps": trial.suggest_categorical("num-steps", [1200]),
+            "total-timesteps": 2400,
+            "num-envs": 1,
+        },
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=1),
+        sampler=optuna.samplers.TPESampler(),
+        num_trials_in_parallel=2,
+        num_experiments_in_parallel=2,
+        num_threads_per_experiment=1,
+        pruning_report_frequency=1000,
+    )
+    tuner.tune(
+        num_trials=2,
+        num_seeds=2,
+    )
+
+
+def test_tuner_wandb_parallel_trials():
+    with pytest.raises(ValueError):
+        Tuner(
+            script="cleanrl/ppo.py",
+            metric="charts/episodic_return",
+            target_scores={"CartPole-v1": None},
+            params_fn=lambda trial: {},
+            wandb_kwargs={"project": "cleanrl"},
+            num_trials_in_parallel=2,
+        )
+
+
+@pytest.mark.parametrize("use_fork_server", [False, True])
+def test_experiment_streams_metrics(tmp_path, use_fork_server):
+    script = tmp_path / "script.py"
+    script.write_text(
+        "import sys\n"
+        "import numpy as np\n"
+        "from torch.utils.tensorboard import SummaryWriter\n"
+        "writer = SummaryWriter(sys.argv[1])\n"
+        "writer.add_text('hyperparameters', 'text')\n"
+        "for step in range(1, 5):\n"
+        "    writer.add_scalar('charts/episodic_return', step * 10, step * 8)\n"
+        "    writer.add_scalar('losses/value_loss', np.ones(1, dtype=np.float32), step * 8)\n"
+        "writer.close()\n"
+        "print('done')\n"
+    )
+    experiment = Experiment(
+        str(script),
+        [str(tmp_path / "runs")],
+        "charts/episodic_return",
+        3,
+        dict(os.environ),
+        write_event_files=False,
+        fork_server=ForkServer(preload=["numpy"]) if use_fork_server else None,
+    )
+    experiment.wait()
+    assert list(experiment.output) == ["done\n"]
+    assert experiment.global_step == 32
+    assert list(experiment.metric_values) == [20.0, 30.0, 40.0]
+    assert not (tmp_path / "runs").exists()
@@ -0,0 +1,75 @@
+import gym
+import numpy as np
+import pytest
+
+from cleanrl_utils.vector_env import ThreadVectorEnv, make_vector_env
+
+
+def make_env(seed):
+    def thunk():
+        env = gym.make("CartPole-v1")
+        env = gym.wrappers.RecordEpisodeStatistics(env)
+        env.seed(seed)
+        return env
+
+    return thunk
+
+
+@pytest.mark.parametrize("backend", ["thread", "async"])
+def test_vector_env_backends_match_sync(backend):
+    num_envs = 4
+    sync_envs = make_vector_env([make_env(i) for i in range(num_envs)], "sync")
+    envs = make_vector_env([make_env(i) for i in range(num_envs)], backend)
+    assert envs.single_observation_space == sync_envs.single_observation_space
+    np.testing.assert_array_equal(envs.reset(), sync_envs.reset())
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        actions = rng.integers(0, 2, size=num_envs)
+        obs, rewards, dones, infos = envs.step(actions)
+        sync_obs, sync_rewards, sync_dones, sync_infos = sync_envs.step(actions)
+        np.testing.assert_array_equal(obs, sync_obs)
+        np.testing.assert_array_equal(rewards, sync_rewards)
+        np.testing.assert_array_equal(dones, sync_dones)
+        assert ["episode" in info for info in infos] == ["episode" in info for info in sync_infos]
+    envs.close()
+    sync_envs.close()
+
+
+def test_thread_vector_env_num_workers():
+    envs = ThreadVectorEnv([make_env(i) for i in range(3)], num_workers=2)
+    assert envs.executor._max_workers == 2
+    obs = envs.reset()
+    assert obs.shape == (3, 4)
+    envs.close()
+
+
+def test_make_vector_env_unknown_backend():
+    with pytest.raises(ValueError):
+        make_vector_env([make_env(0)], "ray")
+
+
+@pytest.mark.parametrize("backend", ["thread", "async"])
+def test_gymnasium_vector_env_backends_match_sync(backend):
+    import gymnasium
+
+    def make_gymnasium_env():
+        return gymnasium.wrappers.RecordEpisodeStatistics(gymnasium.make("CartPole-v1"))
+
+    num_envs = 4
+    sync_envs = make_vector_env([make_gymnasium_env] * num_envs, "sync", vector=gymnasium.vector)
+    envs = make_vector_env([make_gymnasium_env] * num_envs, backend, vector=gymnasium.vector)
+    obs, _ = envs.reset(seed=0)
+    sync_obs, _ = sync_envs.reset(seed=0)
+    np.testing.assert_array_equal(obs, sync_obs)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        actions = rng.integers(0, 2, size=num_envs)
+        obs, rewards, terminated, truncated, infos = envs.step(actions)
+        sync_obs, sync_rewards, sync_terminated, sync_truncated, sync_infos = sync_envs.step(actions)
+        np.testing.assert_array_equal(obs, sync_obs)
+        np.testing.assert_array_equal(rewards, sync_rewards)
+        np.testing.assert_array_equal(terminated, sync_terminated)
+        np.testing.assert_array_equal(truncated, sync_truncated)
+        assert ("final_info" in infos) == ("final_info" in sync_infos)
+    envs.close()
+    sync_envs.close()